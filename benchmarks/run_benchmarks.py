@@ -0,0 +1,250 @@
+"""Timing and peak-memory benchmarks of the pipeline stages on synthetic Vectrino measurements
+
+Note:
+    Every stage (read_vna, read_vno, flowstat, rmspike, build_stats_summary, and the end-to-end process_vna_files) is
+    timed repeat times and then run once more with tracemalloc to measure its peak memory (NumPy and pandas report
+    their allocations to tracemalloc). Reference checks compare the fast readers and flowstat against straightforward
+    pandas/NumPy implementations. Golden checks compare the outputs of the stages against a golden file of a previous
+    run (--save-golden writes one), so that optimizations can be verified against the current implementation. The
+    results are written to a JSON file (default: benchmark-results.json) for tracking across releases.
+
+Usage:
+    python benchmarks/run_benchmarks.py --samples 1000000 --files 4 --golden golden.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from contextlib import redirect_stdout
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import numpy as np
+import pandas as pd
+import synthetic_adv
+from config import SCRIPT_DIR
+from flowstat import flowstat, stats_table
+from profile_analyst import read_vna, read_vno, build_stats_summary, get_data_info, process_vna_files
+from rmspike import rmspike
+
+
+STAGES = ["read_vna", "read_vno", "flowstat", "rmspike", "build_stats_summary", "process_vna_files"]
+# relative tolerance of golden checks (outputs of the same data on other machines or library versions)
+GOLDEN_RTOL = 1e-9
+
+
+def measure(fun, repeat=3):
+    """Time a function repeat times and measure its peak memory in one more call.
+
+    Args:
+        fun (function): function without arguments (printed messages are suppressed)
+        repeat (int): number of timed calls (default: 3)
+
+    Returns:
+        tuple (dict, object): timing and memory results, and the return value of the last call
+    """
+    times = []
+    for _ in range(repeat):
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = fun()
+            times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    with redirect_stdout(io.StringIO()):
+        fun()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"times (s)": times, "min (s)": min(times), "median (s)": float(np.median(times)),
+            "peak memory (bytes)": peak}, result
+
+
+def _stats_outputs(table):
+    return {col: float(table[col][0]) for col in table.dtype.names}
+
+
+def run_benchmarks(data_dir, n_files=3, n_samples=2 ** 16, freq=200., spike_rate=0.01, profile_type="lp",
+                   method="velocity", summary_rows=10000, repeat=3):
+    """Generate a synthetic experiment in data_dir and benchmark all stages.
+
+    Args:
+        data_dir (str): directory of the synthetic measurement files (its content is replaced)
+        n_files (int): number of measurement files (default: 3)
+        n_samples (int): number of samples per file (default: 2 ** 16)
+        freq (float): sampling frequency in Hz (default: 200)
+        spike_rate (float): fraction of spiked samples per velocity component (default: 0.01)
+        profile_type (str): lp (default) or down
+        method (str): spike detection method (default: velocity)
+        summary_rows (int): number of rows of the benchmarked stats summary (default: 10000)
+        repeat (int): number of timed calls per stage (default: 3)
+
+    Returns:
+        tuple (dict, dict, dict): benchmark results, outputs for golden checks, and reference check results per stage
+    """
+    shutil.rmtree(data_dir, ignore_errors=True)
+    print("- generating %i synthetic files with %i samples ..." % (n_files, n_samples))
+    file_names = synthetic_adv.generate_experiment(data_dir, n_files=n_files, n_samples=n_samples, freq=freq,
+                                                   spike_rate=spike_rate, profile_type=profile_type,
+                                                   file_format="both")
+    vna_file = os.path.join(data_dir, file_names[0])
+    vno_file = os.path.join(data_dir, file_names[1])
+    results, outputs, checks = {}, {}, {}
+
+    print("- benchmarking read_vna ...")
+    results["read_vna"], vna_df = measure(lambda: read_vna(vna_file), repeat)
+    reference_df = pd.read_csv(vna_file, sep=r"\s+", header=None).drop(columns=[0, 3])
+    checks["read_vna"] = bool(np.array_equal(vna_df.to_numpy(), reference_df.to_numpy()))
+    outputs["read_vna"] = {col: float(vna_df[col].sum()) for col in vna_df.columns}
+
+    print("- benchmarking read_vno ...")
+    results["read_vno"], vno_df = measure(lambda: read_vno(vno_file), repeat)
+    checks["read_vno"] = bool(np.allclose(vno_df[["u (m/s)", "v (m/s)", "w1 (m/s)", "w2 (m/s)"]].to_numpy(),
+                                          vna_df[["u (m/s)", "v (m/s)", "w1 (m/s)", "w2 (m/s)"]].to_numpy(),
+                                          rtol=0., atol=1e-12))
+    outputs["read_vno"] = {col: float(vno_df[col].sum()) for col in vno_df.columns}
+
+    print("- benchmarking flowstat ...")
+    columns = {"time": "time (s)", "u": "u (m/s)", "v": "v (m/s)", "w1": "w1 (m/s)", "w2": "w2 (m/s)"}
+    results["flowstat"], (_, vna_stats) = measure(lambda: flowstat(
+        **{arg: vna_df[col].to_numpy() for arg, col in columns.items()}, profile_type=profile_type), repeat)
+    u = vna_df["u (m/s)"].to_numpy()
+    checks["flowstat"] = bool(np.isclose(vna_stats["u STAT (m/s)"]["average"], np.nanmean(u), rtol=1e-12)
+                              and np.isclose(vna_stats["u STAT (m/s)"]["std"], np.nanstd(u), rtol=1e-12))
+    outputs["flowstat"] = _stats_outputs(stats_table(vna_stats, profile_type))
+
+    print("- benchmarking rmspike ...")
+    despike_args = dict(u_stats=vna_stats["u STAT (m/s)"], v_stats=vna_stats["v STAT (m/s)"],
+                        w_stats=vna_stats["w STAT (m/s)"], w2_stats=vna_stats["w2 STAT (m/s)"], method=method,
+                        freq=freq, profile_type=profile_type)
+    copies = [vna_df.copy() for _ in range(repeat + 1)]
+    results["rmspike"], (spike_df, despiked_df) = measure(lambda: rmspike(copies.pop(), **despike_args), repeat)
+    outputs["rmspike"] = {"%s %s" % (row, col): float(value) for row, values in spike_df.iterrows()
+                          for col, value in values.items()}
+
+    print("- benchmarking build_stats_summary ...")
+    experiment_info = get_data_info(os.path.relpath(data_dir, SCRIPT_DIR))
+    vna_names = list(experiment_info["probe positions"].index)
+    table = np.resize(stats_table(vna_stats, profile_type), summary_rows)
+    names = [vna_names[i % len(vna_names)] for i in range(summary_rows)]
+    results["build_stats_summary"], summary_df = measure(lambda: build_stats_summary(
+        names, table, experiment_info, profile_type, bulk_velocity=synthetic_adv.MEAN_VELOCITIES[0],
+        log_length=0.114), repeat)
+    outputs["build_stats_summary"] = {col: float(summary_df[col].sum()) for col in summary_df.columns}
+
+    print("- benchmarking process_vna_files ...")
+    input_file = os.path.join(data_dir, "input.xlsx")
+    synthetic_adv.write_input_file(input_file, os.path.relpath(data_dir, SCRIPT_DIR), profile_type=profile_type,
+                                   freq=freq, method=method)
+    results["process_vna_files"], _ = measure(lambda: process_vna_files(
+        input_file, use_cache=False, output_formats={"raw": "none", "spikes": "none", "despiked": "none"},
+        incremental=False), repeat)
+    summary_df = pd.read_excel(os.path.join(data_dir, "stats-despiked.xlsx"), index_col=0)
+    outputs["process_vna_files"] = {col: float(summary_df[col].sum()) for col in summary_df.columns}
+
+    rows = {"read_vna": n_samples, "read_vno": n_samples, "flowstat": n_samples, "rmspike": n_samples,
+            "build_stats_summary": summary_rows, "process_vna_files": n_samples * len(vna_names)}
+    for stage, result in results.items():
+        result["rows"] = rows[stage]
+        result["rows per s"] = rows[stage] / result["min (s)"]
+    return results, outputs, checks
+
+
+def compare_golden(outputs, golden, rtol=GOLDEN_RTOL):
+    """Compare stage outputs with golden outputs.
+
+    Returns:
+        dict: stage names as keys and lists of deviating output names as values (empty lists pass)
+    """
+    deviations = {}
+    for stage, stage_outputs in outputs.items():
+        expected = golden.get(stage, {})
+        deviations[stage] = [name for name, value in stage_outputs.items() if not (
+            name in expected and np.isclose(value, expected[name], rtol=rtol, atol=0., equal_nan=True))]
+    return deviations
+
+
+def _get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the tke-analyst pipeline on synthetic measurements.")
+    parser.add_argument("--files", type=int, default=3, help="number of measurement files (default: 3)")
+    parser.add_argument("--samples", type=int, default=2 ** 16, help="samples per file (default: 65536)")
+    parser.add_argument("--freq", type=float, default=200., help="sampling frequency in Hz (default: 200)")
+    parser.add_argument("--spike-rate", type=float, default=0.01,
+                        help="fraction of spiked samples per velocity component (default: 0.01)")
+    parser.add_argument("--profile", choices=["lp", "down"], default="lp", help="probe orientation (default: lp)")
+    parser.add_argument("--method", choices=["velocity", "acceleration", "phase-space"], default="velocity",
+                        help="spike detection method (default: velocity)")
+    parser.add_argument("--summary-rows", type=int, default=10000,
+                        help="rows of the benchmarked stats summary (default: 10000)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls per stage (default: 3)")
+    parser.add_argument("--data-dir", help="directory of the synthetic files (default: a temporary directory)")
+    parser.add_argument("--output", default="benchmark-results.json",
+                        help="results file (default: benchmark-results.json)")
+    parser.add_argument("--golden", help="golden file to check the stage outputs against")
+    parser.add_argument("--save-golden", help="write the stage outputs to this golden file")
+    args = parser.parse_args()
+
+    parameters = {"files": args.files, "samples": args.samples, "freq": args.freq, "spike rate": args.spike_rate,
+                  "profile": args.profile, "method": args.method, "summary rows": args.summary_rows,
+                  "repeat": args.repeat}
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="tke-benchmark-")
+    try:
+        results, outputs, checks = run_benchmarks(
+            data_dir, n_files=args.files, n_samples=args.samples, freq=args.freq, spike_rate=args.spike_rate,
+            profile_type=args.profile, method=args.method, summary_rows=args.summary_rows, repeat=args.repeat)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    golden = {}
+    if args.golden:
+        with open(args.golden) as f:
+            golden_file = json.load(f)
+        if golden_file["parameters"] != parameters:
+            print("WARNING: golden file parameters differ: %s" % golden_file["parameters"])
+        deviations = compare_golden(outputs, golden_file["outputs"])
+        golden = {stage: not deviating for stage, deviating in deviations.items()}
+    if args.save_golden:
+        with open(args.save_golden, "w") as f:
+            json.dump({"parameters": parameters, "outputs": outputs}, f, indent=1)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _get_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parameters": parameters,
+        "stages": {stage: dict(results[stage], **{"reference check": checks.get(stage),
+                                                  "golden check": golden.get(stage)}) for stage in STAGES},
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+
+    print("\n%-20s %12s %12s %16s %10s %10s" % ("stage", "min (s)", "median (s)", "peak mem. (MB)", "reference",
+                                              "golden"))
+    for stage in STAGES:
+        stage_report = report["stages"][stage]
+        print("%-20s %12.4f %12.4f %16.1f %10s %10s" % (
+            stage, stage_report["min (s)"], stage_report["median (s)"], stage_report["peak memory (bytes)"] / 2 ** 20,
+            {True: "passed", False: "FAILED", None: "-"}[stage_report["reference check"]],
+            {True: "passed", False: "FAILED", None: "-"}[stage_report["golden check"]]))
+    print("\n- wrote %s" % args.output)
+    if False in checks.values() or False in golden.values():
+        sys.exit(1)
@@ -0,0 +1,201 @@
+"""Generator of synthetic Vectrino measurements (*.vna and *.vno) for benchmarks
+
+Note:
+    The velocity components are red noise (white noise filtered in the frequency domain) around a mean velocity, with
+    a resolution of 0.1 mm/s like Vectrino records. Spikes of 4 to 10 standard deviations are added at random samples.
+    The files follow the fixed-width layout of Vectrino+ ASCII exports (vna) and the Nortek binary record layout
+    (vno), so that both readers can be benchmarked with the same data. The file names encode probe positions in cm,
+    such as 10_16.5_6_T1.vna, where a leading __ stands for a negative x coordinate.
+"""
+import os
+import numpy as np
+import pandas as pd
+import vno_reader
+
+
+# mean velocities (m/s) and turbulence intensities (-) of the u, v, w1, and w2 components
+MEAN_VELOCITIES = [0.25, 0.0, 0.0, 0.0]
+TURBULENCE_INTENSITIES = [0.1, 0.06, 0.05, 0.05]
+# noise amplitudes (counts) of the four beams (velocity header of vno files)
+NOISE_COUNTS = [11, 11, 11, 12]
+
+VNA_FORMAT = "%5d%10.3f%9d %08d" + "%9.4f" * 4 + "%6d" * 4 + "%7.1f" * 4 + "%6d" * 4
+
+
+def _red_noise(rng, n_components, n_samples, freq, corner_freq=2.):
+    """Generate unit-variance noise with a flat spectrum below corner_freq and a -5/3 slope above."""
+    white = rng.standard_normal((n_components, n_samples))
+    f = np.fft.rfftfreq(n_samples, d=1. / freq)
+    gain = np.maximum(f / corner_freq, 1.) ** (-5. / 6.)
+    noise = np.fft.irfft(np.fft.rfft(white) * gain, n=n_samples)
+    return noise / noise.std(axis=1, keepdims=True)
+
+
+def generate_adv_signal(n_samples, freq=200., spike_rate=0.01, profile_type="lp", seed=0):
+    """Generate the columns of a synthetic Vectrino measurement.
+
+    Args:
+        n_samples (int): number of samples
+        freq (float): sampling frequency in Hz (default: 200)
+        spike_rate (float): fraction of samples with a spike in each velocity component (default: 0.01)
+        profile_type (str): lp (default) records zero w2 velocities like the longitudinal probe setup, other profile
+            types (down) record w2 velocities
+        seed (int): seed of the random number generator (default: 0)
+
+    Returns:
+        dict: keys correspond to the columns of vna_reader.DATA_COLUMNS and values to np.arrays
+    """
+    rng = np.random.default_rng(seed)
+    means = np.array(MEAN_VELOCITIES)[:, None]
+    stds = np.array(TURBULENCE_INTENSITIES)[:, None] * MEAN_VELOCITIES[0]
+    velocities = means + stds * _red_noise(rng, 4, n_samples, freq)
+    spikes = rng.random((4, n_samples)) < spike_rate
+    velocities[spikes] += (rng.uniform(4., 10., spikes.sum()) * rng.choice([-1., 1.], spikes.sum())
+                           * np.broadcast_to(stds, spikes.shape)[spikes])
+    if profile_type == "lp":
+        velocities[3] = 0.
+    # 0.1 mm/s resolution within the int16 range of vno records
+    velocities = np.round(np.clip(velocities, -3.2, 3.2), 4)
+    amplitudes = rng.integers(150, 176, (4, n_samples))
+    correlations = rng.integers(40, 100, (4, n_samples))
+    sample_no = np.arange(1, n_samples + 1)
+    data = {"time (s)": np.round(sample_no / freq, 3), "sample no.": sample_no.astype(np.float64)}
+    for i, beam in enumerate(vno_reader.BEAMS):
+        data[vno_reader.VELOCITY_COLUMNS[i]] = velocities[i]
+    for i, beam in enumerate(vno_reader.BEAMS):
+        data["ampl. %s (dB)" % beam] = amplitudes[i].astype(np.float64)
+    for i, beam in enumerate(vno_reader.BEAMS):
+        data["SNR %s" % beam] = np.round(20. * np.log10(amplitudes[i] / NOISE_COUNTS[i]), 1)
+    for i, beam in enumerate(vno_reader.BEAMS):
+        data["corr %s" % beam] = correlations[i].astype(np.float64)
+    return data
+
+
+def write_vna(vna_file_name, data):
+    """Write the columns of generate_adv_signal as fixed-width Vectrino+ ASCII export (Windows line breaks).
+
+    Args:
+        vna_file_name (str): name of the vna file to write
+        data (dict): the result of generate_adv_signal
+    """
+    n_samples = data["time (s)"].size
+    table = np.column_stack([np.zeros(n_samples), data["time (s)"], data["sample no."], np.full(n_samples, 11.)]
+                            + [values for col, values in data.items() if col not in ["time (s)", "sample no."]])
+    with open(vna_file_name, "w", newline="") as f:
+        np.savetxt(f, table, fmt=VNA_FORMAT, newline="\r\n")
+
+
+def _with_checksums(records):
+    """Set size and checksum fields of structured Nortek records."""
+    words = records.view("<u2").reshape(records.size, -1)
+    if "size" in records.dtype.names:
+        records["size"] = words.shape[1]
+    records["checksum"] = (vno_reader.CHECKSUM_SEED + words[:, :-1].sum(axis=1, dtype=np.uint32)) & 0xFFFF
+    return records
+
+
+def write_vno(vno_file_name, data, freq=200.):
+    """Write the columns of generate_adv_signal as binary Vectrino file (configuration records, one velocity header,
+    and velocity data records with 0.1 mm/s velocity scaling).
+
+    Args:
+        vno_file_name (str): name of the vno file to write
+        data (dict): the result of generate_adv_signal
+        freq (float): sampling frequency in Hz (default: 200)
+    """
+    records = []
+    for record_id, dtype in [(vno_reader.HARDWARE_CONFIG_ID, vno_reader.HARDWARE_CONFIG_DTYPE),
+                             (vno_reader.HEAD_CONFIG_ID, vno_reader.HEAD_CONFIG_DTYPE),
+                             (vno_reader.USER_CONFIG_ID, vno_reader.USER_CONFIG_DTYPE),
+                             (vno_reader.VELOCITY_HEADER_ID, vno_reader.VELOCITY_HEADER_DTYPE)]:
+        record = np.zeros(1, dtype=dtype)
+        record["sync"], record["id"] = vno_reader.SYNC, record_id
+        if record_id == vno_reader.HEAD_CONFIG_ID:
+            record["beams"] = 4
+        elif record_id == vno_reader.USER_CONFIG_ID:
+            record["sampling rate (Hz)"] = freq
+            record["coordinate system"] = 1
+        elif record_id == vno_reader.VELOCITY_HEADER_ID:
+            record["noise"] = NOISE_COUNTS
+        records.append(_with_checksums(record))
+    n_samples = data["time (s)"].size
+    velocity_data = np.zeros(n_samples, dtype=vno_reader.VELOCITY_DATA_DTYPE)
+    velocity_data["sync"], velocity_data["id"] = vno_reader.SYNC, vno_reader.VELOCITY_DATA_ID
+    velocity_data["status"] = vno_reader.VELOCITY_SCALING_BIT
+    velocity_data["count"] = data["sample no."].astype(np.int64) % 256
+    for i, beam in enumerate(vno_reader.BEAMS):
+        velocity_data["velocity"][:, i] = np.round(data[vno_reader.VELOCITY_COLUMNS[i]] * 1e4)
+        velocity_data["amplitude"][:, i] = data["ampl. %s (dB)" % beam]
+        velocity_data["correlation"][:, i] = data["corr %s" % beam]
+    records.append(_with_checksums(velocity_data))
+    with open(vno_file_name, "wb") as f:
+        for record in records:
+            f.write(record.tobytes())
+
+
+def get_file_stem(index, y=16.5, z=6., test_no=1):
+    """Get the name (without ending) of the index-th synthetic file with probe positions every 5 cm along x."""
+    x = 5. * index - 10.
+    return "%s%g_%g_%g_T%i" % ("__" if x < 0 else "", abs(x), y, z, test_no)
+
+
+def generate_experiment(folder, n_files=3, n_samples=2 ** 16, freq=200., spike_rate=0.01, profile_type="lp",
+                        file_format="vna", seed=0):
+    """Write a folder of synthetic measurement files.
+
+    Args:
+        folder (str): directory of the measurement files (created if it does not exist)
+        n_files (int): number of files (default: 3)
+        n_samples (int): number of samples per file (default: 2 ** 16)
+        freq (float): sampling frequency in Hz (default: 200)
+        spike_rate (float): fraction of samples with a spike in each velocity component (default: 0.01)
+        profile_type (str): lp (default) or down (see generate_adv_signal)
+        file_format (str): vna (default), vno, or both
+        seed (int): seed of the random number generator; file i uses seed + i (default: 0)
+
+    Returns:
+        list: names of the written files (without directory)
+    """
+    os.makedirs(folder, exist_ok=True)
+    file_names = []
+    for i in range(n_files):
+        data = generate_adv_signal(n_samples, freq=freq, spike_rate=spike_rate, profile_type=profile_type,
+                                   seed=seed + i)
+        stem = get_file_stem(i)
+        if file_format in ["vna", "both"]:
+            write_vna(os.path.join(folder, stem + ".vna"), data)
+            file_names.append(stem + ".vna")
+        if file_format in ["vno", "both"]:
+            write_vno(os.path.join(folder, stem + ".vno"), data, freq=freq)
+            file_names.append(stem + ".vno")
+    return file_names
+
+
+def write_input_file(input_file_name, folder_name, profile_type="lp", freq=200., method="velocity", lambda_a=1.,
+                     k=3., bulk_velocity=MEAN_VELOCITIES[0], log_length=0.114):
+    """Write an input workbook (like input.xlsx) for the synthetic experiment in folder_name.
+
+    Args:
+        input_file_name (str): name of the workbook to write
+        folder_name (str): data folder relative to config.SCRIPT_DIR
+        profile_type (str): lp (default) or down
+        freq (float): sampling frequency in Hz (default: 200)
+        method (str): spike detection method (default: velocity)
+        lambda_a (float): despike lambda a (default: 1)
+        k (float): despike k (default: 3)
+        bulk_velocity (float): flow velocity in m/s (default: mean u velocity of the generator)
+        log_length (float): characteristic log length in m (default: 0.114)
+    """
+    values = {
+        "Input folder name (tke-analyst/)": folder_name,
+        "Water depth": 0.13,
+        "Flow velocity": bulk_velocity,
+        "Characteristic log length dimension": log_length,
+        "ADV freq": freq,
+        "ADV direction": "longitudinal" if profile_type == "lp" else "down",
+        "Spike detection method": method,
+        "Despike lambda a": lambda_a,
+        "Despike k": k,
+    }
+    pd.DataFrame({"VALUE": list(values.values())}, index=pd.Index(list(values), name="PARAMETER")).to_excel(
+        input_file_name)
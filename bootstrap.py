@@ -0,0 +1,110 @@
+"""Moving-block bootstrap confidence intervals of TKE and Reynolds stresses
+
+Note:
+    Resampling single samples ignores the autocorrelation of ADV series and yields too narrow confidence intervals.
+    The moving-block bootstrap resamples blocks of BOOTSTRAP_BLOCK_DURATION seconds (see config.py), which should be
+    several integral time scales long (see timescales.py). All replicates are drawn at once as a (replicates, blocks)
+    matrix of random block starts. Cumulative sums give the moment sums of any block with two lookups (see
+    rolling_stats.get_cumulative_sums), so that a replicate is the sum of its block sums, and the variances, TKE, and
+    Reynolds stresses of all replicates follow from a few vectorized operations. The cumulative sums are calculated
+    one moment at a time and the block sums are gathered in steps of BOOTSTRAP_BLOCK_VALUES, so that the memory use
+    stays at a few arrays of the record length (besides the (replicates, blocks) matrix of block starts). NaN samples
+    are ignored like in flowstat. The confidence intervals are percentile intervals of BOOTSTRAP_REPLICATES
+    replicates. Random draws are seeded per file (see get_file_rng), so that results do not depend on the processing
+    order or mode.
+"""
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from config import BOOTSTRAP_REPLICATES, BOOTSTRAP_BLOCK_DURATION, BOOTSTRAP_CONFIDENCE, BOOTSTRAP_SEED
+from flowstat import BOOTSTRAP_PARAMETERS, BOOTSTRAP_COLUMNS
+from rolling_stats import BLOCK_QUANTITIES, get_cumulative_sums, get_block_stats
+
+
+# maximum number of gathered block sums per vectorized step (bounds the memory use of the replicates)
+BOOTSTRAP_BLOCK_VALUES = 2 ** 18
+
+
+def get_file_rng(name, seed=BOOTSTRAP_SEED):
+    """Create the random generator of a file from the run seed and the file name.
+
+    Args:
+        name (str): name of the measurement file (or any other identifier)
+        seed (int): seed of the run (default: config.BOOTSTRAP_SEED)
+
+    Returns:
+        np.random.Generator
+    """
+    return np.random.default_rng([seed, zlib.crc32(name.encode())])
+
+
+def bootstrap_tke(u, v, w, freq, rng=None, replicates=BOOTSTRAP_REPLICATES, block_duration=BOOTSTRAP_BLOCK_DURATION,
+                  confidence=BOOTSTRAP_CONFIDENCE):
+    """Calculate moving-block bootstrap confidence intervals of TKE and Reynolds stresses of one measurement.
+
+    Args:
+        u (np.array): streamwise velocities
+        v (np.array): perpendicular velocities
+        w (np.array): vertical velocities (w1 if profile_type is lp and w2 otherwise, like in flowstat)
+        freq (float): sampling frequency in Hz
+        rng (np.random.Generator): random generator (default: None creates a generator with config.BOOTSTRAP_SEED)
+        replicates (int): number of bootstrap replicates (default: config.BOOTSTRAP_REPLICATES)
+        block_duration (float): duration of the resampled blocks in s (default: config.BOOTSTRAP_BLOCK_DURATION)
+        confidence (float): confidence level of the percentile intervals (default: config.BOOTSTRAP_CONFIDENCE)
+
+    Returns:
+        dict: BOOTSTRAP_COLUMNS as keys and floats as values (NaN for series without samples)
+    """
+    rng = np.random.default_rng(BOOTSTRAP_SEED) if rng is None else rng
+    n_samples = np.asarray(u).size
+    if n_samples == 0:
+        return {col: np.nan for col in BOOTSTRAP_COLUMNS}
+    block_samples = int(min(max(1, round(block_duration * freq)), n_samples))
+    n_blocks = max(1, n_samples // block_samples)
+    # random block starts of all replicates
+    starts = rng.integers(0, n_samples - block_samples + 1, size=(replicates, n_blocks))
+    sums = np.empty((replicates, BLOCK_QUANTITIES))
+    step = max(1, BOOTSTRAP_BLOCK_VALUES // n_blocks)
+    cumulative_sums, _ = get_cumulative_sums(u, v, w)
+    for column, cumulative in cumulative_sums:
+        for start in range(0, replicates, step):
+            block_starts = starts[start:start + step]
+            sums[start:start + step, column] = (cumulative[block_starts + block_samples]
+                                                - cumulative[block_starts]).sum(axis=1)
+    replicate_stats = get_block_stats(sums)
+    quantiles = [0.5 * (1. - confidence), 0.5 * (1. + confidence)]
+    intervals = {}
+    for name, par in BOOTSTRAP_PARAMETERS.items():
+        values = replicate_stats[name]
+        low, high = np.nanquantile(values, quantiles) if np.isfinite(values).any() else (np.nan, np.nan)
+        intervals.update({par.replace(" (", " CI low ("): float(low), par.replace(" (", " CI high ("): float(high)})
+    return intervals
+
+
+def _bootstrap_file(velocities, name, freq, seed, **kwargs):
+    return bootstrap_tke(*velocities, freq, rng=get_file_rng(name, seed), **kwargs)
+
+
+def bootstrap_files(velocities, names, freq, seed=BOOTSTRAP_SEED, workers=1, **kwargs):
+    """Calculate bootstrap confidence intervals of many measurements, optionally in a pool of worker processes.
+
+    Args:
+        velocities (list): (u, v, w) tuples of np.arrays of every measurement
+        names (list): names of the measurement files (seed the random generators, see get_file_rng)
+        freq (float): sampling frequency in Hz
+        seed (int): seed of the run (default: config.BOOTSTRAP_SEED)
+        workers (int): number of worker processes; 1 (default) runs serially in the calling process
+        **kwargs: replicates, block_duration, and confidence of bootstrap_tke
+
+    Returns:
+        dict: BOOTSTRAP_COLUMNS as keys and np.arrays of one value per measurement as values
+    """
+    fun = partial(_bootstrap_file, freq=freq, seed=seed, **kwargs)
+    if workers > 1 and len(names) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(names))) as executor:
+            intervals = list(executor.map(fun, velocities, names))
+    else:
+        intervals = [fun(file_velocities, name) for file_velocities, name in zip(velocities, names)]
+    return {col: np.array([file_intervals[col] for file_intervals in intervals], dtype=np.float64)
+            for col in BOOTSTRAP_COLUMNS}
@@ -7,11 +7,71 @@ import logging
 SCRIPT_DIR = _os.path.abspath("") + "/"
 NAN = -9999.0
 
+# parse cache (see parse_cache.py): sub-folder name in the data folder and maximum size in bytes
+CACHE_FOLDER = ".tke-cache"
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# run manifest (see run_manifest.py): file name in the data folder
+MANIFEST_NAME = "run-manifest.json"
+
+# experiment catalog (see experiment_catalog.py): SQLite file name in the script folder and tolerance in m of
+# coordinate selections
+CATALOG_NAME = "tke-catalog.sqlite"
+CATALOG_TOLERANCE = 1e-6
+
+# streaming mode: number of samples read and processed at once
+STREAM_CHUNK_ROWS = 2 ** 16
+
+# watch mode (see live_monitor.py): publication interval in seconds, maximum number of bytes parsed at once, and
+# convergence of mean u and TKE (relative changes below the tolerance over the window in seconds of the record)
+WATCH_INTERVAL = 1.
+WATCH_MAX_BYTES = 2 ** 24
+CONVERGENCE_WINDOW = 30.
+CONVERGENCE_TOLERANCE = 0.01
+
+# power spectral densities (see spectra.py): samples per Welch segment, overlap of segments, maximum fraction of NaN
+# samples in a segment (gaps are interpolated, segments with more gaps are rejected), frequency range in Hz of the
+# inertial subrange slope fit, and lower limit of the noise floor as fraction of the Nyquist frequency
+SPECTRUM_SEGMENT_SAMPLES = 1024
+SPECTRUM_OVERLAP = 0.5
+SPECTRUM_MAX_GAP = 0.1
+SPECTRUM_INERTIAL_RANGE = (1., 10.)
+SPECTRUM_NOISE_FRACTION = 0.8
+
+# largest lag in s of the autocorrelation functions of integral time scales (see timescales.py)
+ACF_MAX_LAG = 60.
+
+# moving-block bootstrap confidence intervals of TKE and Reynolds stresses (see bootstrap.py): number of replicates,
+# duration of the resampled blocks in s (several integral time scales), confidence level, and seed of random draws
+BOOTSTRAP_REPLICATES = 2000
+BOOTSTRAP_BLOCK_DURATION = 2.
+BOOTSTRAP_CONFIDENCE = 0.95
+BOOTSTRAP_SEED = 0
+
+# time-resolved stats of despiked series (see rolling_stats.py): duration of the sliding windows and time between the
+# starts of consecutive windows in s
+WINDOW_DURATION = 60.
+WINDOW_STRIDE = 1.
+
 PROFILE_KEYS = {
     "longitudinal": "lp",
     "down": "down",
 }
 
+# experiment parameters: keys of toml/json input files and --set arguments, corresponding labels in column A of
+# input.xlsx, and keys of the experiment setup (see profile_analyst.load_input_defs)
+INPUT_PARAMETERS = {
+    "folder_name": ("Input folder name (tke-analyst/)", "folder name"),
+    "adv_direction": ("ADV direction", "profile"),
+    "flow_velocity": ("Flow velocity", "bulk velocity"),
+    "water_depth": ("Water depth", "bulk depth"),
+    "adv_freq": ("ADV freq", "freq"),
+    "log_length": ("Characteristic log length dimension", "characteristic wood length"),
+    "despiking_method": ("Spike detection method", "despiking method"),
+    "despike_lambda_a": ("Despike lambda a", "lambda a"),
+    "despike_k": ("Despike k", "despike k"),
+}
+
 # define data headers
 HEADERS = ["File #", "x (m)", "y (m)", "z (m)",
            "u_avr (m/s)", "u_stderr (m/s)", "u_rms (m/s)",
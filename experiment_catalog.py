@@ -0,0 +1,258 @@
+"""Persistent SQLite catalog of the measurement files of many experiments
+
+Note:
+    The catalog (CATALOG_NAME in the script folder, see config.py) has one row per vna or vno file with its path,
+    size, modification time, probe coordinates and test id (parsed from the file name, such as __8_16.5_6_T3.vna),
+    sampling metadata, and processing status. Scans walk the experiment folders recursively with os.scandir, whose
+    directory entries carry the file sizes and modification times, and only read new or changed files (for their
+    sampling metadata). The status of new files is "new", of files that changed after processing "changed", and of
+    files that were processed with the catalog "processed". Indexes on the coordinates, test numbers, folders, and
+    status answer selections such as all files with z = 0.06 m of the tests T1 to T9 without touching the folders,
+    and selected files are processed folder by folder (see profile_analyst.process_catalog_files).
+"""
+import os
+import re
+import logging
+import sqlite3
+import numpy as np
+from config import CATALOG_TOLERANCE
+from vna_reader import parse_vna_rows
+from vno_reader import read_vno_header
+
+
+MEASUREMENT_FORMATS = [".vna", ".vno"]
+# catalog columns and their SQLite types (path is the primary key)
+CATALOG_COLUMNS = {
+    "path": "TEXT PRIMARY KEY", "folder": "TEXT", "name": "TEXT", "stem": "TEXT", "format": "TEXT",
+    "size": "INTEGER", "mtime_ns": "INTEGER", "x": "REAL", "y": "REAL", "z": "REAL", "test": "TEXT",
+    "test_no": "INTEGER", "freq": "REAL", "samples": "INTEGER", "duration": "REAL", "status": "TEXT",
+}
+CATALOG_INDEXES = {"files_position": "z, x, y", "files_test": "test_no", "files_folder": "folder, stem",
+                   "files_status": "status"}
+# keys of select_files (and of --select settings)
+SELECTION_KEYS = ["x", "y", "z", "test", "folder", "status"]
+# number of bytes read at once when counting the lines of vna files
+COUNT_BLOCK_BYTES = 2 ** 24
+
+
+def vna_file_name2coordinates(vna_file_name):
+    """Take vna file name and extract x, y, and z coordinates in meters.
+    Non-convertible numbers are translated into np.nan with warning.
+
+    Args:
+        vna_file_name (str): name of a vna file, such as __8_16.5_6_T3.vna
+
+    Returns:
+        list [x, y, z] coordinates
+    """
+    # remove file ending (not characters, like str.strip), replace __ with minus, and split coordinates with _
+    xyz_list = os.path.splitext(os.path.basename(vna_file_name))[0].replace("__", "-").split("_")[0:3]
+    for i, coord in enumerate(xyz_list):
+        try:
+            xyz_list[i] = float(coord) / 100.
+        except ValueError:
+            logging.warning("WARNING: Could not convert {0} to coordinate in file {1}".format(
+                str(coord), vna_file_name))
+            xyz_list[i] = np.nan
+    return xyz_list
+
+
+def vna_file_name2test(vna_file_name):
+    """Take vna file name and extract the test id and number.
+
+    Args:
+        vna_file_name (str): name of a vna file, such as __8_16.5_6_T3.vna
+
+    Returns:
+        tuple (str, int): test id (such as T3) and the number in the test id (such as 3), or None for file names
+        without test id or number
+    """
+    fields = os.path.splitext(os.path.basename(vna_file_name))[0].replace("__", "-").split("_")
+    test = fields[3] if len(fields) > 3 else None
+    number = re.search(r"\d+", test) if test else None
+    return test, int(number.group()) if number else None
+
+
+def get_sampling_info(file_name):
+    """Get the sampling frequency, number of samples, and duration of a measurement without parsing it completely.
+
+    Args:
+        file_name (str): name of a vna or vno file
+
+    Returns:
+        dict: freq (Hz), samples, and duration (s); None for values that cannot be derived
+    """
+    info = {"freq": None, "samples": None, "duration": None}
+    try:
+        if file_name.endswith(".vno"):
+            header = read_vno_header(file_name)
+            info.update({"freq": header.get("sampling rate (Hz)"), "samples": header["samples"]})
+        else:
+            with open(file_name, "rb") as f:
+                line_length = len(f.readline())
+                size = os.fstat(f.fileno()).st_size
+                if line_length and size % line_length == 0:
+                    # fixed-width lines (checked by the parser when the file is read)
+                    info["samples"] = size // line_length
+                else:
+                    f.seek(0)
+                    info["samples"] = sum(block.count(b"\n") for block in iter(lambda: f.read(COUNT_BLOCK_BYTES),
+                                                                                 b""))
+            time = parse_vna_rows(file_name, columns=["time (s)"], max_bytes=64 * max(line_length, 1))[0]["time (s)"]
+            if time.size > 1 and np.median(np.diff(time)) > 0.:
+                info["freq"] = round(float(1. / np.median(np.diff(time))), 6)
+    except (OSError, ValueError) as e:
+        logging.warning("WARNING: could not read the sampling metadata of %s (%s)" % (file_name, e))
+    if info["freq"] and info["samples"] is not None:
+        info["duration"] = info["samples"] / info["freq"]
+    return info
+
+
+def open_catalog(catalog_file):
+    """Open (and create) a catalog.
+
+    Args:
+        catalog_file (str): name of the SQLite catalog file
+
+    Returns:
+        sqlite3.Connection: the catalog with rows that can be accessed by column names
+    """
+    catalog = sqlite3.connect(catalog_file)
+    catalog.row_factory = sqlite3.Row
+    with catalog:
+        catalog.execute("CREATE TABLE IF NOT EXISTS files (%s)" % ", ".join(
+            "%s %s" % (col, sql_type) for col, sql_type in CATALOG_COLUMNS.items()))
+        for index, columns in CATALOG_INDEXES.items():
+            catalog.execute("CREATE INDEX IF NOT EXISTS %s ON files (%s)" % (index, columns))
+    return catalog
+
+
+def _iter_measurement_files(folder):
+    """Yield the os.DirEntry of all measurement files in folder and its sub-folders (except hidden folders, such as
+    the parse cache)."""
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False) and not entry.name.startswith("."):
+                    yield from _iter_measurement_files(entry.path)
+                elif entry.is_file() and os.path.splitext(entry.name)[1] in MEASUREMENT_FORMATS:
+                    yield entry
+    except OSError as e:
+        logging.warning("WARNING: cannot scan %s (%s)" % (folder, e))
+
+
+def scan_folders(catalog, folders):
+    """Add the measurement files of experiment folders (and their sub-folders) to the catalog; only new and changed
+    files are read, and files that no longer exist are removed.
+
+    Args:
+        catalog (sqlite3.Connection): the catalog (see open_catalog)
+        folders (list): names of experiment folders (or of a parent folder of many experiments)
+
+    Returns:
+        dict: numbers of new, changed, unchanged, and removed files
+    """
+    counts = {"new": 0, "changed": 0, "unchanged": 0, "removed": 0}
+    for folder in folders:
+        folder = os.path.abspath(folder)
+        known = {row["path"]: row for row in catalog.execute(
+            "SELECT path, size, mtime_ns, status FROM files WHERE folder = ? OR folder LIKE ? ESCAPE '\\'",
+            (folder, re.sub(r"([\\%_])", r"\\\1", folder.rstrip(os.sep) + os.sep) + "%"))}
+        rows = []
+        for entry in _iter_measurement_files(folder):
+            stat = entry.stat()
+            record = known.pop(entry.path, None)
+            if record is not None and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+                counts["unchanged"] += 1
+                continue
+            status = "new" if record is None or record["status"] == "new" else "changed"
+            counts["new" if record is None else "changed"] += 1
+            stem, file_format = os.path.splitext(entry.name)
+            x, y, z = vna_file_name2coordinates(entry.name)
+            test, test_no = vna_file_name2test(entry.name)
+            row = {"path": entry.path, "folder": os.path.dirname(entry.path), "name": entry.name, "stem": stem,
+                   "format": file_format[1:], "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                   "x": x, "y": y, "z": z, "test": test, "test_no": test_no, "status": status}
+            row.update(get_sampling_info(entry.path))
+            rows.append(tuple(row[col] for col in CATALOG_COLUMNS))
+        with catalog:
+            catalog.executemany("INSERT OR REPLACE INTO files VALUES (%s)" % ", ".join("?" * len(CATALOG_COLUMNS)),
+                                rows)
+            catalog.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in known])
+        counts["removed"] += len(known)
+    return counts
+
+
+def _get_condition(key, value):
+    """Get the SQL condition and parameters of a selection (see select_files)."""
+    if key in ["x", "y", "z"]:
+        if isinstance(value, str) and ":" in value:
+            value = tuple(float(v) for v in value.split(":"))
+        if isinstance(value, (tuple, list)):
+            return "%s BETWEEN ? AND ?" % key, [min(value) - CATALOG_TOLERANCE, max(value) + CATALOG_TOLERANCE]
+        return "%s BETWEEN ? AND ?" % key, [float(value) - CATALOG_TOLERANCE, float(value) + CATALOG_TOLERANCE]
+    values = value.split(",") if isinstance(value, str) else list(np.atleast_1d(value))
+    if key == "folder":
+        return "(%s)" % " OR ".join(["folder = ?"] * len(values)), [os.path.abspath(v) for v in values]
+    if key == "status":
+        return "status IN (%s)" % ", ".join("?" * len(values)), [str(v) for v in values]
+    if key == "test":
+        conditions, parameters = [], []
+        for test in values:
+            test_range = re.fullmatch(r"\D*(\d+)\s*-\s*\D*(\d+)", str(test).strip())
+            if isinstance(test, (int, np.integer)):
+                conditions.append("test_no = ?")
+                parameters.append(int(test))
+            elif test_range:
+                # range of test numbers, such as T1-T9
+                conditions.append("test_no BETWEEN ? AND ?")
+                parameters += sorted(int(number) for number in test_range.groups())
+            else:
+                conditions.append("test = ?")
+                parameters.append(str(test).strip())
+        return "(%s)" % " OR ".join(conditions), parameters
+    raise ValueError("Unknown catalog selection key: {0} (available: {1})".format(key, SELECTION_KEYS))
+
+
+def select_files(catalog, **selection):
+    """Select catalog files with the index of the catalog. Binary vno files are skipped if the folder also holds their
+    vna export (like profile_analyst.get_data_info).
+
+    Args:
+        catalog (sqlite3.Connection): the catalog (see open_catalog)
+        **selection: x, y, and z coordinates in m (a value within config.CATALOG_TOLERANCE, or a (low, high) range or
+            a LOW:HIGH string), test (test ids, such as T3, test numbers, or ranges of test numbers, such as T1-T9, as
+            a list or a comma-separated string), folder (experiment folders), and status (processing status, see the
+            Note)
+
+    Returns:
+        list: dict of the catalog columns (see CATALOG_COLUMNS) of every selected file, sorted by folder and name
+    """
+    conditions = ["NOT (format = 'vno' AND EXISTS (SELECT 1 FROM files AS export WHERE export.folder = files.folder "
+                  "AND export.stem = files.stem AND export.format = 'vna'))"]
+    parameters = []
+    for key, value in selection.items():
+        if value is None:
+            continue
+        condition, condition_parameters = _get_condition(key, value)
+        conditions.append(condition)
+        parameters += condition_parameters
+    query = "SELECT * FROM files WHERE %s ORDER BY folder, name" % " AND ".join(conditions)
+    return [dict(row) for row in catalog.execute(query, parameters)]
+
+
+def mark_processed(catalog, paths):
+    """Set the processing status of catalog files to processed.
+
+    Args:
+        catalog (sqlite3.Connection): the catalog (see open_catalog)
+        paths (list): paths of the processed files
+    """
+    with catalog:
+        catalog.executemany("UPDATE files SET status = 'processed' WHERE path = ?", [(path,) for path in paths])
+
+
+def catalog_table(files):
+    """Create a table of selected catalog files (see select_files) with path index."""
+    import pandas as pd
+    return pd.DataFrame(files, columns=list(CATALOG_COLUMNS)).set_index("path")
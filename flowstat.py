@@ -2,6 +2,202 @@ import numpy as np
 import logging
 
 
+# parameters and stat types of stats tables (see stats_table); STATS2_PARAMETERS only apply if profile_type is not lp
+STAT_TYPES = ["average", "std", "stderr"]
+STATS_PARAMETERS = ["u STAT (m/s)", "v STAT (m/s)", "w STAT (m/s)", "TKE (m^2/s^2)",
+                    "tau_v STAT (m^2/s^2)", "tau_w STAT (m^2/s^2)"]
+STATS2_PARAMETERS = ["w2 STAT (m/s)", "TKE2 (m^2/s^2)", "tau_w2 STAT (m^2/s^2)"]
+# columns of the spectrum section of stats: inertial subrange slopes and noise floors of the PSDs (see spectra.py)
+SPECTRUM_COMPONENTS = ["u", "v", "w"]
+SPECTRUM_COLUMNS = [col for comp in SPECTRUM_COMPONENTS
+                    for col in ["%s PSD slope (-)" % comp, "%s noise floor (m^2/s)" % comp]]
+# series and columns of the time scales section of stats: integral time scales, effective sample sizes, and corrected
+# stderrs of the velocity components and Reynolds stress series (see timescales.py)
+TIME_SCALE_SERIES = {"u": "m/s", "v": "m/s", "w": "m/s", "tau_v": "m^2/s^2", "tau_w": "m^2/s^2"}
+TIME_SCALE_COLUMNS = [col for name, unit in TIME_SCALE_SERIES.items()
+                      for col in ["%s T_int (s)" % name, "%s N_eff (-)" % name, "%s stderr_eff (%s)" % (name, unit)]]
+# parameters and columns of the bootstrap section of stats: confidence intervals of TKE and Reynolds stresses (see
+# bootstrap.py)
+BOOTSTRAP_PARAMETERS = {"TKE": "TKE (m^2/s^2)", "tau_v": "tau_v (m^2/s^2)", "tau_w": "tau_w (m^2/s^2)"}
+BOOTSTRAP_COLUMNS = [col for par in BOOTSTRAP_PARAMETERS.values()
+                     for col in [par.replace(" (", " CI low ("), par.replace(" (", " CI high (")]]
+# optional sections of stats (dicts of column names and values) that are appended to stats tables if present
+STATS_SECTIONS = {"spectrum": SPECTRUM_COLUMNS, "time scales": TIME_SCALE_COLUMNS, "bootstrap": BOOTSTRAP_COLUMNS}
+
+
+def fused_moments(stack, pairs=(), pair_series=True):
+    """Calculate counts, means, and variances of all components and their pairwise products in one vectorized sweep.
+    NaN values are ignored like in np.nanmean and np.nanstd (reductions run along the contiguous last axis, which
+    preserves NumPy's pairwise summation and gives the same results).
+
+    Args:
+        stack (np.array): component-major array of shape (..., components, samples), e.g., np.stack((u, v, w))
+        pairs (list): (i, j) tuples of component indices; the products of the centered components i and j
+            (e.g., Reynolds stresses) are evaluated in addition (default: no pairs)
+        pair_series (bool): return the series of pair products (default: True)
+
+    Returns:
+        dict: count, average, and var arrays of shape (..., components); if pairs are provided, also pair count,
+            pair average, and pair var arrays of shape (..., pairs), and (if pair_series) the pair series (NaN where
+            any component is NaN) of shape (..., pairs, samples)
+    """
+    valid = ~np.isnan(stack)
+    count = np.count_nonzero(valid, axis=-1)
+    centered = np.where(valid, stack, 0.)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average = centered.sum(axis=-1) / count
+        np.subtract(centered, average[..., None], out=centered, where=valid)
+        moments = {"count": count, "average": average, "var": np.square(centered).sum(axis=-1) / count}
+        if pairs:
+            i, j = (list(idx) for idx in zip(*pairs))
+            # centered components are zero where NaN, so the products are zero where any component is NaN
+            products = centered[..., i, :] * centered[..., j, :]
+            pair_valid = valid[..., i, :] & valid[..., j, :]
+            pair_count = np.count_nonzero(pair_valid, axis=-1)
+            pair_average = products.sum(axis=-1) / pair_count
+            deviation = np.where(pair_valid, products - pair_average[..., None], 0.)
+            moments.update({
+                "pair count": pair_count,
+                "pair average": pair_average,
+                "pair var": np.square(deviation).sum(axis=-1) / pair_count,
+            })
+            if pair_series:
+                np.copyto(products, np.nan, where=~pair_valid)
+                moments["pair series"] = products
+    return moments
+
+
+def update_moments(moments, stack, pairs=()):
+    """Merge the moments of a new chunk of samples into running moments (streaming statistics).
+    Counts, means, and variances are merged with the parallel algorithm of Chan et al. (1979); pair moments (e.g.,
+    Reynolds stresses) are accumulated as power sums shifted by the means of the first chunk, which yields the mean
+    and the variance of the products of the centered components around the final means.
+
+    Args:
+        moments (dict): running moments returned by a previous call (None for the first chunk)
+        stack (np.array): component-major array of a chunk with shape (components, samples), e.g., np.stack((u, v, w))
+        pairs (list): (i, j) tuples of component indices (must be the same for all chunks)
+
+    Returns:
+        dict: updated running moments (use finalize_moments to obtain the stats)
+    """
+    chunk = fused_moments(stack)
+    if moments is None:
+        moments = {
+            "count": np.zeros(stack.shape[0], dtype=np.int64),
+            "average": np.zeros(stack.shape[0]),
+            "m2": np.zeros(stack.shape[0]),
+            "shift": np.nan_to_num(chunk["average"]),
+            "pairs": list(pairs),
+            # pair power sums: [pair, p, q] = sum of x^p * y^q with shifted components x and y
+            "pair sums": np.zeros((len(pairs), 3, 3)),
+        }
+    count = moments["count"] + chunk["count"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = np.nan_to_num(chunk["average"]) - moments["average"]
+        weight = np.where(count > 0, chunk["count"] / count, 0.)
+        moments["m2"] = moments["m2"] + np.nan_to_num(chunk["var"]) * chunk["count"] + (
+                delta ** 2 * moments["count"] * weight)
+    moments["average"] = moments["average"] + delta * weight
+    moments["count"] = count
+
+    if moments["pairs"]:
+        i, j = (list(idx) for idx in zip(*moments["pairs"]))
+        shifted = stack - moments["shift"][:, None]
+        pair_valid = ~(np.isnan(shifted[i]) | np.isnan(shifted[j]))
+        x = np.where(pair_valid, shifted[i], 0.)
+        y = np.where(pair_valid, shifted[j], 0.)
+        x_powers = [pair_valid.astype(np.float64), x, x * x]
+        y_powers = [pair_valid.astype(np.float64), y, y * y]
+        for p in range(3):
+            for q in range(3):
+                moments["pair sums"][:, p, q] += (x_powers[p] * y_powers[q]).sum(axis=-1)
+    return moments
+
+
+def finalize_moments(moments):
+    """Derive counts, means, and variances from running moments of update_moments.
+
+    Args:
+        moments (dict): running moments returned by update_moments
+
+    Returns:
+        dict: count, average, var, pair count, pair average, and pair var arrays like fused_moments (without series)
+    """
+    count = moments["count"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average = np.where(count > 0, moments["average"], np.nan)
+        stats = {"count": count, "average": average, "var": moments["m2"] / count}
+        if moments["pairs"]:
+            i, j = (list(idx) for idx in zip(*moments["pairs"]))
+            s = moments["pair sums"]
+            n = s[:, 0, 0]
+            # means of the shifted components
+            dx = average[i] - moments["shift"][i]
+            dy = average[j] - moments["shift"][j]
+            # mean and mean square of (x - dx) * (y - dy) expanded in power sums
+            mean = (s[:, 1, 1] - dy * s[:, 1, 0] - dx * s[:, 0, 1] + n * dx * dy) / n
+            mean_square = (s[:, 2, 2] + dy ** 2 * s[:, 2, 0] + dx ** 2 * s[:, 0, 2] + n * dx ** 2 * dy ** 2
+                           - 2. * dy * s[:, 2, 1] - 2. * dx * s[:, 1, 2] + 4. * dx * dy * s[:, 1, 1]
+                           - 2. * dx * dy ** 2 * s[:, 1, 0] - 2. * dx ** 2 * dy * s[:, 0, 1]) / n
+            stats.update({
+                "pair count": n.astype(np.int64),
+                "pair average": mean,
+                "pair var": np.maximum(mean_square - mean ** 2, 0.),
+            })
+    return stats
+
+
+def get_stats(moments, profile_type="lp"):
+    """Build the flowstat stats dictionary from the moments of the stacked components u, v, w with the pairs u-v and
+    u-w (see flowstat).
+
+    Args:
+        moments (dict): result of fused_moments or finalize_moments; with leading (batch) dimensions, the stats are
+            arrays of the batch shape instead of scalars
+        profile_type (str): orientation of the probe (default: lp)
+
+    Returns:
+        dict(dict): see flowstat
+    """
+    # move the component (pair) axis to the front for unpacking
+    average = np.moveaxis(moments["average"], -1, 0)
+    std = np.sqrt(np.moveaxis(moments["var"], -1, 0))
+    stderr = std / np.sqrt(np.moveaxis(moments["count"], -1, 0))
+    tau_average = np.moveaxis(moments["pair average"], -1, 0)
+    tau_std = np.sqrt(np.moveaxis(moments["pair var"], -1, 0))
+    tau_stderr = tau_std / np.sqrt(np.moveaxis(moments["pair count"], -1, 0))
+
+    # flow statistics: velocity (m/s), mean (m/s), rms (m/s), stderr (m/s)
+    u_stats, v_stats, w_stats = ({"average": average[i], "std": std[i], "stderr": stderr[i]} for i in range(3))
+    # Reynolds stress for u and v (tau_re0) and for u and w (tau_re1)
+    tau_re0_stats, tau_re1_stats = ({"average": tau_average[i], "std": tau_std[i], "stderr": tau_stderr[i]}
+                                    for i in range(2))
+
+    # calculate TKE k_t1 in m^2/s^2
+    k_t1 = 0.5 * (u_stats["std"] ** 2 + v_stats["std"] ** 2 + w_stats["std"] ** 2)
+
+    stats = {"u STAT (m/s)": u_stats, "v STAT (m/s)": v_stats, "w STAT (m/s)": w_stats,
+             "TKE (m^2/s^2)": k_t1, "tau_v STAT (m^2/s^2)": tau_re0_stats, "tau_w STAT (m^2/s^2)": tau_re1_stats}
+
+    # if downward looking: stats, TKE, and Reynolds stress for u and w2 (w is w2, so these equal the w stats)
+    if not (profile_type == "lp"):
+        w2_stats = dict(w_stats)
+        k_t2 = k_t1
+        tau_re2_stats = dict(tau_re1_stats)
+    else:
+        # build empty data structures for longitudinal profiling
+        w2_stats = {
+            "average": np.nan,
+            "std": np.nan,
+            "stderr": np.nan,
+        }
+        k_t2 = {"nan": np.nan}
+        tau_re2_stats = {"nan": np.nan}
+    stats.update({"TKE2 (m^2/s^2)": k_t2, "tau_w2 STAT (m^2/s^2)": tau_re2_stats, "w2 STAT (m/s)": w2_stats})
+    return stats
+
+
 def flowstat(time, u, v, w1, w2, profile_type="lp"):
     """Calculate ADV data statistics
 
@@ -21,77 +217,110 @@ def flowstat(time, u, v, w1, w2, profile_type="lp"):
         w = w1
     else:
         w = w2
-    # flow statistics: velocity (m/s), mean (m/s), rms (m/s), stderr (m/s)
-    u_stats = {
-              "average": np.nanmean(u),
-              "std": np.nanstd(u),
-              "stderr": np.nanstd(u) / np.sqrt(np.count_nonzero(~np.isnan(u)))
-    }
-
-    v_stats = {
-              "average": np.nanmean(v),
-              "std": np.nanstd(v),
-              "stderr": np.nanstd(v) / np.sqrt(np.count_nonzero(~np.isnan(v)))
-    }
-
-    w_stats = {
-              "average": np.nanmean(w),
-              "std": np.nanstd(w),
-              "stderr": np.nanstd(w) / np.sqrt(np.count_nonzero(~np.isnan(w)))
-    }
-
-    # calculate Reynolds stress for u and v
-    tau_re0 = np.multiply(u - u_stats["average"], v - v_stats["average"])
-    tau_re0_stats = {
-                    "average": np.nanmean(tau_re0),
-                    "std": np.nanstd(tau_re0),
-                    "stderr": np.nanstd(tau_re0) / np.sqrt(np.count_nonzero(~np.isnan(tau_re0)))
-    }
-
-    # calculate Reynolds stress for u and w1
-    tau_re1 = np.multiply(u - u_stats["average"], w - w_stats["average"])
-    tau_re1_stats = {
-                    "average": np.nanmean(tau_re1),
-                    "std": np.nanstd(tau_re1),
-                    "stderr": np.nanstd(tau_re1) / np.sqrt(np.count_nonzero(~np.isnan(tau_re1)))
-    }
-
-    # calculate TKE k_t1 in m^2/s^2
-    k_t1 = 0.5 * (u_stats["std"] ** 2 + v_stats["std"] ** 2 + w_stats["std"] ** 2)
+    # flow statistics of u, v, w and Reynolds stresses of u-v and u-w in one sweep over the stacked components
+    moments = fused_moments(np.stack((u, v, w)).astype(np.float64, copy=False), pairs=[(0, 1), (0, 2)])
+    stats = get_stats(moments, profile_type)
+    tau_re0, tau_re1 = moments["pair series"]
 
     # prepare output data
     time_series = {"t (s)": time, "u (m/s)": u, "v (m/s)": v, "w1 (m/s)": w1,
                    "tau_v (m^2/s^2)": tau_re0, "tau_w (m^2/s^2)": tau_re1}
-    stats = {"u STAT (m/s)": u_stats, "v STAT (m/s)": v_stats, "w STAT (m/s)": w_stats,
-             "TKE (m^2/s^2)": k_t1, "tau_v STAT (m^2/s^2)": tau_re0_stats, "tau_w STAT (m^2/s^2)": tau_re1_stats}
-
-    # if downward looking: calculate stats, TKE, and Reynolds stress for u and w2
     if not (profile_type == "lp"):
-        w2_stats = {
-            "average": np.nanmean(w2),
-            "std": np.nanstd(w2),
-            "stderr": np.nanstd(w2) / np.sqrt(np.count_nonzero(~np.isnan(w2)))
-        }
-        # calculate TKE k_t1 in m^2/s^2
-        k_t2 = 0.5 * (u_stats["std"] ** 2 + v_stats["std"] ** 2 + w2_stats["std"] ** 2)
-        tau_re2 = np.multiply(u - u_stats["average"], w2 - w2_stats["average"])
-        tau_re2_stats = {
-            "average": np.nanmean(tau_re2),
-            "std": np.nanstd(tau_re2),
-            "stderr": np.nanstd(tau_re2) / np.sqrt(np.count_nonzero(~np.isnan(tau_re2)))
-        }
+        tau_re2 = tau_re1
     else:
-        # build empty data structures for longitudinal profiling
-        w2_stats = {
-            "average": np.nan,
-            "std": np.nan,
-            "stderr": np.nan,
-        }
         tau_re2 = {"nan": np.nan}
-        k_t2 = {"nan": np.nan}
-        tau_re2_stats = {"nan": np.nan}
-    # update output data
     time_series.update({"tau_w2 (m^2/s^2)": tau_re2})
-    stats.update({"TKE2 (m^2/s^2)": k_t2, "tau_w2 STAT (m^2/s^2)": tau_re2_stats, "w2 STAT (m/s)": w2_stats})
 
     return time_series, stats
+
+
+def pad_series(series, fill_value=np.nan):
+    """Stack 1-d arrays of different lengths (e.g., one velocity component of many files) into a padded 2-d array.
+
+    Args:
+        series (list): 1-d np.arrays
+        fill_value (float): value of padded samples behind the end of shorter series (default: np.nan)
+
+    Returns:
+        tuple (np.array, np.array): (series, samples of the longest series) array and lengths of the series
+    """
+    lengths = np.array([len(values) for values in series], dtype=np.int64)
+    padded = np.full((len(series), lengths.max(initial=0)), fill_value, dtype=np.float64)
+    # row-major boolean assignment places the concatenated series row by row
+    padded[np.arange(padded.shape[1]) < lengths[:, None]] = np.concatenate(
+        [np.asarray(values, dtype=np.float64) for values in series]) if len(series) else []
+    return padded, lengths
+
+
+def batch_flowstat(u, v, w1, w2, profile_type="lp"):
+    """Calculate the flowstat stats of many files at once with vectorized reductions along the sample axis.
+
+    Args:
+        u (np.array): (files, samples) array of streamwise velocities with NaN padding (see pad_series)
+        v (np.array): (files, samples) array of perpendicular velocities with NaN padding
+        w1 (np.array): (files, samples) array of vertical velocities (side DOWN) with NaN padding
+        w2 (np.array): (files, samples) array of vertical velocities (side not DOWN) with NaN padding
+        profile_type (str): orientation of the probe (default: lp)
+
+    Returns:
+        dict(dict): stats like flowstat, with np.arrays of shape (files,) instead of scalars (see stats_table)
+    """
+    if profile_type == "lp":
+        w = w1
+    else:
+        w = w2
+    moments = fused_moments(np.stack((u, v, w), axis=1), pairs=[(0, 1), (0, 2)], pair_series=False)
+    return get_stats(moments, profile_type)
+
+
+def get_stats_columns(profile_type="lp", sections=()):
+    """Get the column names of stats tables (see stats_table) as a function of probe orientation.
+
+    Args:
+        profile_type (str): orientation of the probe (default: lp, which excludes w2 stats)
+        sections (list): optional sections (see STATS_SECTIONS) whose columns are appended (default: none)
+
+    Returns:
+        list: column names, such as u average (m/s), u std (m/s), and u stderr (m/s)
+    """
+    parameters = STATS_PARAMETERS if profile_type == "lp" else STATS_PARAMETERS + STATS2_PARAMETERS
+    columns = []
+    for par in parameters:
+        if "STAT" in par:
+            columns.extend([par.replace("STAT", stat_type) for stat_type in STAT_TYPES])
+        else:
+            columns.append(par)
+    for section, section_columns in STATS_SECTIONS.items():
+        if section in sections:
+            columns.extend(section_columns)
+    return columns
+
+
+def stats_table(stats, profile_type="lp"):
+    """Convert flowstat stats (of one file) or batch_flowstat stats (of many files) into a columnar stats table.
+
+    Args:
+        stats (dict(dict)): result of flowstat or batch_flowstat; optional sections (see STATS_SECTIONS), such as a
+            spectrum entry of spectra.get_spectrum_stats, add their columns
+        profile_type (str): orientation of the probe (default: lp, which excludes w2 stats)
+
+    Returns:
+        np.array: structured array with one row per file and one float field per column of get_stats_columns
+            (concatenate tables of single files with np.concatenate)
+    """
+    parameters = STATS_PARAMETERS if profile_type == "lp" else STATS_PARAMETERS + STATS2_PARAMETERS
+    values = []
+    for par in parameters:
+        if "STAT" in par:
+            values.extend([stats[par][stat_type] for stat_type in STAT_TYPES])
+        else:
+            values.append(stats[par])
+    sections = [section for section in STATS_SECTIONS if section in stats]
+    for section in sections:
+        values.extend([stats[section][col] for col in STATS_SECTIONS[section]])
+    values = np.broadcast_arrays(*(np.atleast_1d(np.asarray(value, dtype=np.float64)) for value in values))
+    columns = get_stats_columns(profile_type, sections)
+    table = np.empty(values[0].shape[0], dtype=[(col, np.float64) for col in columns])
+    for col, value in zip(columns, values):
+        table[col] = value
+    return table
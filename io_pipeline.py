@@ -0,0 +1,113 @@
+"""Bounded producer/consumer pipeline that overlaps file reads, computations, and writes
+
+Note:
+    A reader thread prefetches the next files while the calling thread processes the current one (iter_prefetched),
+    and a writer thread drains a queue of write jobs (background_writer). Both queues are bounded, so that a slow
+    consumer blocks the producer (backpressure) and at most depth + 1 files are held in memory ahead of the current
+    one. Threads overlap waiting for disks and network file systems with computations (NumPy and file I/O release the
+    GIL); pure-Python work, such as writing xlsx workbooks, does not run in parallel with other Python code.
+"""
+import queue
+import threading
+from contextlib import contextmanager
+
+
+# end of the items of the reader thread
+_DONE = object()
+
+
+def _put(job_queue, entry, stop):
+    """Put an entry into a bounded queue unless stop is set while waiting (returns False if stopped)."""
+    while not stop.is_set():
+        try:
+            job_queue.put(entry, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def iter_prefetched(read_fun, items, depth=2):
+    """Apply read_fun to items in a reader thread and yield the results in the order of items, with up to depth
+    results waiting ahead of the consumer.
+
+    Args:
+        read_fun (function): function of one item, such as a file name, that returns the read data
+        items (list): items to read
+        depth (int): maximum number of read results that wait in the queue (default: 2)
+
+    Yields:
+        tuple: item and read_fun(item); errors of read_fun are raised in the consumer when their item is reached
+    """
+    results = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def produce():
+        for item in items:
+            try:
+                entry = (item, read_fun(item), None)
+            except BaseException as e:
+                entry = (item, None, e)
+            if not _put(results, entry, stop) or entry[2] is not None:
+                return
+        _put(results, _DONE, stop)
+
+    reader = threading.Thread(target=produce, name="prefetch-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            entry = results.get()
+            if entry is _DONE:
+                break
+            item, result, error = entry
+            if error is not None:
+                raise error
+            yield item, result
+    finally:
+        # release a reader that waits for queue space if the consumer stops early
+        stop.set()
+        reader.join()
+
+
+@contextmanager
+def background_writer(depth=4):
+    """Run write jobs in a writer thread.
+
+    Args:
+        depth (int): maximum number of write jobs that wait in the queue; submitting blocks while the queue is full
+            (default: 4)
+
+    Yields:
+        function: submit(write_fun, *args) queues the call write_fun(*args); the context waits for all queued jobs on
+        exit and raises the first error of a write job (later jobs are skipped after an error)
+    """
+    jobs = queue.Queue(maxsize=max(1, depth))
+    errors = []
+
+    def drain():
+        while True:
+            job = jobs.get()
+            if job is _DONE:
+                return
+            write_fun, args = job
+            if errors:
+                continue
+            try:
+                write_fun(*args)
+            except BaseException as e:
+                errors.append(e)
+
+    def submit(write_fun, *args):
+        if errors:
+            raise errors[0]
+        jobs.put((write_fun, args))
+
+    writer = threading.Thread(target=drain, name="background-writer", daemon=True)
+    writer.start()
+    try:
+        yield submit
+    finally:
+        jobs.put(_DONE)
+        writer.join()
+    if errors:
+        raise errors[0]
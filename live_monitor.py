@@ -0,0 +1,233 @@
+"""Live monitoring of growing vna files during acquisitions (watch mode)
+
+Note:
+    The monitor polls a vna file (or all vna files of a folder) at a fixed interval and parses only the complete lines
+    that were appended since the last poll (see vna_reader.parse_vna_rows). The new samples update running moments
+    with and without spikes (see flowstat.update_moments). Spikes are detected with rmspike.rmspike_block and the
+    stats of all samples received so far, so that the spike counts of the first seconds can differ slightly from a
+    regular run with the stats of the complete record. At every interval, the stats of growing files are printed and
+    written to NAME-live.json next to the vna file (with the running counts of samples that the quality filter
+    rejected, if a filter is set). Mean u and TKE (despiked) are converged when their relative changes over the last
+    CONVERGENCE_WINDOW seconds of the record stay below CONVERGENCE_TOLERANCE (see config.py), which indicates that
+    the probe can be moved to the next position.
+"""
+import os
+import json
+import time
+import logging
+import numpy as np
+from config import WATCH_INTERVAL, WATCH_MAX_BYTES, CONVERGENCE_WINDOW, CONVERGENCE_TOLERANCE
+from flowstat import update_moments, finalize_moments, get_stats
+from rmspike import rmspike_block, get_spike_stats
+from vna_reader import parse_vna_rows, get_quality_columns, filter_quality, VELOCITY_COLUMNS
+
+
+def new_monitor_state():
+    """Create the state of a monitored file (byte offset, running moments, spike counts, counts of samples rejected by
+    the quality filter, and stats history)."""
+    return {"offset": 0, "samples": 0, "record time (s)": 0., "moments": None, "moments despiked": None,
+            "previous": None, "spikes": None, "rejected": {}, "history": []}
+
+
+def update_monitor_state(state, block, experiment_setup, spike_fill="nan"):
+    """Update the running moments and spike counts of a monitored file with new samples.
+
+    Args:
+        state (dict): state of the file (see new_monitor_state), which is updated in place
+        block (dict): keys correspond to vna column names (at least vna_reader.VELOCITY_COLUMNS) and values to np.arrays
+            of the new samples (velocities are despiked in place)
+        experiment_setup (dict): the result of profile_analyst.load_input_defs
+        spike_fill (str): replacement of spikes, nan (default) or last-valid
+    """
+    profile_type = experiment_setup["profile"]
+    w_col = "w1 (m/s)" if profile_type == "lp" else "w2 (m/s)"
+    pairs = [(0, 1), (0, 2)]
+    state["moments"] = update_moments(state["moments"], np.stack((block["u (m/s)"], block["v (m/s)"], block[w_col])),
+                                      pairs)
+    stats = get_stats(finalize_moments(state["moments"]), profile_type)
+    block_spikes, state["previous"] = rmspike_block(
+        block,
+        u_stats=stats["u STAT (m/s)"],
+        v_stats=stats["v STAT (m/s)"],
+        w_stats=stats["w STAT (m/s)"],
+        w2_stats=stats["w2 STAT (m/s)"],
+        freq=experiment_setup["freq"],
+        lambda_a=experiment_setup["lambda a"],
+        k=experiment_setup["despike k"],
+        method=experiment_setup["despiking method"],
+        profile_type=profile_type,
+        fill=spike_fill,
+        previous=state["previous"]
+    )
+    state["spikes"] = block_spikes if state["spikes"] is None else state["spikes"] + block_spikes
+    state["moments despiked"] = update_moments(
+        state["moments despiked"], np.stack((block["u (m/s)"], block["v (m/s)"], block[w_col])), pairs)
+    state["samples"] += block["u (m/s)"].size
+    state["record time (s)"] = float(block["time (s)"][-1])
+
+
+def get_convergence(history, window=CONVERGENCE_WINDOW, tolerance=CONVERGENCE_TOLERANCE):
+    """Evaluate the convergence of mean u and TKE.
+
+    Args:
+        history (list): (record time in s, u average, TKE) tuples of the published stats in chronological order
+        window (float): time span in s of the record over which the stats must be stable (default:
+            config.CONVERGENCE_WINDOW)
+        tolerance (float): maximum relative change of mean u and TKE within the window (default:
+            config.CONVERGENCE_TOLERANCE)
+
+    Returns:
+        tuple (float, float, bool): maximum relative changes of mean u and TKE within the window (NaN while the record
+        is shorter than the window) and True if both are below tolerance
+    """
+    record_time, u_average, tke = history[-1]
+    if record_time - history[0][0] < window:
+        return np.nan, np.nan, False
+    # compare with all stats since the start of the window (the last entry at or before it)
+    start = max(i for i, entry in enumerate(history) if entry[0] <= record_time - window)
+    recent = history[start:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        u_change = max(abs(entry[1] - u_average) for entry in recent) / abs(u_average)
+        tke_change = max(abs(entry[2] - tke) for entry in recent) / tke
+    return float(u_change), float(tke_change), bool(u_change < tolerance and tke_change < tolerance)
+
+
+def get_live_stats(state, experiment_setup, window=CONVERGENCE_WINDOW, tolerance=CONVERGENCE_TOLERANCE):
+    """Derive the published stats of a monitored file and append them to its history.
+
+    Args:
+        state (dict): state of the file (see new_monitor_state)
+        experiment_setup (dict): the result of profile_analyst.load_input_defs
+        window (float): convergence window in s of the record (see get_convergence)
+        tolerance (float): convergence tolerance (see get_convergence)
+
+    Returns:
+        dict: samples, record time, mean u and TKE with spikes and despiked, spike counts and rates (in %) of the
+        despiking method per velocity component, relative changes of mean u and TKE, and convergence flag, and the
+        counts of samples per velocity component that the quality filter rejected (only if min_snr or min_corr is
+        set, see watch_vna)
+    """
+    profile_type = experiment_setup["profile"]
+    stats = get_stats(finalize_moments(state["moments"]), profile_type)
+    stats_despiked = get_stats(finalize_moments(state["moments despiked"]), profile_type)
+    spikes = state["spikes"].loc["velocity" if "vel" in experiment_setup["despiking method"] else "acceleration"]
+    state["history"].append((state["record time (s)"], float(stats_despiked["u STAT (m/s)"]["average"]),
+                             float(stats_despiked["TKE (m^2/s^2)"])))
+    u_change, tke_change, converged = get_convergence(state["history"], window, tolerance)
+    # only the window and the last entry before it are needed for later evaluations
+    earlier = [i for i, entry in enumerate(state["history"]) if entry[0] <= state["record time (s)"] - window]
+    if earlier:
+        del state["history"][:earlier[-1]]
+    live_stats = {
+        "samples": state["samples"],
+        "record time (s)": state["record time (s)"],
+        "u average (m/s)": float(stats["u STAT (m/s)"]["average"]),
+        "u average despiked (m/s)": float(stats_despiked["u STAT (m/s)"]["average"]),
+        "TKE (m^2/s^2)": float(stats["TKE (m^2/s^2)"]),
+        "TKE despiked (m^2/s^2)": float(stats_despiked["TKE (m^2/s^2)"]),
+        "spikes": {col: int(count) for col, count in spikes.items()},
+        "spike rate (%)": {col: 100. * int(count) / state["samples"] for col, count in spikes.items()},
+        "u average change (-)": u_change,
+        "TKE change (-)": tke_change,
+        "converged": converged,
+    }
+    if state["rejected"]:
+        # like the quality rejected row of the spike counts (see rmspike.get_spike_stats)
+        rejected = get_spike_stats({}, profile_type, state["rejected"]).loc["quality rejected"]
+        live_stats["quality rejected"] = {col: int(count) for col, count in rejected.items()}
+    return live_stats
+
+
+def publish_live_stats(vna_file_name, live_stats):
+    """Print the live stats of a file and write them to NAME-live.json (replaced only when complete).
+
+    Args:
+        vna_file_name (str): name of the monitored vna file
+        live_stats (dict): the result of get_live_stats
+    """
+    print("   %s  t = %.1f s  n = %i  u = %.4f m/s  TKE = %.3e m2/s2  spikes = %s  du = %.2f %%  dTKE = %.2f %%  %s" % (
+        os.path.basename(vna_file_name), live_stats["record time (s)"], live_stats["samples"],
+        live_stats["u average despiked (m/s)"], live_stats["TKE despiked (m^2/s^2)"],
+        "/".join("%.1f %%" % rate for rate in live_stats["spike rate (%)"].values()),
+        100. * live_stats["u average change (-)"], 100. * live_stats["TKE change (-)"],
+        "CONVERGED" if live_stats["converged"] else "converging ..."))
+    json_file = os.path.splitext(vna_file_name)[0] + "-live.json"
+    with open(json_file + ".tmp", "w") as f:
+        json.dump(live_stats, f, indent=1)
+    os.replace(json_file + ".tmp", json_file)
+
+
+def _get_watched_files(path):
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith(".vna"))
+    return [path]
+
+
+def watch_vna(path, experiment_setup, interval=WATCH_INTERVAL, idle_timeout=None, spike_fill="nan",
+              window=CONVERGENCE_WINDOW, tolerance=CONVERGENCE_TOLERANCE, max_polls=None, dtype=np.float64,
+              min_snr=None, min_corr=None):
+    """Follow growing vna files and publish their running stats at a fixed interval (stop with Ctrl+C).
+
+    Args:
+        path (str): name of a vna file or of a folder, whose vna files (including new ones) are all followed
+        experiment_setup (dict): the result of profile_analyst.load_input_defs
+        interval (float): time in s between polls and publications (default: config.WATCH_INTERVAL)
+        idle_timeout (float): stop if no file grew for idle_timeout seconds (default: None, i.e., until Ctrl+C)
+        spike_fill (str): replacement of spikes, nan (default) or last-valid
+        window (float): convergence window in s of the record (default: config.CONVERGENCE_WINDOW)
+        tolerance (float): convergence tolerance of mean u and TKE (default: config.CONVERGENCE_TOLERANCE)
+        max_polls (int): stop after max_polls polls (default: None)
+        dtype (np.dtype): float type of the parsed columns (default: np.float64)
+        min_snr (float): minimum beam signal-to-noise ratio in dB of valid samples (see vna_reader.filter_quality;
+            default: None, i.e., no filter)
+        min_corr (float): minimum beam correlation in % of valid samples (default: None, i.e., no filter)
+
+    Returns:
+        dict: last live stats (see get_live_stats) of every file with samples
+    """
+    if experiment_setup["despiking method"] == "phase-space" or spike_fill == "linear":
+        raise ValueError("Phase-space despiking and linear spike interpolation require complete records and are not "
+                         "available in watch mode")
+    if not os.path.exists(path):
+        raise FileNotFoundError("Cannot watch %s (no such file or folder)" % path)
+    print("- watching %s (polling every %.1f s; stop with Ctrl+C) ..." % (path, interval))
+    columns = get_quality_columns(VELOCITY_COLUMNS, min_snr, min_corr)
+    states = {}
+    live = {}
+    last_growth = time.time()
+    polls = 0
+    try:
+        while True:
+            poll_start = time.time()
+            for vna_file_name in _get_watched_files(path):
+                state = states.setdefault(vna_file_name, new_monitor_state())
+                size = os.path.getsize(vna_file_name)
+                if size < state["offset"]:
+                    logging.warning("WARNING: %s shrank - restarting its stats" % vna_file_name)
+                    state = states[vna_file_name] = new_monitor_state()
+                grew = False
+                # catch up in parts of WATCH_MAX_BYTES (e.g., when the monitor starts during an acquisition)
+                while size > state["offset"]:
+                    block, offset = parse_vna_rows(vna_file_name, state["offset"], columns=columns, dtype=dtype,
+                                                   max_bytes=WATCH_MAX_BYTES)
+                    if offset == state["offset"]:
+                        # incomplete last line
+                        break
+                    state["offset"] = offset
+                    filter_quality(block, min_snr, min_corr, rejected=state["rejected"])
+                    update_monitor_state(state, block, experiment_setup, spike_fill)
+                    grew = True
+                if grew:
+                    last_growth = time.time()
+                    live[vna_file_name] = get_live_stats(state, experiment_setup, window, tolerance)
+                    publish_live_stats(vna_file_name, live[vna_file_name])
+            polls += 1
+            if max_polls is not None and polls >= max_polls:
+                break
+            if idle_timeout is not None and time.time() - last_growth > idle_timeout:
+                print("- no new samples for %.1f s - stopping watch mode" % idle_timeout)
+                break
+            time.sleep(max(0., interval - (time.time() - poll_start)))
+    except KeyboardInterrupt:
+        print("- watch mode stopped")
+    return live
@@ -0,0 +1,110 @@
+"""Output formats for data series, spike counts, and stats summaries
+
+Note:
+    Every output artefact (see ARTEFACTS) can be written in another format. Parquet and Feather require pyarrow, and
+    HDF5 requires PyTables, which are optional dependencies that are only imported when the format is requested.
+"""
+import logging
+
+
+# file endings of output formats (none skips writing)
+OUTPUT_FORMATS = {
+    "xlsx": ".xlsx",
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "feather": ".feather",
+    "hdf5": ".h5",
+    "none": None,
+}
+# output artefacts: raw data series, spike counts, despiked data series, stats summaries, velocity spectra, and
+# sliding-window stats series (spectra and windowed stats are only calculated if their format is not none, which is
+# their default)
+ARTEFACTS = ["raw", "spikes", "despiked", "stats", "spectra", "windowed"]
+DEFAULT_OUTPUT_FORMATS = {artefact: "xlsx" for artefact in ARTEFACTS}
+DEFAULT_OUTPUT_FORMATS.update({"spectra": "none", "windowed": "none"})
+
+# formats that can be written chunk by chunk (streaming mode)
+APPENDABLE_FORMATS = ["csv", "hdf5", "none"]
+
+_REQUIRED_PACKAGES = {"parquet": "pyarrow", "feather": "pyarrow", "hdf5": "tables"}
+
+
+def get_output_formats(**output_formats):
+    """Complete and verify output formats of artefacts.
+
+    Args:
+        **output_formats: artefact names (see ARTEFACTS) as keywords and format names (see OUTPUT_FORMATS) as values;
+            missing artefacts get their default format
+
+    Returns:
+        dict: output formats of all ARTEFACTS
+    """
+    formats = dict(DEFAULT_OUTPUT_FORMATS)
+    for artefact, output_format in output_formats.items():
+        if artefact not in ARTEFACTS:
+            raise ValueError("Unknown output artefact {0} (available: {1})".format(artefact, ARTEFACTS))
+        if output_format is None:
+            continue
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError("Unknown output format {0} (available: {1})".format(output_format, list(OUTPUT_FORMATS)))
+        if output_format in _REQUIRED_PACKAGES:
+            try:
+                __import__(_REQUIRED_PACKAGES[output_format])
+            except ImportError as e:
+                raise ImportError("The {0} output format requires {1} (pip install {1}). {2}".format(
+                    output_format, _REQUIRED_PACKAGES[output_format], e))
+        formats[artefact] = output_format
+    return formats
+
+
+def write_table(df, file_stem, output_format="xlsx"):
+    """Write a pandas.DataFrame in the given output format.
+
+    Args:
+        df (pandas.DataFrame): table to write
+        file_stem (str): output file name without file ending (the ending is appended according to the format)
+        output_format (str): one of OUTPUT_FORMATS (default is xlsx)
+
+    Returns:
+        str: name of the written file (None if the output format is none)
+    """
+    if OUTPUT_FORMATS[output_format] is None:
+        return None
+    file_name = file_stem + OUTPUT_FORMATS[output_format]
+    if output_format == "xlsx":
+        df.to_excel(file_name)
+    elif output_format == "csv":
+        df.to_csv(file_name)
+    elif output_format == "parquet":
+        df.to_parquet(file_name)
+    elif output_format == "feather":
+        # feather does not store indices
+        df.reset_index().to_feather(file_name)
+    elif output_format == "hdf5":
+        df.to_hdf(file_name, key="data", mode="w")
+    logging.info("wrote %s" % file_name)
+    return file_name
+
+
+def append_table(df, file_stem, output_format="csv", append=False):
+    """Write a chunk of a pandas.DataFrame, appending to the file of previous chunks (see APPENDABLE_FORMATS).
+
+    Args:
+        df (pandas.DataFrame): chunk to write (its index should continue the index of the previous chunk)
+        file_stem (str): output file name without file ending (the ending is appended according to the format)
+        output_format (str): one of APPENDABLE_FORMATS (default is csv)
+        append (bool): append to the existing file; False (default) creates a new file with the first chunk
+
+    Returns:
+        str: name of the written file (None if the output format is none)
+    """
+    if output_format not in APPENDABLE_FORMATS:
+        raise ValueError("Cannot append to {0} files (available: {1})".format(output_format, APPENDABLE_FORMATS))
+    if OUTPUT_FORMATS[output_format] is None:
+        return None
+    file_name = file_stem + OUTPUT_FORMATS[output_format]
+    if output_format == "csv":
+        df.to_csv(file_name, mode="a" if append else "w", header=not append)
+    elif output_format == "hdf5":
+        df.to_hdf(file_name, key="data", mode="a" if append else "w", format="table", append=append)
+    return file_name
@@ -0,0 +1,181 @@
+"""Content-addressed cache of parsed measurement files
+
+Note:
+    Every cache entry holds the parsed columns of one measurement file as .npy files that are loaded with mmap. The
+    entries are keyed by the content hash of the file, the reader, the columns, and the dtype. An index (index.json)
+    maps file paths, sizes, and modification times to content hashes, so that unchanged files are not even re-hashed,
+    and records the last access of each entry for least-recently-used (LRU) eviction. Worker processes share the
+    index through a lock file, which is only held while the index is read and written (files are hashed and parsed
+    without the lock), so that lock files older than a few seconds are left over from killed processes.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+from contextlib import contextmanager, suppress
+import numpy as np
+from config import CACHE_MAX_BYTES
+
+
+INDEX_NAME = "index.json"
+LOCK_NAME = "index.lock"
+
+
+def hash_file(file_name, block_size=2 ** 20):
+    """Calculate the BLAKE2b content hash of a file.
+
+    Args:
+        file_name (str): name of the file to hash
+        block_size (int): number of bytes read at once
+
+    Returns:
+        str: hex digest
+    """
+    content_hash = hashlib.blake2b(digest_size=16)
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+
+def _read_index(cache_dir):
+    """Read the cache index (written with os.replace, so that it can be read without the lock)."""
+    try:
+        with open(os.path.join(cache_dir, INDEX_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"files": {}, "entries": {}}
+
+
+def _read_lock_holder(lock_file):
+    try:
+        with open(lock_file) as f:
+            return f.read().strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+@contextmanager
+def _locked_index(cache_dir, stale_age=30.):
+    """Lock the cache index (worker processes may share a cache) and yield it as dict; changes are written back.
+    The lock is only held while the index is read and written; locks older than stale_age seconds are left over from
+    killed processes and removed."""
+    os.makedirs(cache_dir, exist_ok=True)
+    lock_file = os.path.join(cache_dir, LOCK_NAME)
+    while True:
+        try:
+            lock = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                lock_age = time.time() - os.stat(lock_file).st_mtime
+            except FileNotFoundError:
+                # released in the meantime
+                continue
+            if lock_age > stale_age:
+                logging.warning("WARNING: removing stale cache lock %s of process %s" % (
+                    lock_file, _read_lock_holder(lock_file)))
+                with suppress(FileNotFoundError):
+                    os.remove(lock_file)
+                continue
+            time.sleep(0.01)
+    try:
+        os.write(lock, str(os.getpid()).encode())
+        index = _read_index(cache_dir)
+        yield index
+        index_file = os.path.join(cache_dir, INDEX_NAME)
+        with open(index_file + ".tmp", "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(index_file + ".tmp", index_file)
+    finally:
+        own_lock = os.fstat(lock)
+        os.close(lock)
+        # do not remove the lock of another process if this lock was removed as stale
+        with suppress(FileNotFoundError):
+            if os.path.samestat(own_lock, os.stat(lock_file)):
+                os.remove(lock_file)
+
+
+def _get_file_info(file_name, index):
+    """Look up the content hash of a file by path, size, and modification time in the index, and re-hash changed
+    files (without holding the lock of the index).
+
+    Returns:
+        tuple (str, dict): absolute path and size, modification time, and content hash of the file
+    """
+    stat = os.stat(file_name)
+    path = os.path.abspath(file_name)
+    known = index["files"].get(path)
+    if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+        return path, known
+    return path, {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": hash_file(file_name)}
+
+
+def _get_entry_id(content_hash, read_fun, columns, dtype):
+    signature = [content_hash, read_fun.__module__ + "." + read_fun.__name__, columns, np.dtype(dtype).str]
+    return hashlib.blake2b(json.dumps(signature).encode(), digest_size=16).hexdigest()
+
+
+def _evict(cache_dir, index, max_bytes):
+    """Remove least recently used entries until the cache size is below max_bytes."""
+    entries = index["entries"]
+    total = sum(e["bytes"] for e in entries.values())
+    for entry_id in sorted(entries, key=lambda e: entries[e]["last access"]):
+        if total <= max_bytes:
+            break
+        total -= entries[entry_id]["bytes"]
+        shutil.rmtree(os.path.join(cache_dir, entry_id), ignore_errors=True)
+        del entries[entry_id]
+
+
+def read_cached(file_name, read_fun, cache_dir, columns=None, dtype=np.float64, rebuild=False,
+                max_bytes=CACHE_MAX_BYTES):
+    """Return the parsed columns of a measurement file from the cache, or parse and cache them.
+
+    Args:
+        file_name (str): name of a measurement file, such as __8_16.5_6_T3.vna
+        read_fun (function): parser with the signature of vna_reader.parse_vna that returns a dict of np.arrays
+        cache_dir (str): directory of the cache (created if it does not exist)
+        columns (list): names of columns to read (default: all columns that read_fun returns)
+        dtype (np.dtype): float type of the arrays (np.float64 or np.float32)
+        rebuild (bool): re-parse the file even if it is cached and replace the cache entry (default: False)
+        max_bytes (int): maximum size of the cache; least recently used entries are evicted (default: config.CACHE_MAX_BYTES)
+
+    Returns:
+        dict: keys correspond to column names and values to (read-only, memory-mapped) np.arrays
+    """
+    # hashing long records takes seconds, so it is done before locking the index
+    path, file_info = _get_file_info(file_name, _read_index(cache_dir))
+    entry_id = _get_entry_id(file_info["hash"], read_fun, columns, dtype)
+    with _locked_index(cache_dir) as index:
+        index["files"][path] = file_info
+        entry = index["entries"].get(entry_id)
+        if entry and not rebuild:
+            entry["last access"] = time.time()
+    entry_dir = os.path.join(cache_dir, entry_id)
+    if entry and not rebuild:
+        try:
+            return {col: np.load(os.path.join(entry_dir, "%i.npy" % i), mmap_mode="r")
+                    for i, col in enumerate(entry["columns"])}
+        except (OSError, ValueError, EOFError) as e:
+            logging.warning("WARNING: re-parsing %s because of a damaged cache entry (%s)" % (file_name, e))
+
+    data = read_fun(file_name, columns=columns, dtype=dtype)
+    os.makedirs(entry_dir, exist_ok=True)
+    for i, values in enumerate(data.values()):
+        # write to a temporary file first, so that other processes never map a partially written file
+        npy_file = os.path.join(entry_dir, "%i.npy" % i)
+        with open("%s.%i.tmp" % (npy_file, os.getpid()), "wb") as f:
+            np.save(f, values)
+        os.replace("%s.%i.tmp" % (npy_file, os.getpid()), npy_file)
+    with _locked_index(cache_dir) as index:
+        index["entries"][entry_id] = {
+            "file": os.path.abspath(file_name),
+            "columns": list(data.keys()),
+            "bytes": sum(values.nbytes for values in data.values()),
+            "last access": time.time(),
+        }
+        _evict(cache_dir, index, max_bytes)
+    return data
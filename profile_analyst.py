@@ -7,6 +7,10 @@ Re-written in Python by Sebastian Schwindt (2022)
 # import standard Python libraries
 import sys
 import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 # import particular Python libraries
 try:
     import pandas as pd
@@ -18,106 +22,352 @@ except ImportError as e:
 # import global variable names from config
 from config import *
 from profile_plotter import *
-from flowstat import flowstat
-from rmspike import rmspike
+from flowstat import flowstat, update_moments, finalize_moments, get_stats, pad_series, batch_flowstat, stats_table
+from rmspike import rmspike, rmspike_block, despike, despike_sweep, get_despike_columns, get_spike_stats, FILL_METHODS
+from vna_reader import parse_vna, iter_vna_blocks, get_quality_columns, filter_quality, VELOCITY_COLUMNS
+import vno_reader
+from parse_cache import read_cached
+from run_manifest import load_manifest, save_manifest, get_run_parameters, get_outdated_files, record_files, \
+    get_recorded_stats
+from run_profiler import enable_profiling, disable_profiling, profiling_enabled, pop_records, add_records, \
+    profile_stage, file_size, write_profile_report, print_profile_summary, call_profiled
+from io_pipeline import iter_prefetched, background_writer
+from live_monitor import watch_vna
+from spectra import update_welch, finalize_welch, welch_psd, get_spectrum_stats, spectra_table
+from timescales import get_time_scale_series, get_time_scale_stats, TIME_SCALE_COLUMNS
+from bootstrap import bootstrap_tke, bootstrap_files, get_file_rng, BOOTSTRAP_COLUMNS
+from rolling_stats import get_window_samples, update_rolling, rolling_flowstat, rolling_table
+from experiment_catalog import vna_file_name2coordinates, open_catalog, scan_folders, select_files, mark_processed, \
+    catalog_table
+from output_writer import OUTPUT_FORMATS, ARTEFACTS, DEFAULT_OUTPUT_FORMATS, APPENDABLE_FORMATS, get_output_formats, \
+    write_table, append_table
 
+# analysis options of the pipelines and their defaults (see get_analysis_options)
+DEFAULT_ANALYSIS_OPTIONS = {"spike_fill": "nan", "plot_series": False, "dtype": np.float64, "min_snr": None,
+                            "min_corr": None, "time_scales": False, "bootstrap": None}
 
-def load_input_defs(file_name=SCRIPT_DIR+"input.xlsx"):
-    """loads provided input file name as pandas dataframe
+
+def read_input_file(file_name):
+    """Read experiment parameters from an input workbook (xlsx) or a toml or json input file.
 
     Args:
-        file_name (str): name of input file (default is input.xlsx)
+        file_name (str): name of input file; toml and json files hold the keys of config.INPUT_PARAMETERS, and other
+            files are read as workbooks with the labels of config.INPUT_PARAMETERS in column A (like input.xlsx)
 
     Returns:
-        (dict): user input of input.xlsx (or costum file, if provided)
+        dict: parameter values with the keys of config.INPUT_PARAMETERS
     """
+    file_ending = os.path.splitext(file_name)[1].lower()
+    if file_ending == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError as e:
+                raise ImportError("Reading toml input files requires Python 3.11 or tomli (pip install tomli). "
+                                  "{0}".format(e))
+        with open(file_name, "rb") as f:
+            return tomllib.load(f)
+    if file_ending == ".json":
+        with open(file_name) as f:
+            return json.load(f)
     input_xlsx_df = pd.read_excel(file_name, header=0, index_col=0)
-    return {
-        "folder name": input_xlsx_df["VALUE"]["Input folder name (tke-analyst/)"],
-        "profile": PROFILE_KEYS[input_xlsx_df["VALUE"]["ADV direction"]],
-        "bulk velocity": input_xlsx_df["VALUE"]["Flow velocity"],
-        "bulk depth": input_xlsx_df["VALUE"]["Water depth"],
-        "freq": input_xlsx_df["VALUE"]["ADV freq"],
-        "characteristic wood length": input_xlsx_df["VALUE"]["Characteristic log length dimension"],
-        "despiking method": input_xlsx_df["VALUE"]["Spike detection method"],
-        "lambda a": input_xlsx_df["VALUE"]["Despike lambda a"],
-        "despike k": input_xlsx_df["VALUE"]["Despike k"],
-    }
-
-
-def read_vna(vna_file_name):
+    return {key: input_xlsx_df["VALUE"][label] for key, (label, _) in INPUT_PARAMETERS.items()}
+
+
+def parse_setting(setting):
+    """Parse a KEY=VALUE command line setting of an experiment parameter (values are parsed as json if possible,
+    e.g., 200 or 1.5, and used as strings otherwise, e.g., data/test-example).
+
+    Returns:
+        tuple (str, object): parameter key and value
+    """
+    key, sep, value = setting.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError("expected KEY=VALUE, got %s" % setting)
+    try:
+        return key.strip(), json.loads(value)
+    except ValueError:
+        return key.strip(), value
+
+
+def load_input_defs(file_name=SCRIPT_DIR+"input.xlsx", overrides=None):
+    """loads experiment parameters from an input file (see read_input_file) and command line settings
+
+    Args:
+        file_name (str): name of input file (default is input.xlsx); None uses only the overrides
+        overrides (dict): parameter values with the keys of config.INPUT_PARAMETERS that replace values of the input
+            file (default: None)
+
+    Returns:
+        (dict): user input of input.xlsx (or costum file, if provided)
+    """
+    values = read_input_file(file_name) if file_name else {}
+    values.update(overrides or {})
+    unknown = [key for key in values if key not in INPUT_PARAMETERS]
+    if unknown:
+        raise ValueError("Unknown input parameter(s): {0} (available: {1})".format(unknown, list(INPUT_PARAMETERS)))
+    missing = [key for key in INPUT_PARAMETERS if key not in values]
+    if missing:
+        raise ValueError("Missing input parameter(s): {0} (define them in the input file or with --set)".format(
+            missing))
+    setup = {setup_key: values[key] for key, (_, setup_key) in INPUT_PARAMETERS.items()}
+    if setup["profile"] not in PROFILE_KEYS.values():
+        setup["profile"] = PROFILE_KEYS[setup["profile"]]
+    return setup
+
+
+def read_vna(vna_file_name, columns=None, dtype=np.float64):
     """Read vna file name as pandas dataframe.
 
     Args:
         vna_file_name (str): name of a vna file, such as __8_16.5_6_T3.vna
+        columns (list): names of columns to read (default: all columns of vna_reader.VNA_COLUMNS except skip1 and skip2)
+        dtype (np.dtype): float type of the columns (default is np.float64)
 
     Returns:
         pd.DataFrame
     """
-    col_names = ["skip1", "time (s)", "sample no.", "skip2",
-                 "u (m/s)", "v (m/s)", "w1 (m/s)", "w2 (m/s)",
-                 "ampl. x (dB)", "ampl. y (dB)", "ampl. z1 (dB)", "ampl. z2 (dB)",
-                 "SNR x", "SNR y", "SNR z1", "SNR z2",
-                 "corr x", "corr y", "corr z1", "corr z2"]
-    return pd.read_csv(vna_file_name,
-                       sep="\s+",
-                       header=None,
-                       names=col_names,
-                       usecols=lambda x: x not in ["skip1", "skip2"])
-
-
-def vna_file_name2coordinates(vna_file_name):
-    """Take vna file name and extract x, y, and z coordinates in meters.
-    Non-convertible numbers are translated into np.nan with warning.
+    return pd.DataFrame(parse_vna(vna_file_name, columns=columns, dtype=dtype))
+
+
+def read_vno(vno_file_name, columns=None, dtype=np.float64):
+    """Read binary vno file name as pandas dataframe with the same columns as read_vna.
 
     Args:
-        vna_file_name (str): name of a vna file, such as __8_16.5_6_T3.vna
+        vno_file_name (str): name of a vno file, such as __8_16.5_6_T3.vno
+        columns (list): names of columns to read (default: all columns that read_vna returns)
+        dtype (np.dtype): float type of the columns (default is np.float64)
 
     Returns:
-        list [x, y, z] coordinates
+        pd.DataFrame
     """
-    # replace __ with minus, remove file ending and split coordinates with _
-    xyz_list = vna_file_name.replace("__", "-").strip(".vna").split("_")[0:3]
-    for i, coord in enumerate(xyz_list):
-        try:
-            xyz_list[i] = float(coord) / 100.
-        except ValueError:
-            logging.warning("WARNING: Could not convert {0} to coordinate in file {1}".format(
-                str(coord), vna_file_name))
-            xyz_list[i] = np.nan
-    return xyz_list
+    return pd.DataFrame(vno_reader.read_vno(vno_file_name, columns=columns, dtype=dtype))
 
 
-def get_data_info(folder_name="test-example"):
+def read_measurement(vna_fn, target_folder, columns=None, dtype=np.float64, use_cache=True, rebuild_cache=False,
+                     min_snr=None, min_corr=None):
+    """Read the columns of a vna (or binary vno) file and replace velocities of samples with low beam quality with NaN
+    (see vna_reader.filter_quality). Without cache, the quality filter is applied block by block while parsing; the
+    parse cache holds unfiltered columns (shared by runs with other thresholds) that are filtered after loading.
+    Profiled as read stage.
+
+    Args:
+        vna_fn (str): name of a vna (or binary vno) file, such as __8_16.5_6_T3.vna
+        target_folder (str): directory where the vna file lives
+        columns (list): names of columns to read (default: all columns of vna_reader.VNA_COLUMNS except skip1 and skip2)
+        dtype (np.dtype): float type of the columns (np.float64 or np.float32; default is np.float64)
+        use_cache (bool): load parsed columns from the parse cache in target_folder/CACHE_FOLDER (default: True)
+        rebuild_cache (bool): re-parse the file and replace its parse cache entry (default: False)
+        min_snr (float): minimum beam signal-to-noise ratio in dB of valid samples (default: None, i.e., no filter)
+        min_corr (float): minimum beam correlation in % of valid samples (default: None, i.e., no filter)
+
+    Returns:
+        tuple (dict, dict): columns (np.arrays) and counts of rejected samples per velocity column (empty without
+        thresholds)
+    """
+    file_name = target_folder + "/" + vna_fn
+    read_fun = vno_reader.read_vno if vna_fn.endswith(".vno") else parse_vna
+    rejected = {}
+    with profile_stage("read", vna_fn) as record:
+        if use_cache:
+            data = read_cached(file_name, read_fun, cache_dir=target_folder + "/" + CACHE_FOLDER,
+                               columns=get_quality_columns(columns, min_snr, min_corr), dtype=dtype,
+                               rebuild=rebuild_cache)
+            filter_quality(data, min_snr, min_corr, rejected)
+            if columns is not None:
+                data = {col: data[col] for col in columns}
+        else:
+            data = read_fun(file_name, columns=columns, dtype=dtype, min_snr=min_snr, min_corr=min_corr,
+                            rejected=rejected)
+        record.update({"rows": len(next(iter(data.values()), [])), "bytes read": file_size(file_name)})
+    return data, rejected
+
+
+def write_artefact(stage, vna_fn, table, file_stem, output_format):
+    """Write a per-file artefact with output_writer.write_table (profiled as stage).
+
+    Args:
+        stage (str): name of the profile stage, such as raw write
+        vna_fn (str): name of the measurement file of the artefact
+        table (pandas.DataFrame): data to write
+        file_stem (str): output file name without file ending
+        output_format (str): one of output_writer.OUTPUT_FORMATS (none does not write)
+    """
+    with profile_stage(stage, vna_fn, rows=len(table)) as record:
+        record["bytes written"] = file_size(write_table(table, file_stem, output_format))
+
+
+def get_read_columns(output_formats):
+    """Get the columns that the per-file pipeline reads: all columns if raw or despiked data series are written, and
+    only time and velocities otherwise (see vna_reader.VELOCITY_COLUMNS).
+
+    Args:
+        output_formats (dict): output formats of artefacts (see output_writer.get_output_formats)
+
+    Returns:
+        list: column names (None for all columns)
+    """
+    return None if output_formats["raw"] != "none" or output_formats["despiked"] != "none" else VELOCITY_COLUMNS
+
+
+def get_stream_formats(output_formats):
+    """Get the output formats of artefacts in streaming mode, where data series (raw, despiked, and windowed) are
+    only written in formats that support appending (see output_writer.APPENDABLE_FORMATS) and skipped otherwise.
+
+    Args:
+        output_formats (dict): output formats of artefacts (see output_writer.get_output_formats)
+
+    Returns:
+        dict: output formats of all artefacts (none for skipped data series)
+    """
+    return {artefact: "none" if artefact in ["raw", "despiked", "windowed"] and output_format not in APPENDABLE_FORMATS
+            else output_format for artefact, output_format in output_formats.items()}
+
+
+def get_analysis_options(**options):
+    """Complete and verify the analysis options of the per-file, streaming, and batch pipelines.
+
+    Args:
+        **options: spike_fill, plot_series, dtype, min_snr, min_corr, time_scales, and bootstrap (see
+            analyze_vna_files) as keywords; missing options get their default (see DEFAULT_ANALYSIS_OPTIONS)
+
+    Returns:
+        dict: values of all analysis options
+    """
+    for option in options:
+        if option not in DEFAULT_ANALYSIS_OPTIONS:
+            raise ValueError("Unknown analysis option {0} (available: {1})".format(
+                option, list(DEFAULT_ANALYSIS_OPTIONS)))
+    return dict(DEFAULT_ANALYSIS_OPTIONS, **options)
+
+
+def get_read_options(options):
+    """Get the float type and quality filter keywords of read_measurement from analysis options (see
+    get_analysis_options)."""
+    return {"dtype": options["dtype"], "min_snr": options["min_snr"], "min_corr": options["min_corr"]}
+
+
+def get_component_columns(profile_type):
+    """Get the velocity columns of the u, v, and w stats (w is w2 unless profile_type is lp, like in the TKE)."""
+    return ["u (m/s)", "v (m/s)", "w1 (m/s)" if profile_type == "lp" else "w2 (m/s)"]
+
+
+def get_stats_sections(vna_file_names, velocities, stats, experiment_setup, options, output_formats, lengths=None,
+                       workers=1, description=""):
+    """Calculate the optional stats sections (see flowstat.STATS_SECTIONS) of the u, v, and w series of one file or of
+    many files: integral time scales (see timescales.py), bootstrap confidence intervals (see bootstrap.py), and
+    velocity spectra (see spectra.py).
+
+    Args:
+        vna_file_names (list): names of the files of the series (seed the bootstrap, see bootstrap.get_file_rng)
+        velocities (list): u, v, and w series (see get_component_columns) of one file, or NaN-padded (files, samples)
+            arrays of many files (see flowstat.pad_series)
+        stats (dict): flowstat stats of one file or batch_flowstat stats of many files
+        experiment_setup (dict): the result of the load_input_defs function
+        options (dict): analysis options (see get_analysis_options)
+        output_formats (dict): output formats of artefacts (spectra are only calculated if the spectra format is not
+            none)
+        lengths (np.array): numbers of samples of the padded series of many files (default: None, i.e., one file)
+        workers (int): number of worker processes of the bootstrap of many files (default: 1)
+        description (str): description of the series in progress messages, such as " with despiked data"
+
+    Returns:
+        tuple (dict, tuple): stats of the enabled sections, and frequencies and PSDs of the velocity spectra (None if
+        the spectra format is none)
+    """
+    sections = {}
+    spectrum = None
+    file = vna_file_names[0] if lengths is None else None
+    rows = velocities[0].size if lengths is None else int(lengths.sum())
+    if options["time_scales"]:
+        print(" * calculating integral time scales%s ..." % description)
+        with profile_stage("time scales", file, rows=rows):
+            sections["time scales"] = get_time_scale_stats(get_time_scale_series(*velocities, stats), stats,
+                                                           freq=experiment_setup["freq"])
+    if options["bootstrap"] is not None:
+        print(" * calculating bootstrap confidence intervals%s ..." % description)
+        with profile_stage("bootstrap", file, rows=rows):
+            # the file seeds draw the same blocks with spikes and despiked
+            if lengths is None:
+                sections["bootstrap"] = bootstrap_tke(*velocities, freq=experiment_setup["freq"],
+                                                      rng=get_file_rng(file, options["bootstrap"]))
+            else:
+                sections["bootstrap"] = bootstrap_files(
+                    [[series[i, :lengths[i]] for series in velocities] for i in range(len(lengths))], vna_file_names,
+                    freq=experiment_setup["freq"], seed=options["bootstrap"], workers=workers)
+    if output_formats["spectra"] != "none":
+        print(" * calculating velocity spectra%s ..." % description)
+        with profile_stage("spectra", file, rows=rows):
+            spectrum = welch_psd(np.stack(velocities, axis=-2), freq=experiment_setup["freq"],
+                                 lengths=None if lengths is None else np.broadcast_to(
+                                     lengths[:, np.newaxis], (len(lengths), len(velocities))))[:2]
+        sections["spectrum"] = get_spectrum_stats(*spectrum)
+    return sections, spectrum
+
+
+def write_section_artefacts(vna_fn, target_folder, time, velocities, spectra, experiment_setup, output_formats,
+                            write_fun=write_artefact):
+    """Write the velocity spectra (NAME-spectra) of a file, and calculate and write its sliding-window stats
+    (NAME-windowed, see rolling_stats.py) if their output formats are not none.
+
+    Args:
+        vna_fn (str): name of the measurement file
+        target_folder (str): directory where the outputs are written to
+        time (np.array): time stamps in s of the file
+        velocities (list): despiked u, v, and w series of the file (see get_component_columns)
+        spectra (tuple): frequencies, and PSDs with spikes and despiked of the file (see get_stats_sections)
+        experiment_setup (dict): the result of the load_input_defs function
+        output_formats (dict): output formats of artefacts (see output_writer.ARTEFACTS)
+        write_fun (function): function with the signature of write_artefact (default: write_artefact)
+    """
+    vna_name = os.path.splitext(vna_fn)[0]
+    if output_formats["spectra"] != "none":
+        write_fun("spectra write", vna_fn, spectra_table(*spectra), target_folder + "/%s-spectra" % vna_name,
+                  output_formats["spectra"])
+    if output_formats["windowed"] != "none":
+        with profile_stage("windowed", vna_fn, rows=time.size):
+            windowed = rolling_flowstat(time, *velocities, *get_window_samples(experiment_setup["freq"]))
+        write_fun("windowed write", vna_fn, rolling_table(windowed), target_folder + "/%s-windowed" % vna_name,
+                  output_formats["windowed"])
+
+
+def get_data_info(folder_name="test-example", vna_file_names=None):
     """get names of input file names and prepare output matrix according to
     number of files
 
     Args:
         folder_name (str): name of the test (experiment) to analyze (default is test-example)
-        input_file_name (str): name of input file (default is input.xlsx)
+        vna_file_names (list): names of the files to analyze, such as a selection of the experiment catalog (default:
+            None, i.e., all vna files of the folder and vno files without vna export)
 
     Returns:
-        pd.DataFrame with row names corresponding to file names ending on .vna,
+        pd.DataFrame with row names corresponding to file names ending on .vna (or .vno if there is no vna export),
         and columns X, Y, Z in meters
     """
-    # get vna file names
-    vna_file_names = [f for f in os.listdir(
-        SCRIPT_DIR + folder_name) if f.endswith(".vna")]
+    if vna_file_names is None:
+        # get vna file names and binary vno files that were not exported to vna
+        file_names = os.listdir(SCRIPT_DIR + folder_name)
+        vna_file_names = [f for f in file_names if f.endswith(".vna")]
+        vna_file_names += [f for f in file_names if f.endswith(".vno") and not (f[:-4] + ".vna") in file_names]
 
     # construct dataframe with x-y-z positions of the probe
     probe_position_df = pd.DataFrame(
         data=[vna_file_name2coordinates(vna_fn) for vna_fn in vna_file_names],
-        index=[s.strip(".vna") for s in vna_file_names],
+        index=[os.path.splitext(s)[0] for s in vna_file_names],
         columns=["x (m)", "y (m)", "z (m)"]
     )
     return {"vna files": vna_file_names, "probe positions": probe_position_df}
 
 
-def build_stats_summary(vna_stats_dict, experiment_info, profile_type, bulk_velocity, log_length):
-    """Re-organize the stats dataset and assign probe coordinates
+def build_stats_summary(vna_names, vna_stats, experiment_info, profile_type, bulk_velocity, log_length):
+    """Assign probe coordinates to the stats table and add normalized parameters
 
     Args:
-        vna_stats_dict (dict): the result of all vna files processed with the flowstat.flowstat function
+        vna_names (list): vna file names (without ending) that correspond to the rows of vna_stats
+        vna_stats (np.array): stats table of all vna files (see flowstat.stats_table)
         experiment_info (dict): the result of the get_data_info function for retrieving probe positions
         profile_type (str): profile orientation as a function of sensor position; the default is lp corresponding to DOWN (ignores w2 measurements)
         bulk_velocity (float): bulk streamwise flow velocity in m/s (from input.xlsx)
@@ -126,82 +376,61 @@ def build_stats_summary(vna_stats_dict, experiment_info, profile_type, bulk_velo
     Returns:
         Organized overview pandas.DataFrame with measurement stats, ready for dumping to workbook
     """
-
-    data = []
-    for vna_fn, vna_stats in vna_stats_dict.items():
-        data.append([
-            experiment_info["probe positions"]["x (m)"][vna_fn],
-            experiment_info["probe positions"]["y (m)"][vna_fn],
-            experiment_info["probe positions"]["z (m)"][vna_fn],
-            vna_stats["u STAT (m/s)"]["average"], vna_stats["u STAT (m/s)"]["stderr"], vna_stats["u STAT (m/s)"]["std"],
-            vna_stats["v STAT (m/s)"]["average"], vna_stats["v STAT (m/s)"]["stderr"], vna_stats["v STAT (m/s)"]["std"],
-            vna_stats["w STAT (m/s)"]["average"], vna_stats["w STAT (m/s)"]["stderr"], vna_stats["w STAT (m/s)"]["std"],
-            vna_stats["TKE (m^2/s^2)"],
-            vna_stats["tau_v STAT (m^2/s^2)"]["average"], vna_stats["tau_v STAT (m^2/s^2)"]["stderr"],
-            vna_stats["tau_v STAT (m^2/s^2)"]["std"],
-            vna_stats["tau_w STAT (m^2/s^2)"]["average"], vna_stats["tau_w STAT (m^2/s^2)"]["stderr"],
-            vna_stats["tau_w STAT (m^2/s^2)"]["std"],
-        ]
-        )
-        # append u_norm, x_norm, TKE_norm and TKE-ad
-        data[-1].extend([
-            vna_stats["u STAT (m/s)"]["average"] / bulk_velocity,
-            experiment_info["probe positions"]["x (m)"][vna_fn] / log_length,
-            vna_stats["TKE (m^2/s^2)"] / (bulk_velocity ** 2),
-            0.5 * (vna_stats["u STAT (m/s)"]["std"] ** 2 + vna_stats["v STAT (m/s)"]["std"] ** 2) / (
-                        bulk_velocity ** 2),
-        ]
-        )
-        if not(profile_type == "lp"):
-            data[-1].extend(
-                [vna_stats["w2 STAT (m/s)"]["average"], vna_stats["w2 STAT (m/s)"]["stderr"],
-                 vna_stats["w2 STAT (m/s)"]["std"], vna_stats["TKE2 (m^2/s^2)"],
-                 vna_stats["tau_w2 STAT (m^2/s^2)"]["average"], vna_stats["tau_w2 STAT (m^2/s^2)"]["stderr"],
-                 vna_stats["tau_w2 STAT (m^2/s^2)"]["std"],
-                 ]
-            )
-
-    column_headers = ["x (m)", "y (m)", "z (m)"]
-    for par, stats in vna_stats_dict[list(vna_stats_dict.keys())[0]].items():
-        if type(stats) is dict:
-            for stat_type in stats.keys():
-                if (profile_type == "lp") and not(("w2" in par) or ("TKE2" in par)):
-                    column_headers.append(par.replace("STAT", stat_type))
-                if not(profile_type == "lp"):
-                    column_headers.append(par.replace("STAT", stat_type))
-        else:
-            if (profile_type == "lp") and not ("TKE2" in par):
-                column_headers.append(par)
-            if not(profile_type == "lp"):
-                column_headers.append(par)
-    column_headers.extend(["u norm. (-)", "x norm. (-)", "TKE norm. (-)", "TKE 2d norm. (-)"])
-
-    return pd.DataFrame(
-        data=data,
-        columns=column_headers,
-        index=list(vna_stats_dict.keys())
-    )
+    positions = experiment_info["probe positions"].reindex(vna_names)[["x (m)", "y (m)", "z (m)"]].to_numpy()
+    summary = {"x (m)": positions[:, 0], "y (m)": positions[:, 1], "z (m)": positions[:, 2]}
+    summary.update({col: vna_stats[col] for col in vna_stats.dtype.names})
+    summary.update({
+        "u norm. (-)": vna_stats["u average (m/s)"] / bulk_velocity,
+        "x norm. (-)": positions[:, 0] / log_length,
+        "TKE norm. (-)": vna_stats["TKE (m^2/s^2)"] / (bulk_velocity ** 2),
+        "TKE 2d norm. (-)": 0.5 * (vna_stats["u std (m/s)"] ** 2 + vna_stats["v std (m/s)"] ** 2) / (
+                bulk_velocity ** 2),
+    })
+    return pd.DataFrame(summary, index=list(vna_names))
 
 
-@log_actions
-def process_vna_files(input_file_name):
-    """Main function controlling vna file processing.
-    Writes full despiked data series and stats series to xlsx workbooks.
+def process_vna_file(vna_fn, target_folder, experiment_setup, use_cache=True, rebuild_cache=False,
+                     output_formats=None, options=None, measurement=None, write_fun=write_artefact):
+    """Run the per-file pipeline: read, dump raw data, calculate stats, despike, and re-calculate stats.
 
     Args:
-        input_file_name (str): name of input file with experiment metrics (default is input.xlsx in script folder)
+        vna_fn (str): name of a vna (or binary vno) file, such as __8_16.5_6_T3.vna
+        target_folder (str): directory where the vna file lives and outputs are written to
+        experiment_setup (dict): the result of the load_input_defs function
+        use_cache (bool): load parsed columns from the parse cache in target_folder/CACHE_FOLDER (default: True)
+        rebuild_cache (bool): re-parse the file and replace its parse cache entry (default: False)
+        output_formats (dict): output formats of the raw, spikes, and despiked artefacts (see output_writer.ARTEFACTS;
+            default is xlsx for all)
+        options (dict): spike fill, float type, quality filter, time scales, bootstrap, and plot options (see
+            get_analysis_options; default: None, i.e., the defaults of all options)
+        measurement (tuple): result of read_measurement if the file was read in advance (default: None reads the file)
+        write_fun (function): function with the signature of write_artefact that writes the artefacts (default:
+            write_artefact; the tables are not modified after they are passed, so writes may run in the background)
+
+    Returns:
+        tuple (str, dict, dict): vna file name without ending, stats with spikes, and despiked stats (both flowstat.flowstat stats)
     """
-    experiment_setup = load_input_defs(file_name=input_file_name)
-    experiment_meta = get_data_info(experiment_setup["folder name"])
-    target_folder = SCRIPT_DIR + experiment_setup["folder name"]
-    vna_stats_dict = {}
-    vna_stats_dict_despiked = {}
-    for vna_fn in experiment_meta["vna files"]:
-        print("\n   *** *** processing %s *** ***" % vna_fn)
-        vna_df = read_vna(target_folder + "/" + vna_fn)
-        print(" * writing raw data to %s " % str(target_folder + "/%s-raw.xlsx" % vna_fn.split(".vna")[0]))
-        vna_df.to_excel(str(target_folder + "/%s-raw.xlsx" % vna_fn.split(".vna")[0]))
-        print(" * calculating file stats ...")
+    print("\n   *** *** processing %s *** ***" % vna_fn)
+    vna_name = os.path.splitext(vna_fn)[0]
+    output_formats = get_output_formats(**(output_formats or {}))
+    options = get_analysis_options(**(options or {}))
+    if measurement is None:
+        measurement = read_measurement(vna_fn, target_folder, columns=get_read_columns(output_formats),
+                                       use_cache=use_cache, rebuild_cache=rebuild_cache, **get_read_options(options))
+    vna_data, rejected = measurement
+    vna_df = pd.DataFrame(vna_data)
+    if rejected:
+        print(" * rejected %s samples with beam SNR < %s or correlation < %s" % (
+            "/".join(str(rejected.get(col, 0)) for col in get_despike_columns(experiment_setup["profile"])),
+            options["min_snr"], options["min_corr"]))
+    if output_formats["raw"] != "none":
+        print(" * writing raw data to %s " % str(target_folder + "/%s-raw%s" % (
+            vna_name, OUTPUT_FORMATS[output_formats["raw"]])))
+    # rmspike replaces the velocities of vna_df: the raw data are written from a separate data frame
+    write_fun("raw write", vna_fn, pd.DataFrame(vna_data) if output_formats["raw"] != "none" else vna_df,
+              target_folder + "/%s-raw" % vna_name, output_formats["raw"])
+    print(" * calculating file stats ...")
+    with profile_stage("flowstat", vna_fn, rows=len(vna_df)):
         vna_time_series, vna_stats = flowstat(time=vna_df["time (s)"].to_numpy(),
                                               u=vna_df["u (m/s)"].to_numpy(),
                                               v=vna_df["v (m/s)"].to_numpy(),
@@ -209,8 +438,14 @@ def process_vna_files(input_file_name):
                                               w2=vna_df["w2 (m/s)"].to_numpy(),
                                               profile_type=experiment_setup["profile"]
                                               )
-        vna_stats_dict.update({vna_fn.split(".vna")[0]: vna_stats})
-        print(" * launching spike removal ...")
+    component_cols = get_component_columns(experiment_setup["profile"])
+    sections, spectrum = get_stats_sections([vna_fn], [vna_df[col].to_numpy() for col in component_cols], vna_stats,
+                                            experiment_setup, options, output_formats)
+    vna_stats.update(sections)
+    print(" * launching spike removal ...")
+    despike_cols = get_despike_columns(experiment_setup["profile"])
+    raw_velocities = {col: vna_df[col].to_numpy(copy=True) for col in despike_cols} if options["plot_series"] else None
+    with profile_stage("rmspike", vna_fn, rows=len(vna_df)):
         spike_df, vna_df = rmspike(
             vna_df,
             u_stats=vna_stats["u STAT (m/s)"],
@@ -221,14 +456,27 @@ def process_vna_files(input_file_name):
             lambda_a=experiment_setup["lambda a"],
             k=experiment_setup["despike k"],
             method=experiment_setup["despiking method"],
-            profile_type=experiment_setup["profile"]
+            profile_type=experiment_setup["profile"],
+            fill=options["spike_fill"],
+            rejected=rejected
         )
-        print(" *  Writing spike counts to %s " % str(target_folder + "/%s-spikes.xlsx" % vna_fn.split(".vna")[0]))
-        spike_df.to_excel(target_folder + "/%s-spikes.xlsx" % vna_fn.split(".vna")[0])
-        print(" *  Writing de-spiked data to %s " % str(target_folder + "/%s-despiked.xlsx" % vna_fn.split(".vna")[0]))
-        spike_df.to_excel(target_folder + "/%s-spikes.xlsx" % vna_fn.split(".vna")[0])
+    if output_formats["spikes"] != "none":
+        print(" *  Writing spike counts to %s " % str(target_folder + "/%s-spikes%s" % (
+            vna_name, OUTPUT_FORMATS[output_formats["spikes"]])))
+    write_fun("spikes write", vna_fn, spike_df, target_folder + "/%s-spikes" % vna_name, output_formats["spikes"])
+    if output_formats["despiked"] != "none":
+        print(" *  Writing de-spiked data to %s " % str(target_folder + "/%s-despiked%s" % (
+            vna_name, OUTPUT_FORMATS[output_formats["despiked"]])))
+    write_fun("despiked write", vna_fn, vna_df, target_folder + "/%s-despiked" % vna_name, output_formats["despiked"])
+    if options["plot_series"]:
+        print(" *  Plotting velocity series and spike diagnostics to %s " % str(
+            target_folder + "/%s-velocity.png (and -spike-diagnostics.png)" % vna_name))
+        with profile_stage("plot", vna_fn, rows=len(vna_df)):
+            submit_plot_series(vna_df["time (s)"].to_numpy(), raw_velocities,
+                               {col: vna_df[col].to_numpy() for col in despike_cols}, target_folder + "/" + vna_name)
 
-        print(" * re-calculating stats with despiked data ...")
+    print(" * re-calculating stats with despiked data ...")
+    with profile_stage("flowstat", vna_fn, rows=len(vna_df)):
         vna_time_series, vna_stats_despiked = flowstat(time=vna_df["time (s)"].to_numpy(),
                                                        u=vna_df["u (m/s)"].to_numpy(),
                                                        v=vna_df["v (m/s)"].to_numpy(),
@@ -236,33 +484,757 @@ def process_vna_files(input_file_name):
                                                        w2=vna_df["w2 (m/s)"].to_numpy(),
                                                        profile_type=experiment_setup["profile"]
                                                        )
-        vna_stats_dict_despiked.update({vna_fn.split(".vna")[0]: vna_stats_despiked})
-
-    print("- Writing data stats with spikes to %s " % str(target_folder + "/stats-with-spikes.xlsx"))
-    stats4write_df = build_stats_summary(
-        vna_stats_dict=vna_stats_dict,
-        experiment_info=experiment_meta,
-        bulk_velocity=experiment_setup["bulk velocity"],
-        profile_type=experiment_setup["profile"],
-        log_length=experiment_setup["characteristic wood length"]
-    )
-    stats4write_df.to_excel(target_folder + "/stats-with-spikes.xlsx")
+    velocities = [vna_df[col].to_numpy() for col in component_cols]
+    sections, spectrum_despiked = get_stats_sections([vna_fn], velocities, vna_stats_despiked, experiment_setup,
+                                                     options, output_formats, description=" with despiked data")
+    vna_stats_despiked.update(sections)
+    if output_formats["spectra"] != "none":
+        print(" *  Writing velocity spectra to %s " % str(target_folder + "/%s-spectra%s" % (
+            vna_name, OUTPUT_FORMATS[output_formats["spectra"]])))
+    if output_formats["windowed"] != "none":
+        print(" *  Writing sliding-window stats with despiked data to %s " % str(target_folder + "/%s-windowed%s" % (
+            vna_name, OUTPUT_FORMATS[output_formats["windowed"]])))
+    spectra = None if spectrum is None else (*spectrum, spectrum_despiked[1])
+    write_section_artefacts(vna_fn, target_folder, vna_df["time (s)"].to_numpy(), velocities, spectra,
+                            experiment_setup, output_formats, write_fun=write_fun)
+    return vna_name, vna_stats, vna_stats_despiked
+
+
+def iter_file_blocks(file_name, columns=None, chunk_rows=STREAM_CHUNK_ROWS, dtype=np.float64, min_snr=None,
+                     min_corr=None, rejected=None):
+    """Read a vna (or binary vno) file in chunks of chunk_rows samples.
+
+    Args:
+        file_name (str): name of a vna or vno file, such as __8_16.5_6_T3.vna
+        columns (list): names of columns to read (default: all columns of vna_reader.VNA_COLUMNS except skip1 and skip2)
+        chunk_rows (int): maximum number of samples per chunk (default: config.STREAM_CHUNK_ROWS)
+        dtype (np.dtype): float type of the columns (default is np.float64)
+        min_snr (float): minimum beam signal-to-noise ratio in dB of valid samples (default: None; see
+            vna_reader.filter_quality)
+        min_corr (float): minimum beam correlation in % of valid samples (default: None)
+        rejected (dict): counts of rejected samples per velocity column that are incremented (default: None)
+
+    Returns:
+        generator of dicts with column names as keys and np.arrays of one chunk as values
+    """
+    if file_name.endswith(".vno"):
+        return vno_reader.iter_vno_blocks(file_name, columns=columns, dtype=dtype, block_rows=chunk_rows,
+                                          min_snr=min_snr, min_corr=min_corr, rejected=rejected)
+    return iter_vna_blocks(file_name, columns=columns, dtype=dtype, block_rows=chunk_rows, min_snr=min_snr,
+                           min_corr=min_corr, rejected=rejected)
+
+
+def process_vna_file_streaming(vna_fn, target_folder, experiment_setup, chunk_rows=STREAM_CHUNK_ROWS,
+                               output_formats=None, options=None):
+    """Run the per-file pipeline of process_vna_file in chunks, which keeps the memory usage independent of the
+    length of the record. A first pass over the chunks accumulates the stats with online moments (see
+    flowstat.update_moments), and a second pass despikes the chunks (see rmspike.rmspike_block) and accumulates the
+    despiked stats. Velocity spectra are accumulated segment by segment in both passes (see spectra.update_welch), and
+    sliding-window stats of the despiked chunks window by window (see rolling_stats.update_rolling). Data series
+    (including the sliding-window stats) can only be written in formats that support appending (see
+    output_writer.APPENDABLE_FORMATS); other series formats are skipped with a warning. The parse cache is not used.
+
+    Args:
+        vna_fn (str): name of a vna (or binary vno) file, such as __8_16.5_6_T3.vna
+        target_folder (str): directory where the vna file lives and outputs are written to
+        experiment_setup (dict): the result of the load_input_defs function
+        chunk_rows (int): number of samples per chunk (default: config.STREAM_CHUNK_ROWS)
+        output_formats (dict): output formats of the raw, spikes, and despiked artefacts (see output_writer.ARTEFACTS;
+            default is xlsx for all)
+        options (dict): analysis options (see get_analysis_options); the spike fill is nan or last-valid (linear
+            requires complete records), and plots, time scales, and bootstrap confidence intervals are not available
+            in streaming mode (a warning is logged, and the time scale stats and confidence intervals are NaN)
+
+    Returns:
+        tuple (str, dict, dict): vna file name without ending, stats with spikes, and despiked stats (both flowstat.flowstat stats)
+    """
+    options = get_analysis_options(**(options or {}))
+    if experiment_setup["despiking method"] == "phase-space":
+        raise ValueError("The phase-space despiking method requires complete records and is not available in "
+                         "streaming mode (select velocity or acceleration in the input file)")
+    if options["spike_fill"] == "linear":
+        raise ValueError("Linear spike interpolation requires complete records and is not available in streaming mode")
+    print("\n   *** *** processing %s in chunks of %i samples *** ***" % (vna_fn, chunk_rows))
+    vna_name = os.path.splitext(vna_fn)[0]
+    file_name = target_folder + "/" + vna_fn
+    profile_type = experiment_setup["profile"]
+    w_col = "w1 (m/s)" if profile_type == "lp" else "w2 (m/s)"
+    pairs = [(0, 1), (0, 2)]
+    output_formats = get_output_formats(**(output_formats or {}))
+    spectra = output_formats["spectra"] != "none"
+    component_cols = get_component_columns(profile_type)
+    if options["plot_series"]:
+        logging.warning("WARNING: velocity series of %s cannot be plotted in streaming mode - skipping" % vna_fn)
+    if options["time_scales"]:
+        logging.warning("WARNING: integral time scales of %s require the complete record and are not available in "
+                        "streaming mode - skipping" % vna_fn)
+    if options["bootstrap"] is not None:
+        logging.warning("WARNING: bootstrap confidence intervals of %s require the complete record and are not "
+                        "available in streaming mode - skipping" % vna_fn)
+    stream_formats = get_stream_formats(output_formats)
+    for artefact in ARTEFACTS:
+        if stream_formats[artefact] != output_formats[artefact]:
+            logging.warning("WARNING: cannot write %s data series of %s in chunks as %s (use one of %s) - skipping" % (
+                artefact, vna_fn, output_formats[artefact], ", ".join(APPENDABLE_FORMATS)))
+    output_formats = stream_formats
+
+    print(" * calculating file stats ...")
+    if output_formats["raw"] != "none":
+        print(" * writing raw data to %s " % str(target_folder + "/%s-raw%s" % (
+            vna_name, OUTPUT_FORMATS[output_formats["raw"]])))
+    moments = None
+    welch = None
+    rows_done = 0
+    raw_file = None
+    rejected = {}
+    # chunks are read, written, and processed alternately: the passes are profiled as a whole
+    with profile_stage("stream stats", vna_fn) as record:
+        for block in iter_file_blocks(file_name, None if output_formats["raw"] != "none" else VELOCITY_COLUMNS,
+                                      chunk_rows, rejected=rejected, **get_read_options(options)):
+            moments = update_moments(moments, np.stack((block["u (m/s)"], block["v (m/s)"], block[w_col])), pairs)
+            if spectra:
+                welch = update_welch(welch, np.stack([block[col] for col in component_cols]),
+                                     freq=experiment_setup["freq"])
+            n_rows = block["u (m/s)"].size
+            if output_formats["raw"] != "none":
+                raw_file = append_table(pd.DataFrame(block, index=pd.RangeIndex(rows_done, rows_done + n_rows)),
+                                        target_folder + "/%s-raw" % vna_name, output_formats["raw"],
+                                        append=rows_done > 0)
+            rows_done += n_rows
+        vna_stats = get_stats(finalize_moments(moments), profile_type)
+        record.update({"rows": rows_done, "bytes read": file_size(file_name), "bytes written": file_size(raw_file)})
+
+    print(" * launching chunked spike removal and re-calculating stats with despiked data ...")
+    if output_formats["despiked"] != "none":
+        print(" *  Writing de-spiked data to %s " % str(target_folder + "/%s-despiked%s" % (
+            vna_name, OUTPUT_FORMATS[output_formats["despiked"]])))
+    spike_df = None
+    previous = None
+    moments_despiked = None
+    welch_despiked = None
+    rolling = None
+    window_samples, window_stride = get_window_samples(experiment_setup["freq"])
+    windows_done = 0
+    windowed_file = None
+    rows_done = 0
+    despiked_file = None
+    with profile_stage("stream despike", vna_fn) as record:
+        for block in iter_file_blocks(file_name, None if output_formats["despiked"] != "none" else VELOCITY_COLUMNS,
+                                      chunk_rows, **get_read_options(options)):
+            block_spikes, previous = rmspike_block(
+                block,
+                u_stats=vna_stats["u STAT (m/s)"],
+                v_stats=vna_stats["v STAT (m/s)"],
+                w_stats=vna_stats["w STAT (m/s)"],
+                w2_stats=vna_stats["w2 STAT (m/s)"],
+                freq=experiment_setup["freq"],
+                lambda_a=experiment_setup["lambda a"],
+                k=experiment_setup["despike k"],
+                method=experiment_setup["despiking method"],
+                profile_type=profile_type,
+                fill=options["spike_fill"],
+                previous=previous
+            )
+            spike_df = block_spikes if spike_df is None else spike_df + block_spikes
+            moments_despiked = update_moments(moments_despiked,
+                                              np.stack((block["u (m/s)"], block["v (m/s)"], block[w_col])), pairs)
+            if spectra:
+                welch_despiked = update_welch(welch_despiked, np.stack([block[col] for col in component_cols]),
+                                              freq=experiment_setup["freq"])
+            if output_formats["windowed"] != "none":
+                rolling, windowed = update_rolling(rolling, block["time (s)"], *(block[col] for col in component_cols),
+                                                   window_samples, window_stride)
+                windowed_file = append_table(rolling_table(windowed, start=windows_done),
+                                             target_folder + "/%s-windowed" % vna_name, output_formats["windowed"],
+                                             append=windows_done > 0) or windowed_file
+                windows_done += len(windowed["time (s)"])
+            n_rows = block["u (m/s)"].size
+            if output_formats["despiked"] != "none":
+                despiked_file = append_table(
+                    pd.DataFrame(block, index=pd.RangeIndex(rows_done, rows_done + n_rows)),
+                    target_folder + "/%s-despiked" % vna_name, output_formats["despiked"], append=rows_done > 0)
+            rows_done += n_rows
+        vna_stats_despiked = get_stats(finalize_moments(moments_despiked), profile_type)
+        record.update({"rows": rows_done, "bytes read": file_size(file_name),
+                       "bytes written": file_size(despiked_file) + file_size(windowed_file)})
+    if rejected:
+        spike_df = pd.concat([get_spike_stats({}, profile_type, rejected), spike_df])
+
+    if output_formats["spikes"] != "none":
+        print(" *  Writing spike counts to %s " % str(target_folder + "/%s-spikes%s" % (
+            vna_name, OUTPUT_FORMATS[output_formats["spikes"]])))
+    with profile_stage("spikes write", vna_fn, rows=len(spike_df)) as record:
+        record["bytes written"] = file_size(
+            write_table(spike_df, target_folder + "/%s-spikes" % vna_name, output_formats["spikes"]))
+    if options["time_scales"]:
+        vna_stats["time scales"] = {col: np.nan for col in TIME_SCALE_COLUMNS}
+        vna_stats_despiked["time scales"] = {col: np.nan for col in TIME_SCALE_COLUMNS}
+    if options["bootstrap"] is not None:
+        vna_stats["bootstrap"] = {col: np.nan for col in BOOTSTRAP_COLUMNS}
+        vna_stats_despiked["bootstrap"] = {col: np.nan for col in BOOTSTRAP_COLUMNS}
+    if spectra and welch is not None:
+        frequencies, psd, _ = finalize_welch(welch)
+        _, psd_despiked, _ = finalize_welch(welch_despiked)
+        vna_stats["spectrum"] = get_spectrum_stats(frequencies, psd)
+        vna_stats_despiked["spectrum"] = get_spectrum_stats(frequencies, psd_despiked)
+        print(" *  Writing velocity spectra to %s " % str(target_folder + "/%s-spectra%s" % (
+            vna_name, OUTPUT_FORMATS[output_formats["spectra"]])))
+        write_artefact("spectra write", vna_fn, spectra_table(frequencies, psd, psd_despiked),
+                       target_folder + "/%s-spectra" % vna_name, output_formats["spectra"])
+    return vna_name, vna_stats, vna_stats_despiked
+
+
+def process_vna_batch(vna_file_names, target_folder, experiment_setup, use_cache=True, rebuild_cache=False,
+                      output_formats=None, options=None, workers=1):
+    """Run the per-file pipeline of process_vna_file for many files at once: the velocity components of all files are
+    stacked into NaN-padded (files, samples) arrays, and stats and spikes of all files are calculated with vectorized
+    operations (see flowstat.batch_flowstat and rmspike.despike). The velocity spectra of all files and components are
+    calculated in one batch of segments (see spectra.welch_psd). This avoids per-file overhead with many short
+    measurements; the padded arrays require memory for files times the samples of the longest file.
+
+    Args:
+        vna_file_names (list): names of vna (or binary vno) files, such as __8_16.5_6_T3.vna
+        target_folder (str): directory where the vna files live and outputs are written to
+        experiment_setup (dict): the result of the load_input_defs function
+        use_cache (bool): load parsed columns from the parse cache in target_folder/CACHE_FOLDER (default: True)
+        rebuild_cache (bool): re-parse the files and replace their parse cache entries (default: False)
+        output_formats (dict): output formats of the raw, spikes, and despiked artefacts (see output_writer.ARTEFACTS;
+            default is xlsx for all)
+        options (dict): analysis options (see get_analysis_options; default: None, i.e., the defaults of all options)
+        workers (int): number of worker processes of the bootstrap (see bootstrap.bootstrap_files; default: 1)
+
+    Returns:
+        tuple (list, np.array, np.array): vna file names without ending, and stats tables with spikes and despiked
+        (see flowstat.stats_table)
+    """
+    print("\n   *** *** processing %i files in one batch *** ***" % len(vna_file_names))
+    output_formats = get_output_formats(**(output_formats or {}))
+    options = get_analysis_options(**(options or {}))
+    profile_type = experiment_setup["profile"]
+    vna_names = [os.path.splitext(vna_fn)[0] for vna_fn in vna_file_names]
+    vna_data = []
+    rejected = []
+    for vna_fn in vna_file_names:
+        data, file_rejected = read_measurement(vna_fn, target_folder, columns=get_read_columns(output_formats),
+                                               use_cache=use_cache, rebuild_cache=rebuild_cache,
+                                               **get_read_options(options))
+        vna_data.append(data)
+        rejected.append(file_rejected)
+    if output_formats["raw"] != "none":
+        print(" * writing raw data to %s " % str(target_folder + "/*-raw%s" % OUTPUT_FORMATS[output_formats["raw"]]))
+        for vna_fn, vna_name, data in zip(vna_file_names, vna_names, vna_data):
+            with profile_stage("raw write", vna_fn, rows=data["u (m/s)"].size) as record:
+                record["bytes written"] = file_size(
+                    write_table(pd.DataFrame(data), target_folder + "/%s-raw" % vna_name, output_formats["raw"]))
+
+    print(" * calculating stats of all files ...")
+    cols = ["u (m/s)", "v (m/s)", "w1 (m/s)", "w2 (m/s)"]
+    padded = {}
+    with profile_stage("flowstat", rows=sum(data["u (m/s)"].size for data in vna_data)):
+        for col in cols:
+            padded[col], lengths = pad_series([data[col] for data in vna_data])
+        batch_stats = batch_flowstat(*(padded[col] for col in cols), profile_type=profile_type)
+    component_cols = get_component_columns(profile_type)
+    # despiking replaces the padded velocities: the sections (and raw spectra) are calculated first
+    sections, spectrum = get_stats_sections(vna_file_names, [padded[col] for col in component_cols], batch_stats,
+                                            experiment_setup, options, output_formats, lengths=lengths,
+                                            workers=workers, description=" of all files")
+    batch_stats.update(sections)
+
+    print(" * launching spike removal of all files ...")
+    despike_cols = get_despike_columns(profile_type)
+    # w2 is despiked with the w stats (which are the w2 stats if profile_type is not lp)
+    col_stats = [batch_stats["u STAT (m/s)"], batch_stats["v STAT (m/s)"], batch_stats["w STAT (m/s)"],
+                 batch_stats["w STAT (m/s)"]][:len(despike_cols)]
+    spike_dfs = []
+    with profile_stage("rmspike", rows=int(lengths.sum())):
+        if experiment_setup["despiking method"] == "phase-space":
+            # phase-space thresholds depend on complete series (the padding would bias them): despike file by file
+            for i, data in enumerate(vna_data):
+                velocities = np.stack([padded[col][i, :lengths[i]] for col in despike_cols])
+                spike_counts, _ = despike(velocities, averages=[stats["average"][i] for stats in col_stats],
+                                          stds=[stats["std"][i] for stats in col_stats], method="phase-space",
+                                          fill=options["spike_fill"])
+                for j, col in enumerate(despike_cols):
+                    padded[col][i, :lengths[i]] = velocities[j]
+                spike_dfs.append(get_spike_stats(spike_counts, profile_type, rejected[i]))
+        else:
+            # despike all components of all files as one (files x components, samples) array
+            velocities = np.stack([padded[col] for col in despike_cols], axis=1).reshape(
+                -1, padded["u (m/s)"].shape[1])
+            spike_counts, _ = despike(velocities,
+                                      averages=np.stack([stats["average"] for stats in col_stats], axis=1).ravel(),
+                                      stds=np.stack([stats["std"] for stats in col_stats], axis=1).ravel(),
+                                      freq=experiment_setup["freq"],
+                                      lambda_a=experiment_setup["lambda a"],
+                                      k=experiment_setup["despike k"],
+                                      method=experiment_setup["despiking method"],
+                                      fill=options["spike_fill"])
+            velocities = velocities.reshape(len(vna_data), len(despike_cols), -1)
+            for j, col in enumerate(despike_cols):
+                padded[col] = velocities[:, j]
+            spike_counts = {key: counts.reshape(len(vna_data), -1) for key, counts in spike_counts.items()}
+            spike_dfs = [get_spike_stats({key: counts[i] for key, counts in spike_counts.items()}, profile_type,
+                                         rejected[i]) for i in range(len(vna_data))]
+    if output_formats["spikes"] != "none":
+        print(" *  Writing spike counts to %s " % str(target_folder + "/*-spikes%s" % (
+            OUTPUT_FORMATS[output_formats["spikes"]])))
+    for vna_fn, vna_name, spike_df in zip(vna_file_names, vna_names, spike_dfs):
+        with profile_stage("spikes write", vna_fn, rows=len(spike_df)) as record:
+            record["bytes written"] = file_size(
+                write_table(spike_df, target_folder + "/%s-spikes" % vna_name, output_formats["spikes"]))
+    if output_formats["despiked"] != "none":
+        print(" *  Writing de-spiked data to %s " % str(target_folder + "/*-despiked%s" % (
+            OUTPUT_FORMATS[output_formats["despiked"]])))
+        for i, (vna_fn, vna_name, data) in enumerate(zip(vna_file_names, vna_names, vna_data)):
+            with profile_stage("despiked write", vna_fn, rows=int(lengths[i])) as record:
+                despiked_df = pd.DataFrame(data)
+                for col in despike_cols:
+                    despiked_df[col] = padded[col][i, :lengths[i]]
+                record["bytes written"] = file_size(write_table(
+                    despiked_df, target_folder + "/%s-despiked" % vna_name, output_formats["despiked"]))
+    if options["plot_series"]:
+        print(" *  Plotting velocity series and spike diagnostics to %s " % str(
+            target_folder + "/*-velocity.png (and *-spike-diagnostics.png)"))
+        for i, (vna_fn, vna_name, data) in enumerate(zip(vna_file_names, vna_names, vna_data)):
+            with profile_stage("plot", vna_fn, rows=int(lengths[i])):
+                submit_plot_series(data["time (s)"], {col: data[col] for col in despike_cols},
+                                   {col: padded[col][i, :lengths[i]] for col in despike_cols},
+                                   target_folder + "/" + vna_name)
+
+    print(" * re-calculating stats of all files with despiked data ...")
+    with profile_stage("flowstat", rows=int(lengths.sum())):
+        batch_stats_despiked = batch_flowstat(*(padded[col] for col in cols), profile_type=profile_type)
+    sections, spectrum_despiked = get_stats_sections(
+        vna_file_names, [padded[col] for col in component_cols], batch_stats_despiked, experiment_setup, options,
+        output_formats, lengths=lengths, workers=workers, description=" of all files with despiked data")
+    batch_stats_despiked.update(sections)
+    if output_formats["spectra"] != "none":
+        print(" *  Writing velocity spectra to %s " % str(target_folder + "/*-spectra%s" % (
+            OUTPUT_FORMATS[output_formats["spectra"]])))
+    if output_formats["windowed"] != "none":
+        print(" *  Writing sliding-window stats with despiked data to %s " % str(target_folder + "/*-windowed%s" % (
+            OUTPUT_FORMATS[output_formats["windowed"]])))
+    for i, (vna_fn, data) in enumerate(zip(vna_file_names, vna_data)):
+        write_section_artefacts(vna_fn, target_folder, data["time (s)"],
+                                [padded[col][i, :lengths[i]] for col in component_cols],
+                                None if spectrum is None else (spectrum[0], spectrum[1][i], spectrum_despiked[1][i]),
+                                experiment_setup, output_formats)
+    return vna_names, stats_table(batch_stats, profile_type), stats_table(batch_stats_despiked, profile_type)
+
+
+def run_vna_pipeline(vna_file_names, target_folder, experiment_setup, workers=1, use_cache=True, rebuild_cache=False,
+                     output_formats=None, options=None, stream=False, chunk_rows=STREAM_CHUNK_ROWS, batch=False,
+                     prefetch=0):
+    """Apply process_vna_file to all vna files, either serially or in a pool of worker processes.
+
+    Args:
+        vna_file_names (list): names of vna files to process (the list order defines the output order)
+        target_folder (str): directory where the vna files live and outputs are written to
+        experiment_setup (dict): the result of the load_input_defs function
+        workers (int): number of worker processes; 1 (default) runs serially in the calling process
+        use_cache (bool): load parsed columns from the parse cache (default: True)
+        rebuild_cache (bool): re-parse all files and replace their parse cache entries (default: False)
+        output_formats (dict): output formats of per-file artefacts (see process_vna_file)
+        options (dict): analysis options (see get_analysis_options; default: None, i.e., the defaults of all options)
+        stream (bool): process every file in chunks with process_vna_file_streaming (default: False)
+        chunk_rows (int): number of samples per chunk in streaming mode (default: config.STREAM_CHUNK_ROWS)
+        batch (bool): process all files at once with process_vna_batch (default: False; ignores stream, and workers
+            split the bootstrap of the files)
+        prefetch (int): number of files that a reader thread reads ahead of serial processing, while a writer thread
+            writes the artefacts (default: 0 reads and writes in turn; ignored with workers, stream, and batch)
+
+    Returns:
+        tuple (list, np.array, np.array): vna file names without ending, and stats tables with spikes and despiked
+        (see flowstat.stats_table) with one row per file
+    """
+    options = get_analysis_options(**(options or {}))
+    if batch:
+        return process_vna_batch(vna_file_names, target_folder, experiment_setup, use_cache=use_cache,
+                                 rebuild_cache=rebuild_cache, output_formats=output_formats, options=options,
+                                 workers=workers)
+    if stream:
+        process_fun = partial(process_vna_file_streaming, target_folder=target_folder,
+                              experiment_setup=experiment_setup, chunk_rows=chunk_rows, output_formats=output_formats,
+                              options=options)
+    else:
+        process_fun = partial(process_vna_file, target_folder=target_folder, experiment_setup=experiment_setup,
+                              use_cache=use_cache, rebuild_cache=rebuild_cache, output_formats=output_formats,
+                              options=options)
+    if workers > 1 and len(vna_file_names) > 1:
+        print("- distributing %i files over %i worker processes ..." % (len(vna_file_names), workers))
+        profiling = profiling_enabled()
+        with ProcessPoolExecutor(max_workers=min(workers, len(vna_file_names)),
+                                 initializer=enable_profiling if profiling else None) as executor:
+            # map yields results in submission order, which keeps the outputs deterministic
+            if profiling:
+                results = []
+                for result, records in executor.map(partial(call_profiled, process_fun), vna_file_names):
+                    results.append(result)
+                    add_records(records)
+            else:
+                results = list(executor.map(process_fun, vna_file_names))
+    elif prefetch > 0 and not stream:
+        print("- reading up to %i files ahead and writing in the background ..." % prefetch)
+        read_fun = partial(read_measurement, target_folder=target_folder,
+                           columns=get_read_columns(get_output_formats(**(output_formats or {}))),
+                           use_cache=use_cache, rebuild_cache=rebuild_cache, **get_read_options(options))
+        # up to five artefacts (raw, spikes, despiked, spectra, windowed) per file wait for the writer
+        with background_writer(depth=5 * prefetch) as submit_write:
+            results = [process_fun(vna_fn, measurement=measurement, write_fun=partial(submit_write, write_artefact))
+                       for vna_fn, measurement in iter_prefetched(read_fun, vna_file_names, depth=prefetch)]
+    else:
+        results = [process_fun(vna_fn) for vna_fn in vna_file_names]
+    return _collect_stats(results, experiment_setup["profile"])
+
+
+def _collect_stats(results, profile_type):
+    """Convert (vna name, stats, despiked stats) tuples of process_vna_file into vna names and stats tables."""
+    vna_names = [vna_name for vna_name, _, _ in results]
+    vna_stats = np.concatenate([stats_table(vna_stats, profile_type) for _, vna_stats, _ in results])
+    vna_stats_despiked = np.concatenate([stats_table(vna_stats_despiked, profile_type)
+                                         for _, _, vna_stats_despiked in results])
+    return vna_names, vna_stats, vna_stats_despiked
+
+
+def sweep_vna_file(vna_fn, target_folder, experiment_setup, k_values, lambda_values, use_cache=True,
+                   rebuild_cache=False, dtype=np.float64, min_snr=None, min_corr=None):
+    """Calculate spike counts and despiked TKE of a vna file for all combinations of velocity (k) and acceleration
+    (lambda a) thresholds (see rmspike.despike_sweep).
+
+    Args:
+        vna_fn (str): name of a vna (or binary vno) file, such as __8_16.5_6_T3.vna
+        target_folder (str): directory where the vna file lives
+        experiment_setup (dict): the result of the load_input_defs function
+        k_values (list): multipliers of velocity stdev (velocity thresholds)
+        lambda_values (list): multipliers of gravitational acceleration (acceleration thresholds)
+        use_cache (bool): load parsed columns from the parse cache in target_folder/CACHE_FOLDER (default: True)
+        rebuild_cache (bool): re-parse the file and replace its parse cache entry (default: False)
+        dtype (np.dtype): float type of the loaded columns (default: np.float64)
+        min_snr (float): minimum beam signal-to-noise ratio in dB of valid samples (default: None, i.e., no filter)
+        min_corr (float): minimum beam correlation in % of valid samples (default: None, i.e., no filter)
+
+    Returns:
+        pandas.DataFrame: one row per (k, lambda a) combination with spike counts per velocity component, and TKE
+        with spikes, despiked with the velocity thresholds, and despiked with the acceleration thresholds
+    """
+    print("   * sweeping despike thresholds of %s ..." % vna_fn)
+    # the same columns, dtype, and quality filter as the pipeline, so that the sweep despikes the same samples
+    vna_data, _ = read_measurement(vna_fn, target_folder, columns=VELOCITY_COLUMNS, dtype=dtype, use_cache=use_cache,
+                                   rebuild_cache=rebuild_cache, min_snr=min_snr, min_corr=min_corr)
+    profile_type = experiment_setup["profile"]
+    vna_time_series, vna_stats = flowstat(time=vna_data["time (s)"], u=vna_data["u (m/s)"], v=vna_data["v (m/s)"],
+                                          w1=vna_data["w1 (m/s)"], w2=vna_data["w2 (m/s)"],
+                                          profile_type=profile_type)
+    # velocity components that rmspike despikes and their stats (w2 is despiked with the w stats)
+    cols = ["u (m/s)", "v (m/s)", "w1 (m/s)"]
+    col_stats = [vna_stats["u STAT (m/s)"], vna_stats["v STAT (m/s)"], vna_stats["w STAT (m/s)"]]
+    tke_components = [0, 1, 2]
+    if not (profile_type == "lp"):
+        cols.append("w2 (m/s)")
+        col_stats.append(vna_stats["w2 STAT (m/s)"])
+        tke_components = [0, 1, 3]
+    sweep = despike_sweep(np.stack([vna_data[col] for col in cols]),
+                          averages=[stats["average"] for stats in col_stats],
+                          stds=[stats["std"] for stats in col_stats],
+                          k_values=k_values, lambda_values=lambda_values, freq=experiment_setup["freq"])
+
+    # (k, lambda a) grid: velocity results vary along k and acceleration results along lambda a
+    k_grid, lambda_grid = np.meshgrid(np.arange(len(k_values)), np.arange(len(lambda_values)), indexing="ij")
+    k_idx, lambda_idx = k_grid.ravel(), lambda_grid.ravel()
+    sweep_df = pd.DataFrame(index=pd.MultiIndex.from_arrays(
+        [[os.path.splitext(vna_fn)[0]] * k_idx.size, np.asarray(k_values)[k_idx], np.asarray(lambda_values)[lambda_idx]],
+        names=["file", "k", "lambda a"]))
+    for j, col in enumerate(cols):
+        sweep_df[col.split(" ")[0] + " velocity spikes"] = sweep["velocity spikes"][k_idx, j]
+    for j, col in enumerate(cols):
+        sweep_df[col.split(" ")[0] + " acceleration spikes"] = sweep["acceleration spikes"][lambda_idx, j]
+    sweep_df["TKE (m^2/s^2)"] = vna_stats["TKE (m^2/s^2)"]
+    sweep_df["TKE velocity despiked (m^2/s^2)"] = 0.5 * (
+            sweep["velocity despiked std"][k_idx][:, tke_components] ** 2).sum(axis=1)
+    sweep_df["TKE acceleration despiked (m^2/s^2)"] = 0.5 * (
+            sweep["acceleration despiked std"][lambda_idx][:, tke_components] ** 2).sum(axis=1)
+    return sweep_df
+
+
+@log_actions
+def sweep_vna_files(input_file_name, k_values=None, lambda_values=None, workers=1, use_cache=True,
+                    rebuild_cache=False, output_format="xlsx", input_overrides=None, dtype=np.float64, min_snr=None,
+                    min_corr=None):
+    """Sweep despike thresholds of all vna files and write a sensitivity table (despike-sweep) instead of running
+    the regular pipeline.
+
+    Args:
+        input_file_name (str): name of input file with experiment metrics (default is input.xlsx in script folder)
+        k_values (list): multipliers of velocity stdev (default: Despike k of the input file)
+        lambda_values (list): multipliers of gravitational acceleration (default: Despike lambda a of the input file)
+        workers (int): number of worker processes (default is 1, i.e., serial processing)
+        use_cache (bool): load parsed columns from the parse cache in the data folder (default: True)
+        rebuild_cache (bool): re-parse all files and replace their parse cache entries (default: False)
+        output_format (str): output format of the sensitivity table (see output_writer.OUTPUT_FORMATS; default: xlsx)
+        input_overrides (dict): experiment parameters that replace values of the input file (see load_input_defs)
+        dtype (np.dtype): float type of the loaded columns (default: np.float64)
+        min_snr (float): minimum beam signal-to-noise ratio in dB of valid samples (default: None, i.e., no filter)
+        min_corr (float): minimum beam correlation in % of valid samples (default: None, i.e., no filter)
+    """
+    experiment_setup = load_input_defs(file_name=input_file_name, overrides=input_overrides)
+    experiment_meta = get_data_info(experiment_setup["folder name"])
+    target_folder = SCRIPT_DIR + experiment_setup["folder name"]
+    k_values = list(k_values or [experiment_setup["despike k"]])
+    lambda_values = list(lambda_values or [experiment_setup["lambda a"]])
+    print("- sweeping %i k and %i lambda a values over %i files ..." % (
+        len(k_values), len(lambda_values), len(experiment_meta["vna files"])))
+    sweep_fun = partial(sweep_vna_file, target_folder=target_folder, experiment_setup=experiment_setup,
+                        k_values=k_values, lambda_values=lambda_values, use_cache=use_cache,
+                        rebuild_cache=rebuild_cache, dtype=dtype, min_snr=min_snr, min_corr=min_corr)
+    if workers > 1 and len(experiment_meta["vna files"]) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(experiment_meta["vna files"]))) as executor:
+            sweep_dfs = list(executor.map(sweep_fun, experiment_meta["vna files"]))
+    else:
+        sweep_dfs = [sweep_fun(vna_fn) for vna_fn in experiment_meta["vna files"]]
+    if output_format != "none":
+        print("- Writing despike threshold sensitivity table to %s " % str(target_folder + "/despike-sweep%s" % (
+            OUTPUT_FORMATS[output_format])))
+    write_table(pd.concat(sweep_dfs), target_folder + "/despike-sweep", output_format)
+    print("\n-- DONE -- ALL TASKS FINISHED --")
+
+
+@log_actions
+def watch_vna_files(input_file_name, path=None, interval=WATCH_INTERVAL, idle_timeout=None, spike_fill="nan",
+                    input_overrides=None, dtype=np.float64, min_snr=None, min_corr=None):
+    """Follow growing vna files of an ongoing acquisition and publish their running stats and convergence (see
+    live_monitor.watch_vna) instead of running the regular pipeline.
+
+    Args:
+        input_file_name (str): name of input file with experiment metrics (default is input.xlsx in script folder)
+        path (str): vna file or folder to watch (default: None, i.e., the data folder of the input file)
+        interval (float): time in s between publications of the stats (default: config.WATCH_INTERVAL)
+        idle_timeout (float): stop if no file grew for idle_timeout seconds (default: None, i.e., until Ctrl+C)
+        spike_fill (str): replacement of spikes, nan (default) or last-valid
+        input_overrides (dict): experiment parameters that replace values of the input file (see load_input_defs)
+        dtype (np.dtype): float type of the parsed columns (default: np.float64)
+        min_snr (float): minimum beam signal-to-noise ratio in dB of valid samples (default: None, i.e., no filter)
+        min_corr (float): minimum beam correlation in % of valid samples (default: None, i.e., no filter)
+    """
+    experiment_setup = load_input_defs(file_name=input_file_name, overrides=input_overrides)
+    watch_vna(path or SCRIPT_DIR + experiment_setup["folder name"], experiment_setup, interval=interval,
+              idle_timeout=idle_timeout, spike_fill=spike_fill, dtype=dtype, min_snr=min_snr, min_corr=min_corr)
+    print("\n-- DONE -- ALL TASKS FINISHED --")
+
+
+@log_actions
+def process_catalog_files(input_file_name, catalog_file=SCRIPT_DIR + CATALOG_NAME, folders=None, selection=None,
+                          list_only=False, input_overrides=None, **kwargs):
+    """Update the experiment catalog (see experiment_catalog.py) and process a selection of its files folder by
+    folder with analyze_vna_files, without listing the folders again.
+
+    Args:
+        input_file_name (str): name of input file with experiment metrics (the folder name is replaced with the
+            folders of the selected files)
+        catalog_file (str): name of the SQLite catalog (default: config.CATALOG_NAME in the script folder)
+        folders (list): experiment folders to scan (recursively) before the selection (default: None, i.e., no scan)
+        selection (dict): x, y, z, test, folder, and status of the files to process (see
+            experiment_catalog.select_files); None only scans the folders
+        list_only (bool): print the selected files instead of processing them (default: False)
+        input_overrides (dict): experiment parameters that replace values of the input file (see load_input_defs)
+        **kwargs: arguments of analyze_vna_files, such as workers or output_formats
+    """
+    catalog = open_catalog(catalog_file)
+    try:
+        if folders:
+            print("- scanning %s into the catalog %s ..." % (", ".join(folders), catalog_file))
+            counts = scan_folders(catalog, folders)
+            print("   -> %i new, %i changed, %i unchanged, and %i removed files" % (
+                counts["new"], counts["changed"], counts["unchanged"], counts["removed"]))
+        if selection is None:
+            return
+        files = select_files(catalog, **selection)
+        print("- selected %i files in %i folders of the catalog" % (len(files), len({f["folder"] for f in files})))
+        if list_only:
+            print(catalog_table(files)[["x", "y", "z", "test", "freq", "duration", "status"]].to_string())
+            return
+        freq = load_input_defs(file_name=input_file_name, overrides=input_overrides)["freq"]
+        other_freq = [f["name"] for f in files if f["freq"] and abs(f["freq"] - freq) > 0.01 * freq]
+        if other_freq:
+            logging.warning("WARNING: the sampling frequency of %s differs from the ADV freq of %s Hz" % (
+                ", ".join(other_freq), str(freq)))
+        for folder in sorted({f["folder"] for f in files}):
+            folder_files = [f for f in files if f["folder"] == folder]
+            print("\n- processing %i selected files of %s ..." % (len(folder_files), folder))
+            analyze_vna_files(input_file_name=input_file_name,
+                              input_overrides=dict(input_overrides or {}, folder_name=os.path.relpath(folder,
+                                                                                                      SCRIPT_DIR)),
+                              vna_files=[f["name"] for f in folder_files], **kwargs)
+            mark_processed(catalog, [f["path"] for f in folder_files])
+    finally:
+        catalog.close()
+
+
+@log_actions
+def process_vna_files(input_file_name, **kwargs):
+    """Main function controlling vna file processing: runs analyze_vna_files (see there for the arguments) and logs
+    warnings to logfile.log."""
+    analyze_vna_files(input_file_name, **kwargs)
+
+
+def analyze_vna_files(input_file_name, workers=1, use_cache=True, rebuild_cache=False, output_formats=None,
+                      stream=False, chunk_rows=STREAM_CHUNK_ROWS, spike_fill="nan", batch=False, incremental=True,
+                      profile=False, input_overrides=None, plot_series=False, dtype=np.float64, min_snr=None,
+                      min_corr=None, prefetch=0, time_scales=False, bootstrap=None, vna_files=None):
+    """Analyze the vna files of an experiment folder (without setting up logging, see process_vna_files).
+    Writes full despiked data series and stats series to xlsx workbooks (or other output_formats).
+    The run manifest (MANIFEST_NAME in the data folder) records the processed files, and reruns only process new or
+    changed files and files whose parameters changed (see run_manifest.py).
+
+    Args:
+        input_file_name (str): name of input file with experiment metrics (default is input.xlsx in script folder)
+        workers (int): number of worker processes for the per-file pipeline (default is 1, i.e., serial processing)
+        use_cache (bool): load parsed columns from the parse cache in the data folder (default: True)
+        rebuild_cache (bool): re-parse all files and replace their parse cache entries (default: False)
+        output_formats (dict): output formats of artefacts (see output_writer.ARTEFACTS; default is xlsx for all but
+            the spectra and windowed artefacts); velocity spectra (NAME-spectra) and their inertial subrange slopes and
+            noise floors in the stats summaries are only calculated if the spectra format is not none (default), and
+            sliding-window stats of the despiked series (NAME-windowed, see rolling_stats.py) if the windowed format
+            is not none (default)
+        stream (bool): process files in chunks to limit memory usage with very long records (default: False)
+        chunk_rows (int): number of samples per chunk in streaming mode (default: config.STREAM_CHUNK_ROWS)
+        spike_fill (str): replacement of spikes (see rmspike.FILL_METHODS; default: nan)
+        batch (bool): process all files at once with vectorized stats and despiking (default: False)
+        incremental (bool): skip files that the run manifest lists as up to date (default: True); False processes
+            all files
+        profile (bool): measure wall and CPU time, rows, bytes read and written, and peak memory of every stage and
+            file, and write them to profile-report.json and profile-report.csv in the data folder (default: False)
+        input_overrides (dict): experiment parameters that replace values of the input file (see load_input_defs)
+        plot_series (bool): plot the despiked velocity series and spike diagnostics of every processed file
+            (default: False)
+        dtype (np.dtype): float type of the loaded columns; np.float32 halves the memory usage of the measurements
+            (default: np.float64)
+        min_snr (float): minimum beam signal-to-noise ratio in dB of valid samples; velocities of other samples are
+            replaced with NaN before despiking (default: None, i.e., no filter; 15 is recommended)
+        min_corr (float): minimum beam correlation in % of valid samples (default: None, i.e., no filter; 70 is
+            recommended)
+        prefetch (int): number of files that are read ahead while the current file is processed, with artefacts
+            written in a background thread (default: 0, i.e., read, process, and write in turn; see run_vna_pipeline)
+        time_scales (bool): add integral time scales, effective sample sizes, and stderrs corrected for the
+            autocorrelation of the samples to the stats summaries (default: False; not available in streaming mode)
+        bootstrap (int): seed of moving-block bootstrap confidence intervals of TKE and Reynolds stresses in the stats
+            summaries (default: None, i.e., no confidence intervals; not available in streaming mode)
+        vna_files (list): names of the files of the data folder to analyze, e.g., of a catalog selection (default:
+            None, i.e., all files, see get_data_info); the stats summaries only list these files, and the run manifest
+            keeps the records of the other files
+    """
+    if profile:
+        enable_profiling()
+    # plots are rendered in a background process while the analysis goes on
+    start_plotting()
+    output_formats = get_output_formats(**(output_formats or {}))
+    options = get_analysis_options(spike_fill=spike_fill, plot_series=plot_series, dtype=dtype, min_snr=min_snr,
+                                   min_corr=min_corr, time_scales=time_scales, bootstrap=bootstrap)
+    # optional stats sections (see flowstat.STATS_SECTIONS)
+    sections = [section for section, enabled in [("spectrum", output_formats["spectra"] != "none"),
+                                                 ("time scales", time_scales),
+                                                 ("bootstrap", bootstrap is not None)] if enabled]
+    with profile_stage("load input") as record:
+        experiment_setup = load_input_defs(file_name=input_file_name, overrides=input_overrides)
+        experiment_meta = get_data_info(experiment_setup["folder name"], vna_files)
+        record["bytes read"] = file_size(input_file_name)
+    target_folder = SCRIPT_DIR + experiment_setup["folder name"]
+    vna_file_names = experiment_meta["vna files"]
+    manifest_file = target_folder + "/" + MANIFEST_NAME
+    # per-file artefacts that the pipeline writes (streaming skips data series that cannot be appended)
+    file_formats = get_stream_formats(output_formats) if stream and not batch else output_formats
+    with profile_stage("manifest", rows=len(vna_file_names)) as record:
+        manifest = load_manifest(manifest_file)
+        run_parameters = get_run_parameters(experiment_setup, spike_fill, dtype=dtype, min_snr=min_snr,
+                                            min_corr=min_corr, spectra="spectrum" in sections,
+                                            time_scales=time_scales, bootstrap=bootstrap,
+                                            windowed=output_formats["windowed"] != "none")
+        # series plots are not available in streaming mode
+        outdated, file_infos = get_outdated_files(manifest, vna_file_names, target_folder, run_parameters,
+                                                  file_formats, plot_series=plot_series and (batch or not stream))
+        record["bytes read"] = file_size(manifest_file) if os.path.exists(manifest_file) else 0
+    if not incremental:
+        outdated = list(vna_file_names)
+    elif len(outdated) < len(vna_file_names):
+        print("- skipping %i up-to-date files of %s (use --reprocess to process all files)" % (
+            len(vna_file_names) - len(outdated), manifest_file))
+    if outdated:
+        processed_names, processed_stats, processed_stats_despiked = run_vna_pipeline(
+            outdated,
+            target_folder=target_folder,
+            experiment_setup=experiment_setup,
+            workers=workers,
+            use_cache=use_cache,
+            rebuild_cache=rebuild_cache,
+            output_formats=output_formats,
+            options=options,
+            stream=stream,
+            chunk_rows=chunk_rows,
+            batch=batch,
+            prefetch=prefetch
+        )
+        record_files(manifest, outdated, file_infos, run_parameters, file_formats, processed_stats,
+                     processed_stats_despiked)
+    with profile_stage("manifest", rows=len(vna_file_names)) as record:
+        # forget files that were removed from the data folder
+        kept_files = vna_file_names if vna_files is None else [
+            vna_fn for vna_fn in manifest["files"]
+            if vna_fn in vna_file_names or os.path.exists(target_folder + "/" + vna_fn)]
+        manifest["files"] = {vna_fn: manifest["files"][vna_fn] for vna_fn in kept_files}
+        save_manifest(manifest, manifest_file)
+        record["bytes written"] = file_size(manifest_file)
+    vna_names = [os.path.splitext(vna_fn)[0] for vna_fn in vna_file_names]
+    vna_stats, vna_stats_despiked = get_recorded_stats(manifest, vna_file_names, experiment_setup["profile"],
+                                                       sections=sections)
+
+    if output_formats["stats"] != "none":
+        print("- Writing data stats with spikes to %s " % str(target_folder + "/stats-with-spikes%s" % (
+            OUTPUT_FORMATS[output_formats["stats"]])))
+    with profile_stage("summary", rows=len(vna_names)) as record:
+        stats4write_df = build_stats_summary(
+            vna_names=vna_names,
+            vna_stats=vna_stats,
+            experiment_info=experiment_meta,
+            bulk_velocity=experiment_setup["bulk velocity"],
+            profile_type=experiment_setup["profile"],
+            log_length=experiment_setup["characteristic wood length"]
+        )
+        record["bytes written"] = file_size(
+            write_table(stats4write_df, target_folder + "/stats-with-spikes", output_formats["stats"]))
     print("- Creating and saving plot of norm. TKE with spikes to %s " % str(target_folder + "/norm-tke-x-spikes.png"))
-    plot_xy(stats4write_df["x norm. (-)"].to_numpy(), stats4write_df["TKE norm. (-)"].to_numpy(), target_folder + "/norm-tke-x-spike.png")
-
-    print("- Writing despiked data stats to %s " % str(target_folder + "/stats-despiked.xlsx"))
-    stats4write_df = build_stats_summary(
-        vna_stats_dict=vna_stats_dict_despiked,
-        experiment_info=experiment_meta,
-        bulk_velocity=experiment_setup["bulk velocity"],
-        profile_type=experiment_setup["profile"],
-        log_length=experiment_setup["characteristic wood length"]
-    )
-    stats4write_df.to_excel(target_folder + "/stats-despiked.xlsx")
+    submit_plot(plot_xy, stats4write_df["x norm. (-)"].to_numpy(), stats4write_df["TKE norm. (-)"].to_numpy(),
+                target_folder + "/norm-tke-x-spike.png")
+
+    if output_formats["stats"] != "none":
+        print("- Writing despiked data stats to %s " % str(target_folder + "/stats-despiked%s" % (
+            OUTPUT_FORMATS[output_formats["stats"]])))
+    with profile_stage("summary", rows=len(vna_names)) as record:
+        stats4write_df = build_stats_summary(
+            vna_names=vna_names,
+            vna_stats=vna_stats_despiked,
+            experiment_info=experiment_meta,
+            bulk_velocity=experiment_setup["bulk velocity"],
+            profile_type=experiment_setup["profile"],
+            log_length=experiment_setup["characteristic wood length"]
+        )
+        record["bytes written"] = file_size(
+            write_table(stats4write_df, target_folder + "/stats-despiked", output_formats["stats"]))
 
     print("- Creating and saving plot of norm. TKE with spikes to %s " % str(target_folder + "/norm-tke-x-spikes.png"))
-    plot_xy(stats4write_df["x norm. (-)"].to_numpy(), stats4write_df["TKE norm. (-)"].to_numpy(),
-            target_folder + "/norm-tke-x-despiked.png")
+    submit_plot(plot_xy, stats4write_df["x norm. (-)"].to_numpy(), stats4write_df["TKE norm. (-)"].to_numpy(),
+                target_folder + "/norm-tke-x-despiked.png")
+    with profile_stage("plot") as record:
+        # wait for the background plot process
+        plot_files = finish_plotting()
+        record.update({"rows": len(plot_files),
+                       "bytes written": sum(file_size(f) for f in plot_files if os.path.exists(f))})
+
+    if profile:
+        records = pop_records()
+        disable_profiling()
+        print("- Writing stage profile to %s " % str(target_folder + "/profile-report.json (and .csv)"))
+        write_profile_report(target_folder + "/profile-report", records)
+        print_profile_summary(records)
 
     print("\n-- DONE -- ALL TASKS FINISHED --")
 
@@ -270,8 +1242,108 @@ def process_vna_files(input_file_name):
 if __name__ == '__main__':
     print("LAUNCHING TKE PROFILE ANALYST ...")
     print("Note: vna file name must be xx_yy_zz_tt.vna alike (tt=test number).")
-    if len(sys.argv) > 1:
-        # if true: call with user-specific input file.xlsx
-        process_vna_files(input_file_name=str(sys.argv[1]))
-    else:
-        process_vna_files(input_file_name=SCRIPT_DIR + "input.xlsx")
+    parser = argparse.ArgumentParser(description="Calculate TKE and flow statistics of vna files.")
+    parser.add_argument("input_file_name", nargs="?",
+                        help="input file with experiment metrics: xlsx workbook, toml, or json (default: input.xlsx, "
+                             "or no input file if all parameters are defined with --set)")
+    parser.add_argument("--set", type=parse_setting, action="append", default=[], metavar="KEY=VALUE",
+                        help="define an experiment parameter (replaces the value of the input file); keys: %s" % (
+                            ", ".join(INPUT_PARAMETERS)))
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes for processing vna files in parallel (default: 1)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always parse measurement files and do not use the parse cache")
+    parser.add_argument("--rebuild-cache", action="store_true",
+                        help="re-parse all measurement files and replace their parse cache entries")
+    parser.add_argument("--stream", action="store_true",
+                        help="process files in chunks with constant memory usage (for very long records)")
+    parser.add_argument("--chunk-rows", type=int, default=STREAM_CHUNK_ROWS,
+                        help="number of samples per chunk in streaming mode (default: %i)" % STREAM_CHUNK_ROWS)
+    parser.add_argument("--prefetch", type=int, default=0, metavar="N",
+                        help="read N files ahead in a reader thread and write outputs in a writer thread (serial "
+                             "processing only; default: 0); with --profile, stage CPU times are per thread, and the "
+                             "peak memory of stages that overlap with other threads is not reported")
+    parser.add_argument("--batch", action="store_true",
+                        help="process all files at once with vectorized stats and despiking (for many short records)")
+    parser.add_argument("--spike-fill", choices=FILL_METHODS, default="nan",
+                        help="replacement of spikes: nan (default), linear interpolation, or last valid sample")
+    parser.add_argument("--min-snr", type=float, metavar="DB",
+                        help="replace velocities of samples with a beam signal-to-noise ratio below DB with NaN before "
+                             "despiking (recommended: 15)")
+    parser.add_argument("--min-corr", type=float, metavar="PERCENT",
+                        help="replace velocities of samples with a beam correlation below PERCENT with NaN before "
+                             "despiking (recommended: 70)")
+    parser.add_argument("--float32", action="store_true",
+                        help="load measurements as 32-bit floats (halves the memory usage)")
+    parser.add_argument("--reprocess", action="store_true",
+                        help="process all files, including files that the run manifest lists as up to date")
+    parser.add_argument("--time-scales", action="store_true",
+                        help="add integral time scales, effective sample sizes, and stderrs corrected for the "
+                             "autocorrelation of the samples to the stats summaries")
+    parser.add_argument("--bootstrap", type=int, nargs="?", const=BOOTSTRAP_SEED, metavar="SEED",
+                        help="add moving-block bootstrap confidence intervals of TKE and Reynolds stresses to the "
+                             "stats summaries (random draws seeded with SEED; default: %i)" % BOOTSTRAP_SEED)
+    parser.add_argument("--plot-series", action="store_true",
+                        help="plot despiked velocity series and spike diagnostics of every file (NAME-velocity.png "
+                             "and NAME-spike-diagnostics.png)")
+    parser.add_argument("--profile", action="store_true",
+                        help="measure time, memory, and input/output of every stage and write profile-report.json/csv")
+    parser.add_argument("--watch", nargs="?", const="", metavar="PATH",
+                        help="watch mode: follow a growing vna file or all vna files of a folder (default: the data "
+                             "folder) and print running stats and their convergence instead of the regular analysis")
+    parser.add_argument("--watch-interval", type=float, default=WATCH_INTERVAL, metavar="SECONDS",
+                        help="watch mode: time between stats updates (default: %.1f s)" % WATCH_INTERVAL)
+    parser.add_argument("--watch-timeout", type=float, metavar="SECONDS",
+                        help="watch mode: stop if no file grew for this time (default: run until Ctrl+C)")
+    parser.add_argument("--catalog", default=SCRIPT_DIR + CATALOG_NAME, metavar="FILE",
+                        help="SQLite experiment catalog of --catalog-scan and --select (default: %s)" % CATALOG_NAME)
+    parser.add_argument("--catalog-scan", nargs="+", metavar="FOLDER",
+                        help="add the vna and vno files of these folders and their sub-folders to the catalog (only "
+                             "new and changed files are read)")
+    parser.add_argument("--select", type=parse_setting, action="append", metavar="KEY=VALUE",
+                        help="process the catalog files that match all selections (keys: x, y, z in m or LOW:HIGH, "
+                             "test such as T3 or T1-T9, folder, status) folder by folder, e.g., --select z=0.06 "
+                             "--select test=T1-T9")
+    parser.add_argument("--list", action="store_true",
+                        help="print the files of --select instead of processing them")
+    parser.add_argument("--sweep-k", type=float, nargs="+", metavar="K",
+                        help="sweep mode: write spike counts and despiked TKE for these velocity thresholds k (and "
+                             "--sweep-lambda-a values) to despike-sweep instead of running the regular analysis")
+    parser.add_argument("--sweep-lambda-a", type=float, nargs="+", metavar="LAMBDA_A",
+                        help="sweep mode: acceleration thresholds lambda a to sweep (see --sweep-k)")
+    for artefact in ARTEFACTS:
+        parser.add_argument("--%s-format" % artefact, choices=list(OUTPUT_FORMATS),
+                            default=DEFAULT_OUTPUT_FORMATS[artefact],
+                            help="output format of %s files (default: %s)" % (
+                                artefact, DEFAULT_OUTPUT_FORMATS[artefact]))
+    args = parser.parse_args()
+    input_overrides = dict(args.set)
+    input_file_name = args.input_file_name
+    if input_file_name is None and not all(key in input_overrides for key in INPUT_PARAMETERS):
+        input_file_name = SCRIPT_DIR + "input.xlsx"
+    if args.watch is not None:
+        watch_vna_files(input_file_name=input_file_name, path=args.watch, interval=args.watch_interval,
+                        idle_timeout=args.watch_timeout, spike_fill=args.spike_fill, input_overrides=input_overrides,
+                        dtype=np.float32 if args.float32 else np.float64, min_snr=args.min_snr,
+                        min_corr=args.min_corr)
+        sys.exit()
+    if args.sweep_k or args.sweep_lambda_a:
+        sweep_vna_files(input_file_name=input_file_name, k_values=args.sweep_k,
+                        lambda_values=args.sweep_lambda_a, workers=args.workers, use_cache=not args.no_cache,
+                        rebuild_cache=args.rebuild_cache, output_format=args.stats_format,
+                        input_overrides=input_overrides, dtype=np.float32 if args.float32 else np.float64,
+                        min_snr=args.min_snr, min_corr=args.min_corr)
+        sys.exit()
+    process_options = dict(workers=args.workers, use_cache=not args.no_cache, rebuild_cache=args.rebuild_cache,
+                           output_formats={a: getattr(args, "%s_format" % a) for a in ARTEFACTS},
+                           stream=args.stream, chunk_rows=args.chunk_rows, spike_fill=args.spike_fill,
+                           batch=args.batch, incremental=not args.reprocess, profile=args.profile,
+                           plot_series=args.plot_series, dtype=np.float32 if args.float32 else np.float64,
+                           min_snr=args.min_snr, min_corr=args.min_corr, prefetch=args.prefetch,
+                           time_scales=args.time_scales, bootstrap=args.bootstrap)
+    if args.catalog_scan or args.select:
+        process_catalog_files(input_file_name=input_file_name, catalog_file=args.catalog, folders=args.catalog_scan,
+                              selection=None if args.select is None else dict(args.select), list_only=args.list,
+                              input_overrides=input_overrides, **process_options)
+        sys.exit()
+    process_vna_files(input_file_name=input_file_name, input_overrides=input_overrides, **process_options)
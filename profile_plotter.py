@@ -3,12 +3,70 @@
 Note:
     The script represents merely a start for plotting normalized TKE against normalized X. If required, enrich this
     script with more plot functions and integrate them in profile_analyst.process_vna_files at the bottom of the function.
+    matplotlib is only imported when a plot is created, which keeps the start-up of the analysis fast.
+    Plots are rendered with the Agg backend directly (no pyplot state), and figures and axes are reused for all plots
+    of the same kind, so that long runs do not accumulate open figures. Plot jobs can be rendered in a background
+    process while the analysis goes on (see start_plotting, submit_plot, and finish_plotting).
 """
-import matplotlib.pyplot as _plt
-import matplotlib.font_manager as _font_manager
+import os as _os
+import logging as _logging
+from concurrent.futures import ProcessPoolExecutor as _ProcessPoolExecutor
 import numpy as _np
 
 
+DPI = 220
+# maximum number of samples per line in time series plots (longer series are plotted with a stride)
+PLOT_MAX_POINTS = 20000
+HFONT = {'family': 'normal',
+         'weight': 'normal',
+         'size': 10,
+         'style': 'normal',
+         'fontname': 'Arial'}
+
+# reused (figure, axes) of every plot kind and font properties of this process
+_figures = {}
+_font = None
+# background plot process, the process that started it, and (file name, future or None if rendered) of plot jobs
+_executor = None
+_executor_pid = None
+_jobs = []
+
+
+def _get_figure(kind, figsize, n_rows=1):
+    """Get the figure and axes of a plot kind with cleared axes (figures are created once per kind and process)."""
+    if kind not in _figures:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure(figsize=figsize, dpi=DPI, facecolor='w', edgecolor='k')
+        FigureCanvasAgg(fig)
+        axes = [fig.add_subplot(n_rows, 1, i + 1) for i in range(n_rows)]
+        _figures[kind] = (fig, axes)
+    fig, axes = _figures[kind]
+    for axe in axes:
+        axe.clear()
+    return fig, axes
+
+
+def _get_font():
+    global _font
+    if _font is None:
+        import matplotlib.font_manager as _font_manager
+        _font = _font_manager.FontProperties(family=HFONT['fontname'],
+                                             weight=HFONT['weight'],
+                                             style=HFONT['style'],
+                                             size=HFONT['size'])
+    return _font
+
+
+def _import_matplotlib():
+    import matplotlib.figure
+    import matplotlib.backends.backend_agg
+
+
+def _get_stride(n_samples, max_points=PLOT_MAX_POINTS):
+    return max(1, -(-n_samples // max_points))
+
+
 def plot_xy(x, y, file_name):
     """
     Plots y data against x (1d-numpy array) and markers of local maxima and minima
@@ -20,26 +78,14 @@ def plot_xy(x, y, file_name):
     Returns:
         show and save plot in test folder as norm-TKE-x.png
     """
-
-    # set font properties
-    hfont = {'family': 'normal',
-             'weight': 'normal',
-             'size': 10,
-             'style': 'normal',
-             'fontname': 'Arial'}
-    font = _font_manager.FontProperties(family=hfont['fontname'],
-                                       weight=hfont['weight'],
-                                       style=hfont['style'],
-                                       size=hfont['size'])
     # create plot
-    fig = _plt.figure(figsize=(6, 3), dpi=220, facecolor='w', edgecolor='k')
-    axe = fig.add_subplot(1, 1, 1)
+    fig, (axe,) = _get_figure("xy", (6, 3))
     axe.scatter(x, y, color="slategray", label="normarlized TKE", s=10, edgecolor="black")
 
     # Define axis labels and legend
-    axe.set_xlabel("x / wood D (-)", **hfont)
-    axe.set_ylabel(r"TKE / U$^{2}$ (-)", **hfont)
-    # axe.legend(loc='upper left', prop=font, facecolor='w', edgecolor='gray', framealpha=1, fancybox=0)
+    axe.set_xlabel("x / wood D (-)", **HFONT)
+    axe.set_ylabel(r"TKE / U$^{2}$ (-)", **HFONT)
+    # axe.legend(loc='upper left', prop=_get_font(), facecolor='w', edgecolor='gray', framealpha=1, fancybox=0)
 
     # Set grid
     axe.grid(color='gray', linestyle='-', linewidth=0.2)
@@ -47,4 +93,124 @@ def plot_xy(x, y, file_name):
     # axe.set_xlim((int(_np.nanmin(x)) * 1.1, int(_np.nanmax(x) * 1.1)))
 
     # Output plot
-    _plt.savefig(file_name, bbox_inches='tight')
+    fig.savefig(file_name, bbox_inches='tight')
+
+
+def plot_time_series(time, series, file_name, max_points=PLOT_MAX_POINTS):
+    """Plot velocity time series in one panel per component.
+
+    Args:
+        time (numpy.array): time in s
+        series (dict): component names, such as u (m/s), as keys and velocity series (numpy.array) as values
+        file_name (str): name of the image file to write
+        max_points (int): maximum number of plotted samples per series (default: PLOT_MAX_POINTS)
+    """
+    fig, axes = _get_figure("series %i" % len(series), (6, 1.5 * len(series)), n_rows=len(series))
+    stride = _get_stride(time.size, max_points)
+    for axe, (name, values) in zip(axes, series.items()):
+        axe.plot(time[::stride], values[::stride], color="slategray", linewidth=0.3)
+        axe.set_ylabel(name, **HFONT)
+        axe.grid(color='gray', linestyle='-', linewidth=0.2)
+        axe.tick_params(labelbottom=False)
+    axes[-1].tick_params(labelbottom=True)
+    axes[-1].set_xlabel("time (s)", **HFONT)
+    fig.savefig(file_name, bbox_inches='tight')
+
+
+def plot_spikes(time, raw, spikes, file_name, max_points=PLOT_MAX_POINTS):
+    """Plot spike diagnostics: raw velocity series with markers at spikes.
+
+    Args:
+        time (numpy.array): time in s
+        raw (dict): component names, such as u (m/s), as keys and raw velocity series (numpy.array) as values
+        spikes (dict): tuples of times and raw velocities of the spikes (numpy.arrays) with the keys of raw
+        file_name (str): name of the image file to write
+        max_points (int): maximum number of plotted samples per raw series (spike markers are not thinned out)
+    """
+    fig, axes = _get_figure("spikes %i" % len(raw), (6, 1.5 * len(raw)), n_rows=len(raw))
+    stride = _get_stride(time.size, max_points)
+    for axe, (name, values) in zip(axes, raw.items()):
+        spike_time, spike_values = spikes[name]
+        axe.plot(time[::stride], values[::stride], color="slategray", linewidth=0.3)
+        axe.scatter(spike_time, spike_values, color="firebrick", s=4, label="%i spikes" % spike_time.size)
+        axe.set_ylabel(name, **HFONT)
+        axe.legend(loc='upper right', prop=_get_font(), facecolor='w', edgecolor='gray', framealpha=1, fancybox=0)
+        axe.grid(color='gray', linestyle='-', linewidth=0.2)
+        axe.tick_params(labelbottom=False)
+    axes[-1].tick_params(labelbottom=True)
+    axes[-1].set_xlabel("time (s)", **HFONT)
+    fig.savefig(file_name, bbox_inches='tight')
+
+
+def start_plotting():
+    """Start a background process that renders plot jobs of submit_plot (until finish_plotting)."""
+    global _executor, _executor_pid
+    if _executor is None:
+        _executor = _ProcessPoolExecutor(max_workers=1)
+        _executor_pid = _os.getpid()
+        # import matplotlib in the background process before the first plot job arrives
+        _executor.submit(_import_matplotlib)
+
+
+def submit_plot(plot_fun, *args, **kwargs):
+    """Render a plot in the background process, or immediately if start_plotting was not called (by this process).
+
+    Args:
+        plot_fun (function): plot function of this module, such as plot_xy
+        *args: arguments of plot_fun with the file name as last argument (numpy.arrays are copied to the background
+            process)
+        **kwargs: keyword arguments of plot_fun
+    """
+    # worker processes of the analysis inherit the executor of their parent, but cannot use it
+    if _executor is None or _executor_pid != _os.getpid():
+        try:
+            plot_fun(*args, **kwargs)
+        except Exception as e:
+            _logging.warning("WARNING: could not create %s (%s)" % (args[-1], e))
+        return
+    _jobs.append((args[-1], _executor.submit(plot_fun, *args, **kwargs)))
+
+
+def submit_plot_series(time, raw, despiked, file_stem, max_points=PLOT_MAX_POINTS):
+    """Submit plots of despiked velocity series (file_stem-velocity.png) and spike diagnostics
+    (file_stem-spike-diagnostics.png) of a measurement (see submit_plot). The series are thinned out before they are
+    copied to the background process.
+
+    Args:
+        time (numpy.array): time in s
+        raw (dict): component names, such as u (m/s), as keys and raw velocity series (numpy.array) as values
+        despiked (dict): despiked velocity series with the keys of raw
+        file_stem (str): image file name without suffix and file ending
+        max_points (int): maximum number of plotted samples per series (default: PLOT_MAX_POINTS)
+    """
+    stride = _get_stride(time.size, max_points)
+    spikes = {}
+    for name, values in raw.items():
+        # samples that the despiking removed or replaced
+        spike_idx = _np.flatnonzero((values != despiked[name]) & ~_np.isnan(values))
+        spikes[name] = (time[spike_idx], values[spike_idx])
+    submit_plot(plot_time_series, time[::stride], {name: values[::stride] for name, values in despiked.items()},
+                file_stem + "-velocity.png")
+    submit_plot(plot_spikes, time[::stride], {name: values[::stride] for name, values in raw.items()}, spikes,
+                file_stem + "-spike-diagnostics.png")
+
+
+def finish_plotting():
+    """Wait for all submitted plot jobs and stop the background process (failed plots are logged as warnings).
+
+    Returns:
+        list: names of the image files of all plot jobs in the background process
+    """
+    global _executor, _executor_pid
+    file_names = []
+    while _jobs:
+        file_name, job = _jobs.pop(0)
+        file_names.append(file_name)
+        try:
+            job.result()
+        except Exception as e:
+            _logging.warning("WARNING: could not create %s (%s)" % (file_name, e))
+    if _executor is not None and _executor_pid == _os.getpid():
+        _executor.shutdown()
+        _executor, _executor_pid = None, None
+    return file_names
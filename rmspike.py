@@ -1,11 +1,309 @@
 import numpy as np
-import pandas as pd
 import logging
 
 
+# replacement strategies of spikes: NaN, linear interpolation between the neighbouring valid samples, or the last
+# valid sample
+FILL_METHODS = ["nan", "linear", "last-valid"]
+
+
+def _get_neighbours(mask, sources):
+	"""Find the previous and next source sample of every masked sample in the rows of (components, samples) arrays.
+
+	Returns:
+		tuple: flat positions of masked samples, flat positions of previous and next sources, and boolean arrays that
+		indicate if the previous and next sources exist in the same row
+	"""
+	n = mask.shape[-1]
+	masked = np.flatnonzero(mask)
+	source_positions = np.flatnonzero(sources)
+	if source_positions.size == 0:
+		no_source = np.zeros(masked.size, dtype=bool)
+		return masked, masked, masked, no_source, no_source
+	row = masked // n
+	next_source = np.searchsorted(source_positions, masked)
+	prev_pos = source_positions[np.maximum(next_source - 1, 0)]
+	next_pos = source_positions[np.minimum(next_source, source_positions.size - 1)]
+	has_prev = (next_source > 0) & (prev_pos // n == row)
+	has_next = (next_source < source_positions.size) & (next_pos // n == row)
+	return masked, prev_pos, next_pos, has_prev, has_next
+
+
+def fill_spikes(values, mask, fill="nan", last_valid=None):
+	""" Replace masked samples of a (components, samples) array in place.
+
+	Args:
+		values (np.array): writable float array of shape (components, samples)
+		mask (np.array): boolean array of the shape of values that is True for samples to replace
+		fill (str): nan (default) replaces with np.nan, linear interpolates linearly between the previous and next
+			valid (neither masked nor NaN) samples (or takes the nearest valid sample at the edges), and last-valid
+			takes the previous valid sample
+		last_valid (np.array): values of the (components) that precede the first samples (last-valid only; samples
+			without previous valid sample become NaN if None)
+
+	Returns:
+		np.array: values
+	"""
+	if fill not in FILL_METHODS:
+		raise ValueError("Unknown spike fill method {0} (available: {1})".format(fill, FILL_METHODS))
+	if fill == "nan":
+		np.copyto(values, np.nan, where=mask)
+		return values
+	flat = values.reshape(-1)
+	masked, prev_pos, next_pos, has_prev, has_next = _get_neighbours(mask, ~mask & ~np.isnan(values))
+	if fill == "linear":
+		prev_pos = np.where(has_prev, prev_pos, next_pos)
+		next_pos = np.where(has_next, next_pos, prev_pos)
+		span = next_pos - prev_pos
+		weight = np.divide(masked - prev_pos, span, out=np.zeros(masked.size), where=span > 0)
+		replacement = flat[prev_pos] + weight * (flat[next_pos] - flat[prev_pos])
+		# rows without any valid sample
+		replacement[~(has_prev | has_next)] = np.nan
+	else:
+		replacement = flat[prev_pos]
+		first = np.nan if last_valid is None else np.asarray(last_valid, dtype=np.float64)[masked // values.shape[-1]]
+		replacement = np.where(has_prev, replacement, first)
+	flat[masked] = replacement
+	return values
+
+
+def _outside_ellipse(x, y, a, b, theta=None):
+	"""Test if points (x, y) of (components, samples) arrays lie outside of ellipses with the (components, 1) major
+	and minor axes a and b that are rotated by theta (default: no rotation)."""
+	if theta is not None:
+		x, y = x * np.cos(theta) + y * np.sin(theta), y * np.cos(theta) - x * np.sin(theta)
+	x = x * (1. / a)
+	x *= x
+	y = y * (1. / b)
+	y *= y
+	x += y
+	return x > 1.
+
+
+def phase_space_spikes(velocities, max_iter=20):
+	""" Iterative phase-space thresholding of Goring & Nikora (2002) with the corrections of Wahl (2003).
+
+	Args:
+		velocities (np.array): velocity components of shape (components, samples), e.g., np.stack((u, v, w))
+		max_iter (int): maximum number of iterations (default: 20)
+
+	Returns:
+		tuple (np.array, list): boolean spike mask of the shape of velocities and numbers of new spikes per component
+		for every iteration (np.arrays)
+
+	Note:
+		In every iteration, all components are tested at once: velocity fluctuations, and their first and second
+		differences are tested against three ellipsoids (projected on the u-du, du-d2u, and u-d2u planes) with axes
+		that result from the universal threshold sqrt(2 ln n) and the standard deviations. Spikes are replaced by
+		linear interpolation for the next iteration, which stops when no new spikes are found.
+	"""
+	velocities = np.asarray(velocities, dtype=np.float64)
+	missing = np.isnan(velocities)
+	spikes = np.zeros(velocities.shape, dtype=bool)
+	iteration_counts = []
+	n = np.count_nonzero(~missing, axis=-1)[:, None]
+	with np.errstate(invalid="ignore", divide="ignore"):
+		universal = np.sqrt(2. * np.log(n))
+		for _ in range(max_iter):
+			values = velocities.copy()
+			fill_spikes(values, missing | spikes, fill="linear")
+			fluctuation = values - values.mean(axis=-1, keepdims=True)
+			d1 = np.gradient(fluctuation, axis=-1) if values.shape[-1] > 1 else np.zeros(values.shape)
+			d2 = np.gradient(d1, axis=-1) if values.shape[-1] > 1 else np.zeros(values.shape)
+			std_u = fluctuation.std(axis=-1, keepdims=True)
+			std_d1 = d1.std(axis=-1, keepdims=True)
+			std_d2 = d2.std(axis=-1, keepdims=True)
+			theta = np.arctan((fluctuation * d2).sum(axis=-1, keepdims=True) / (fluctuation ** 2).sum(
+				axis=-1, keepdims=True))
+			# axes of the rotated u-d2u ellipse (no bound if the equations have no positive solution)
+			cos2, sin2 = np.cos(theta) ** 2, np.sin(theta) ** 2
+			a2 = ((universal * std_u) ** 2 * cos2 - (universal * std_d2) ** 2 * sin2) / (cos2 ** 2 - sin2 ** 2)
+			b2 = ((universal * std_d2) ** 2 * cos2 - (universal * std_u) ** 2 * sin2) / (cos2 ** 2 - sin2 ** 2)
+			a3 = np.where(a2 > 0, np.sqrt(np.abs(a2)), np.inf)
+			b3 = np.where(b2 > 0, np.sqrt(np.abs(b2)), np.inf)
+			outside = (_outside_ellipse(fluctuation, d1, universal * std_u, universal * std_d1)
+					   | _outside_ellipse(d1, d2, universal * std_d1, universal * std_d2)
+					   | _outside_ellipse(fluctuation, d2, a3, b3, theta))
+			new_spikes = outside & ~spikes & ~missing
+			new_counts = np.count_nonzero(new_spikes, axis=-1)
+			if not new_counts.any():
+				break
+			iteration_counts.append(new_counts)
+			spikes |= new_spikes
+	return spikes, iteration_counts
+
+
+def despike(velocities, averages, stds, method="velocity", freq=200., lambda_a=1.0, k=3.0, fill="nan",
+			previous=None):
+	""" Detect spikes in a (components, samples) array of velocities and replace them in place - see rmspike.
+	Every test evaluates one boolean mask for all components at once, and the spike counts derive from the masks.
+
+	Args:
+		velocities (np.array): writable float array of shape (components, samples), e.g., np.stack((u, v, w))
+		averages (list): velocity averages of the components (velocity threshold)
+		stds (list): velocity standard deviations of the components (velocity threshold)
+		method (str): determines whether to use acceleration, velocity (default), or phase-space thresholds for despiking
+		freq (int): sampling frequency in 1/s (Hz); default is 200 Hz
+		lambda_a (float): multiplier of gravitational acceleration (acceleration threshold)
+		k (float): multiplier of velocity stdev (velocity threshold)
+		fill (str): replacement of spikes (see FILL_METHODS and fill_spikes; default: nan)
+		previous (dict): state of the previous block returned by despike (None for the first block or complete records)
+
+	Returns:
+		tuple (dict, dict): spike counts per component (np.arrays) with the keys acceleration, velocity, and (with
+		method phase-space) phase-space iteration 1, 2, ...; state for processing the next block
+	"""
+	n_components = velocities.shape[0]
+	last_raw = np.full(n_components, np.nan) if previous is None else previous["last raw"]
+	averages = np.asarray(averages, dtype=np.float64).reshape(n_components, 1)
+	stds = np.asarray(stds, dtype=np.float64).reshape(n_components, 1)
+
+	# acceleration between consecutive samples (NaN comparisons are False, i.e., NaN is never a spike)
+	acceleration = np.diff(velocities, axis=-1, prepend=last_raw[:, None])
+	acceleration *= freq
+	np.abs(acceleration, out=acceleration)
+	acceleration_spikes = acceleration >= 9.81 * lambda_a
+	del acceleration
+	velocity_spikes = (velocities <= averages - k * stds) | (velocities >= averages + k * stds)
+	spike_counts = {
+		"acceleration": np.count_nonzero(acceleration_spikes, axis=-1),
+		"velocity": np.count_nonzero(velocity_spikes, axis=-1),
+	}
+	if "vel" in method:
+		spikes = velocity_spikes
+	elif method == "phase-space":
+		if previous is not None:
+			raise ValueError("phase-space despiking requires the complete record and cannot be applied to blocks")
+		spikes, iteration_counts = phase_space_spikes(velocities)
+		spike_counts.update({"phase-space iteration %i" % (i + 1): counts for i, counts in enumerate(iteration_counts)})
+	else:
+		spikes = acceleration_spikes
+
+	state = {"last raw": velocities[:, -1].copy() if velocities.shape[-1] else last_raw}
+	fill_spikes(velocities, spikes, fill=fill, last_valid=None if previous is None else previous["last valid"])
+	last_valid = np.full(n_components, np.nan) if previous is None else previous["last valid"]
+	if velocities.shape[-1]:
+		is_valid = ~np.isnan(velocities)
+		last_idx = velocities.shape[-1] - 1 - np.argmax(is_valid[:, ::-1], axis=-1)
+		last_valid = np.where(is_valid.any(axis=-1), velocities[np.arange(n_components), last_idx], last_valid)
+	state["last valid"] = last_valid
+	return spike_counts, state
+
+
+def _sorted_prefix_moments(keys, deviations, thresholds):
+	"""Count, mean, and variance of the deviations of the samples with keys below every threshold (keys are sorted
+	once, and the moments derive from prefix sums)."""
+	order = np.argsort(keys, kind="stable")
+	sorted_keys = keys[order]
+	sorted_deviations = deviations[order]
+	prefix_1 = np.concatenate(([0.], np.cumsum(sorted_deviations)))
+	prefix_2 = np.concatenate(([0.], np.cumsum(sorted_deviations * sorted_deviations)))
+	n_below = np.searchsorted(sorted_keys, thresholds, side="left")
+	with np.errstate(invalid="ignore", divide="ignore"):
+		mean = prefix_1[n_below] / n_below
+		var = np.maximum(prefix_2[n_below] / n_below - mean * mean, 0.)
+	return n_below, mean, var
+
+
+def despike_sweep(velocities, averages, stds, k_values, lambda_values, freq=200.):
+	""" Spike counts and despiked velocity stats for grids of velocity and acceleration thresholds (see despike) with
+	one sort per component instead of one despiking run per grid point.
+
+	Args:
+		velocities (np.array): velocity components of shape (components, samples), e.g., np.stack((u, v, w))
+		averages (list): velocity averages of the components (velocity threshold)
+		stds (list): velocity standard deviations of the components (velocity threshold)
+		k_values (list): multipliers of velocity stdev (velocity thresholds)
+		lambda_values (list): multipliers of gravitational acceleration (acceleration thresholds)
+		freq (int): sampling frequency in 1/s (Hz); default is 200 Hz
+
+	Returns:
+		dict: np.arrays of shape (k_values, components) with the keys velocity spikes, velocity despiked average, and
+		velocity despiked std, and of shape (lambda_values, components) with the keys acceleration spikes,
+		acceleration despiked average, and acceleration despiked std (despiked means without the spikes of the
+		respective method)
+
+	Note:
+		Velocity spikes are samples with an absolute deviation from the average of at least k times the standard
+		deviation. The absolute deviations (and accelerations) are sorted once, spike counts for all thresholds result
+		from np.searchsorted, and the despiked moments from prefix sums of the sorted deviations.
+	"""
+	velocities = np.asarray(velocities, dtype=np.float64)
+	averages = np.asarray(averages, dtype=np.float64)
+	stds = np.asarray(stds, dtype=np.float64)
+	k_values = np.asarray(k_values, dtype=np.float64)
+	lambda_values = np.asarray(lambda_values, dtype=np.float64)
+	deviations = velocities - averages[:, None]
+	is_valid = ~np.isnan(velocities)
+	n_valid = np.count_nonzero(is_valid, axis=-1)
+	# NaN samples get infinite keys (never below a threshold, never counted)
+	velocity_keys = np.where(is_valid, np.abs(deviations), np.inf)
+	acceleration = np.abs(np.diff(velocities, axis=-1, prepend=np.nan) * freq)
+	n_acceleration = np.count_nonzero(~np.isnan(acceleration), axis=-1)
+	# samples without acceleration (first sample and samples next to gaps) are never acceleration spikes
+	acceleration_keys = np.where(is_valid, np.nan_to_num(acceleration, nan=-1.), np.inf)
+	zero_deviations = np.where(is_valid, deviations, 0.)
+
+	sweep = {key: [] for key in ["velocity spikes", "velocity despiked average", "velocity despiked std",
+								 "acceleration spikes", "acceleration despiked average", "acceleration despiked std"]}
+	for c in range(velocities.shape[0]):
+		n_below, mean, var = _sorted_prefix_moments(velocity_keys[c], zero_deviations[c], k_values * stds[c])
+		sweep["velocity spikes"].append(n_valid[c] - n_below)
+		sweep["velocity despiked average"].append(averages[c] + mean)
+		sweep["velocity despiked std"].append(np.sqrt(var))
+		thresholds = 9.81 * lambda_values
+		n_below, mean, var = _sorted_prefix_moments(acceleration_keys[c], zero_deviations[c], thresholds)
+		sweep["acceleration spikes"].append(
+			n_acceleration[c] - np.searchsorted(np.sort(acceleration[c][~np.isnan(acceleration[c])]), thresholds))
+		sweep["acceleration despiked average"].append(averages[c] + mean)
+		sweep["acceleration despiked std"].append(np.sqrt(var))
+	return {key: np.stack(values, axis=-1) for key, values in sweep.items()}
+
+
+def _get_components(profile_type, u_stats=None, v_stats=None, w_stats=None, w2_stats=None):
+	"""Get velocity columns, spike count headers, and velocity stats as a function of probe orientation."""
+	if not (profile_type == "lp"):
+		return (["u (m/s)", "v (m/s)", "w1 (m/s)", "w2 (m/s)"], ["u spikes", "v spikes", "w1 spikes", "w2 spikes"],
+				[u_stats, v_stats, w_stats, w2_stats])
+	return ["u (m/s)", "v (m/s)", "w1 (m/s)"], ["u spikes", "v spikes", "w spikes"], [u_stats, v_stats, w_stats]
+
+
+def get_despike_columns(profile_type="lp"):
+	"""Get the names of the velocity columns that are despiked as a function of probe orientation.
+
+	Args:
+		profile_type (str): orientation of the probe (default: lp)
+
+	Returns:
+		list: column names (u, v, w1, and w2 if profile_type is not lp)
+	"""
+	return _get_components(profile_type)[0]
+
+
+def get_spike_stats(spike_counts, profile_type="lp", rejected=None):
+	""" Create the spike_stats output documentation dataframe of rmspike.
+
+	Args:
+		spike_counts (dict): spike counts per component (see despike)
+		profile_type (str): orientation of the probe (default: lp)
+		rejected (dict): counts of samples per velocity column that the quality filter rejected before despiking
+			(see vna_reader.filter_quality); listed in a first row "quality rejected" if provided (default: None)
+
+	Returns:
+		pandas.DataFrame: spike counts with one row per key of spike_counts and one column per velocity component
+	"""
+	import pandas as pd
+	if rejected:
+		spike_counts = dict({"quality rejected": [rejected.get(col, 0) for col in get_despike_columns(profile_type)]},
+							**spike_counts)
+	return pd.DataFrame(data=[list(counts) for counts in spike_counts.values()],
+						columns=_get_components(profile_type)[1],
+						index=list(spike_counts.keys()))
+
+
 def rmspike(vna_df, u_stats, v_stats, w_stats, w2_stats=None,
 			method="velocity",
-			freq=200., lambda_a=1.0, k=3.0, profile_type="lp"):
+			freq=200., lambda_a=1.0, k=3.0, profile_type="lp", fill="nan", rejected=None):
 	""" Spike removal and replacement - see Nikora & Goring (1999) and Goring & Nikora (2002).
 
 	Args:
@@ -14,107 +312,83 @@ def rmspike(vna_df, u_stats, v_stats, w_stats, w2_stats=None,
 		v_stats (pandas.DataFrame): perpendicular velocity stats from flowstat function
 		w_stats (pandas.DataFrame): vertical velocity stats from flowstat function
 		w2_stats (pandas.DataFrame): sec. vertical velocity stats from flowstat function (only required if profile_type is not lp)
-		method (str): determines whether to use acceleration or velocity (default) for despiking
+		method (str): determines whether to use acceleration, velocity (default), or phase-space thresholds for despiking
 		freq (int): sampling frequency in 1/s (Hz); default is 200 Hz
 		lambda_a (float): multiplier of gravitational acceleration (acceleration threshold)
 		k (float): multiplier of velocity stdev (velocity threshold)
 		side (str): orientation of the probe (default: DOWN, which mean probe looks like FlowTracker in a river)
+		fill (str): replacement of spikes (see FILL_METHODS; default: nan)
+		rejected (dict): counts of samples per velocity column that the quality filter rejected before despiking,
+			which are listed in spike_stats (see get_spike_stats; default: None)
 
 	Note:
 		Goring & Nikora (2002) suggest lambda_a = 1.0 ~ 1.5 and k = 1.5, but we shall use lambda_a = 1.0 and k = 3 ~ 9.
 		SonTek, Nortek, and Lei recommend the SNR and correlation thresholds to be 15 and 70 respectively.
-		Though data points have high SNR, the correlation can be low.
+		Though data points have high SNR, the correlation can be low. Samples below the thresholds are replaced with
+		NaN when the files are read (see vna_reader.filter_quality), and NaN is never a spike.
+		The spikes are detected and replaced by the despike function, which works on NumPy arrays.
 	"""
-
-	# Acceleration a
-	# Any operation with NaN will return NaN
-	# Hence, only two consecutive data records (i.e. delta t = 1/f) will produce a set of acceleration components.
-	# shift(1) makes the first (0) entries of a_i being np.nan (i.e. first acceleration is in 2nd row of a_i)
-	print("   - calculating accelerations ...")
-	a_x = (vna_df["u (m/s)"].shift(-1) - vna_df["u (m/s)"]).shift(1) * freq
-	a_y = (vna_df["v (m/s)"].shift(-1) - vna_df["v (m/s)"]).shift(1) * freq
-	a_z = (vna_df["w1 (m/s)"].shift(-1) - vna_df["w1 (m/s)"]).shift(1) * freq
-	if not(profile_type == "lp"):
-		a_z2 = (vna_df["w2 (m/s)"].shift(-1) - vna_df["w2 (m/s)"]).shift(1) * freq
-		# set headers as a function of probe orientation
-		hdr_spkct = ["u spikes", "v spikes", "w1 spikes", "w2 spikes"]
-	else:
-		# set headers as a function of probe orientation
-		hdr_spkct = ["u spikes", "v spikes", "w spikes"]
-
-	# Goring & Nikora (2002)'s Acceleration Thresholding Method (ATM) tests the acceleration thresholds first
-	print("   - looking for acceleration spikes ...")
-	a_cr = 9.81 * lambda_a  # acceleration threshold
-	spikeu = np.nansum(np.where(~((a_x > -a_cr) & (a_x < a_cr)) & ~np.isnan(a_x), 1, 0))
-	spikev = np.nansum(np.where(~((a_y > -a_cr) & (a_y < a_cr)) & ~np.isnan(a_y), 1, 0))
-	spikew1 = np.nansum(np.where(~((a_z > -a_cr) & (a_z < a_cr)) & ~np.isnan(a_z), 1, 0))
-	spikevct = [spikeu, spikev, spikew1]
-	if not (profile_type == "lp"):
-		spikew2 = np.nansum(np.where(~((a_z2 > -a_cr) & (a_z2 < a_cr)) & ~np.isnan(a_z2), 1, 0))
-		spikevct.append(spikew2)
-
-	# calculate velocity thresholds for despiking
-	print("   - looking for velocity spikes ...")
-	u_crl = u_stats["average"] - k * u_stats["std"]
-	u_cru = u_stats["average"] + k * u_stats["std"]
-	v_crl = v_stats["average"] - k * v_stats["std"]
-	v_cru = v_stats["average"] + k * v_stats["std"]
-	w_crl = w_stats["average"] - k * w_stats["std"]
-	w_cru = w_stats["average"] + k * w_stats["std"]
-
-	spikeu_vel = np.nansum(np.where(~((vna_df["u (m/s)"] > u_crl) & (vna_df["u (m/s)"] < u_cru)) & ~np.isnan(vna_df["u (m/s)"]), 1, 0))
-	spikev_vel = np.nansum(np.where(~((vna_df["v (m/s)"] > v_crl) & (vna_df["v (m/s)"] < v_cru)) & ~np.isnan(vna_df["v (m/s)"]), 1, 0))
-	spikew1_vel = np.nansum(np.where(~((vna_df["w1 (m/s)"] > w_crl) & (vna_df["w1 (m/s)"] < w_cru)) & ~np.isnan(vna_df["w1 (m/s)"]), 1, 0))
-	spikevct_vel = [spikeu_vel, spikev_vel, spikew1_vel]
-	if not (profile_type == "lp"):
-		w2_crl = w2_stats["average"] - k * w2_stats["std"]
-		w2_cru = w2_stats["average"] + k * w2_stats["std"]
-		spikew2_vel = np.nansum(np.where(~((vna_df["w2 (m/s)"] > w2_crl) & (vna_df["w2 (m/s)"] < w2_cru)) & ~np.isnan(vna_df["w2 (m/s)"]), 1, 0))
-		spikevct_vel.append(spikew2_vel)
-
+	cols, _, vel_stats = _get_components(profile_type, u_stats, v_stats, w_stats, w2_stats)
+	print("   - looking for acceleration and velocity spikes ...")
+	velocities = np.stack([vna_df[col].to_numpy(dtype=np.float64) for col in cols])
 	if "vel" in method:
 		print("   - running select VELOCITY despiking method (provided argument: %s)" % str(method))
-		vna_df["u (m/s)"] = np.where(
-			~((vna_df["u (m/s)"] > u_crl) & (vna_df["u (m/s)"] < u_cru)) & ~np.isnan(vna_df["u (m/s)"]),
-			np.nan, vna_df["u (m/s)"]
-			)
-		vna_df["v (m/s)"] = np.where(
-			~((vna_df["v (m/s)"] > v_crl) & (vna_df["v (m/s)"] < v_cru)) & ~np.isnan(vna_df["v (m/s)"]),
-			np.nan, vna_df["v (m/s)"]
-		)
-		vna_df["w1 (m/s)"] = np.where(
-			~((vna_df["w1 (m/s)"] > w_crl) & (vna_df["w1 (m/s)"] < w_cru)) & ~np.isnan(vna_df["w1 (m/s)"]),
-			np.nan, vna_df["w1 (m/s)"]
-		)
-		if not (profile_type == "lp"):
-			vna_df["w2 (m/s)"] = np.where(
-				~((vna_df["w2 (m/s)"] > w2_crl) & (vna_df["w2 (m/s)"] < w2_cru)) & ~np.isnan(vna_df["w2 (m/s)"]),
-				np.nan, vna_df["w2 (m/s)"]
-			)
+	elif method == "phase-space":
+		print("   - running select PHASE-SPACE despiking method (provided argument: %s)" % str(method))
 	else:
 		print("   - running select ACCELERATION despiking method (provided argument: %s)" % str(method))
-		vna_df["u (m/s)"] = np.where(
-			~((a_x > -a_cr) & (a_x < a_cr)) & ~np.isnan(a_x),
-			np.nan, vna_df["u (m/s)"]
-		)
-		vna_df["v (m/s)"] = np.where(
-			~((a_y > -a_cr) & (a_y < a_cr)) & ~np.isnan(a_y),
-			np.nan, vna_df["v (m/s)"]
-		)
-		vna_df["w1 (m/s)"] = np.where(
-			~((a_z > -a_cr) & (a_z < a_cr)) & ~np.isnan(a_z),
-			np.nan, vna_df["w1 (m/s)"]
-		)
-		if not (profile_type == "lp"):
-			vna_df["w2 (m/s)"] = np.where(
-				~((a_z2 > -a_cr) & (a_z2 < a_cr)) & ~np.isnan(a_z2),
-				np.nan, vna_df["w2 (m/s)"]
-			)
-
-	# create output documentation dataframe
-	spike_stats = pd.DataFrame(data=[spikevct, spikevct_vel],
-								columns=hdr_spkct,
-								index=["acceleration", "velocity"])
+	spike_counts, _ = despike(velocities,
+							  averages=[stats["average"] for stats in vel_stats],
+							  stds=[stats["std"] for stats in vel_stats],
+							  method=method, freq=freq, lambda_a=lambda_a, k=k, fill=fill)
+	for i, col in enumerate(cols):
+		vna_df[col] = velocities[i]
+
+	# create output documentation dataframe (with new spikes of every phase-space iteration)
+	spike_stats = get_spike_stats(spike_counts, profile_type, rejected)
 
 	return spike_stats, vna_df
 
+
+def rmspike_block(block, u_stats, v_stats, w_stats, w2_stats=None,
+			method="velocity",
+			freq=200., lambda_a=1.0, k=3.0, profile_type="lp", fill="nan", previous=None):
+	""" Spike removal and replacement for one block of a file that is processed in chunks - see rmspike.
+
+	Args:
+		block (dict): keys correspond to vna column names and values to np.arrays of one block (modified in place)
+		u_stats (dict): streamwise velocity stats of the complete file from flowstat
+		v_stats (dict): perpendicular velocity stats of the complete file from flowstat
+		w_stats (dict): vertical velocity stats of the complete file from flowstat
+		w2_stats (dict): sec. vertical velocity stats of the complete file (only required if profile_type is not lp)
+		method (str): determines whether to use acceleration or velocity (default) for despiking
+		freq (int): sampling frequency in 1/s (Hz); default is 200 Hz
+		lambda_a (float): multiplier of gravitational acceleration (acceleration threshold)
+		k (float): multiplier of velocity stdev (velocity threshold)
+		profile_type (str): orientation of the probe (default: lp)
+		fill (str): replacement of spikes, nan (default) or last-valid
+		previous (dict): state of the previous block returned by rmspike_block (None for the first block)
+
+	Returns:
+		tuple (pandas.DataFrame, dict): spike counts of the block (like rmspike) and the state of the block (pass as
+		previous to the next block)
+
+	Note:
+		The acceleration of the first sample of a block refers to the last (raw) sample of the previous block, which
+		gives the same result as rmspike applied to the complete file. Phase-space thresholding and linear
+		interpolation require the complete record and are not available for blocks.
+	"""
+	if method == "phase-space" or fill == "linear":
+		raise ValueError("phase-space despiking and linear spike interpolation require the complete record and "
+						 "cannot be applied to blocks")
+	cols, _, vel_stats = _get_components(profile_type, u_stats, v_stats, w_stats, w2_stats)
+	velocities = np.stack([np.asarray(block[col], dtype=np.float64) for col in cols])
+	spike_counts, state = despike(velocities,
+								  averages=[stats["average"] for stats in vel_stats],
+								  stds=[stats["std"] for stats in vel_stats],
+								  method=method, freq=freq, lambda_a=lambda_a, k=k, fill=fill,
+								  previous=previous)
+	for i, col in enumerate(cols):
+		block[col] = velocities[i]
+
+	return get_spike_stats(spike_counts, profile_type), state
@@ -0,0 +1,178 @@
+"""Block sums of velocity moments and time-resolved (sliding-window) flow statistics
+
+Note:
+    Cumulative sums of the counts, sums, and squares of u, v, and w, and of the counts, products, and component sums
+    of the pairs u-v and u-w give the sums of any block of consecutive samples with two lookups, so that the means,
+    variances, TKE, and Reynolds stresses of all windows (or bootstrap replicates, see bootstrap.py) cost O(n)
+    independently of the window length. NaN samples are ignored like in flowstat. The components are shifted by
+    their means before summing to avoid cancellation in the squares. Sliding windows of WINDOW_DURATION seconds are
+    evaluated every WINDOW_STRIDE seconds (see config.py); update_rolling carries the samples of incomplete windows
+    over to the next chunk, so that chunks of a record yield the same windows as the complete record.
+"""
+import numpy as np
+from config import WINDOW_DURATION, WINDOW_STRIDE
+
+
+# pairs of u, v, and w of the Reynolds stresses (like in flowstat)
+BLOCK_PAIRS = [(0, 1), (0, 2)]
+# number of block sums per block: counts, sums, and squares of u, v, and w, and 4 sums per pair
+BLOCK_QUANTITIES = 9 + 4 * len(BLOCK_PAIRS)
+ROLLING_COLUMNS = ["time (s)", "samples (-)", "u average (m/s)", "v average (m/s)", "w average (m/s)", "u std (m/s)",
+                   "v std (m/s)", "w std (m/s)", "TKE (m^2/s^2)", "tau_v (m^2/s^2)", "tau_w (m^2/s^2)"]
+
+
+def _get_shift(stack):
+    """Get the means of the valid samples of a (components, samples) array (0 for components without samples)."""
+    valid = ~np.isnan(stack)
+    return np.where(valid, stack, 0.).sum(axis=-1) / np.maximum(valid.sum(axis=-1), 1)
+
+
+def get_cumulative_sums(u, v, w, shift=None):
+    """Prepare the cumulative sums of the block quantities, which are calculated one quantity at a time to keep the
+    memory use of long records at a few arrays of the record length.
+
+    Args:
+        u (np.array): streamwise velocities
+        v (np.array): perpendicular velocities
+        w (np.array): vertical velocities (w1 if profile_type is lp and w2 otherwise, like in flowstat)
+        shift (np.array): (3) values that are subtracted from u, v, and w (default: None, i.e., their means)
+
+    Returns:
+        tuple (generator, np.array): generator of (column, cumulative) tuples with the column of the quantity (see
+        get_block_sums) and its (samples + 1) cumulative sum starting with 0 (the array is overwritten with the next
+        quantity), and the (3) shift
+    """
+    # np.stack copies the series, which are centered in place
+    centered = np.stack((u, v, w)).astype(np.float64, copy=False)
+    shift = _get_shift(centered) if shift is None else shift
+    valid = ~np.isnan(centered)
+    centered -= np.asarray(shift)[:, np.newaxis]
+    centered[~valid] = 0.
+    return _iter_cumulative_sums(valid, centered), shift
+
+
+def _iter_cumulative_sums(valid, centered):
+    cumulative = np.zeros(centered.shape[-1] + 1)
+    for i in range(3):
+        for column, values in [(i, valid[i]), (3 + i, centered[i]), (6 + i, centered[i] ** 2)]:
+            np.cumsum(values, out=cumulative[1:])
+            yield column, cumulative
+    for p, (i, j) in enumerate(BLOCK_PAIRS):
+        pair_valid = valid[i] & valid[j]
+        for column, values in [(9 + 4 * p, pair_valid), (10 + 4 * p, centered[i] * centered[j] * pair_valid),
+                               (11 + 4 * p, centered[i] * pair_valid), (12 + 4 * p, centered[j] * pair_valid)]:
+            np.cumsum(values, out=cumulative[1:])
+            yield column, cumulative
+
+
+def get_block_sums(u, v, w, block_samples, stride=1, shift=None):
+    """Calculate the sums of blocks of block_samples consecutive samples with cumulative sums.
+
+    Args:
+        u (np.array): streamwise velocities
+        v (np.array): perpendicular velocities
+        w (np.array): vertical velocities (w1 if profile_type is lp and w2 otherwise, like in flowstat)
+        block_samples (int): number of samples per block
+        stride (int): number of samples between the starts of consecutive blocks (default: 1, i.e., every sample)
+        shift (np.array): (3) values that are subtracted from u, v, and w (default: None, i.e., their means)
+
+    Returns:
+        tuple (np.array, np.array): (blocks, BLOCK_QUANTITIES) array with the block sums of the counts, sums, and
+        squares of the shifted u, v, and w, and of the counts, products, and sums of both shifted components of the
+        pairs u-v and u-w, and the (3) shift
+    """
+    starts = np.arange(0, np.asarray(u).size - block_samples + 1, stride)
+    sums = np.empty((starts.size, BLOCK_QUANTITIES))
+    cumulative_sums, shift = get_cumulative_sums(u, v, w, shift)
+    for column, cumulative in cumulative_sums:
+        sums[:, column] = cumulative[starts + block_samples] - cumulative[starts]
+    return sums, shift
+
+
+def get_block_stats(sums, shift=0.):
+    """Derive means, variances, TKE, and Reynolds stresses from block sums.
+
+    Args:
+        sums (np.array): (..., BLOCK_QUANTITIES) block sums of get_block_sums, or sums of several block sums
+        shift (np.array): (3) shift of get_block_sums, which is added to the means (default: 0)
+
+    Returns:
+        dict: count, average, and var arrays of shape (..., 3), and TKE, tau_v, and tau_w arrays of shape (...)
+    """
+    count, total, squares = sums[..., 0:3], sums[..., 3:6], sums[..., 6:9]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average = total / count
+        var = np.maximum(squares / count - average ** 2, 0.)
+        stats = {"count": count, "average": average + shift, "var": var, "TKE": 0.5 * var.sum(axis=-1)}
+        for p, (name, (i, j)) in enumerate(zip(["tau_v", "tau_w"], BLOCK_PAIRS)):
+            pair_count, products, sum_i, sum_j = (sums[..., 9 + 4 * p + q] for q in range(4))
+            stats[name] = (products - average[..., j] * sum_i - average[..., i] * sum_j) / pair_count + \
+                average[..., i] * average[..., j]
+    return stats
+
+
+def get_window_samples(freq, window=WINDOW_DURATION, stride=WINDOW_STRIDE):
+    """Convert the window duration and stride in s into numbers of samples (at least 1) at the frequency freq in Hz."""
+    return max(1, int(round(window * freq))), max(1, int(round(stride * freq)))
+
+
+def update_rolling(rolling, time, u, v, w, window_samples, stride=1):
+    """Add a chunk of a record to sliding-window stats and return the stats of the windows that end in the chunk.
+
+    Args:
+        rolling (dict): state of the previous chunks (see the returned state) or None for the first chunk
+        time (np.array): time in s
+        u (np.array): streamwise velocities (despiked)
+        v (np.array): perpendicular velocities
+        w (np.array): vertical velocities (w1 if profile_type is lp and w2 otherwise, like in flowstat)
+        window_samples (int): number of samples per window
+        stride (int): number of samples between the starts of consecutive windows (default: 1)
+
+    Returns:
+        tuple (dict, dict): updated state, and ROLLING_COLUMNS as keys and np.arrays of one value per window as values
+        (time is the time of the central sample of the window, and samples is the number of valid u samples)
+    """
+    data = np.stack((time, u, v, w)).astype(np.float64)
+    if rolling is None:
+        # the means of the first chunk shift all chunks
+        rolling = {"tail": np.empty((4, 0)), "shift": _get_shift(data[1:]), "skip": 0}
+    # samples between windows (if stride exceeds window_samples) that were not yet received
+    skip = min(rolling["skip"], data.shape[-1])
+    rolling["skip"] -= skip
+    data = np.concatenate((rolling["tail"], data[:, skip:]), axis=-1)
+    if data.shape[-1] >= window_samples:
+        sums, _ = get_block_sums(data[1], data[2], data[3], window_samples, stride, shift=rolling["shift"])
+    else:
+        sums = np.empty((0, BLOCK_QUANTITIES))
+    n_windows = sums.shape[0]
+    # keep the samples of the next windows
+    rolling["tail"] = data[:, n_windows * stride:].copy()
+    rolling["skip"] += max(0, n_windows * stride - data.shape[-1])
+    stats = get_block_stats(sums, rolling["shift"])
+    std = np.sqrt(stats["var"])
+    columns = {
+        "time (s)": data[0, np.arange(n_windows) * stride + window_samples // 2],
+        "samples (-)": stats["count"][:, 0],
+        "u average (m/s)": stats["average"][:, 0],
+        "v average (m/s)": stats["average"][:, 1],
+        "w average (m/s)": stats["average"][:, 2],
+        "u std (m/s)": std[:, 0],
+        "v std (m/s)": std[:, 1],
+        "w std (m/s)": std[:, 2],
+        "TKE (m^2/s^2)": stats["TKE"],
+        "tau_v (m^2/s^2)": stats["tau_v"],
+        "tau_w (m^2/s^2)": stats["tau_w"],
+    }
+    return rolling, columns
+
+
+def rolling_flowstat(time, u, v, w, window_samples, stride=1):
+    """Calculate sliding-window stats of a complete record (see update_rolling for arguments and results)."""
+    return update_rolling(None, time, u, v, w, window_samples, stride)[1]
+
+
+def rolling_table(columns, start=0):
+    """Create the sliding-window stats table of a record (or of a chunk of windows starting at window number start)."""
+    import pandas as pd
+    n_windows = len(columns["time (s)"])
+    return pd.DataFrame(columns, index=pd.RangeIndex(start, start + n_windows))
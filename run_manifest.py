@@ -0,0 +1,211 @@
+"""Run manifest for incremental re-processing of experiment folders
+
+Note:
+    The manifest (config.MANIFEST_NAME in the data folder) records the content hash of every processed measurement
+    file, the parameters that its stats depend on, the output formats of its per-file artefacts, and its rows of the
+    stats tables (see flowstat.stats_table). A rerun only processes new or changed files and files whose parameters
+    changed or whose per-file artefacts are missing in the data folder, and rebuilds the stats summaries of all other
+    files from the recorded stats. File sizes and modification times are recorded as well, so that unchanged files
+    are not even re-hashed.
+"""
+import os
+import json
+import logging
+import numpy as np
+from config import SPECTRUM_SEGMENT_SAMPLES, SPECTRUM_OVERLAP, SPECTRUM_MAX_GAP, SPECTRUM_INERTIAL_RANGE, \
+    SPECTRUM_NOISE_FRACTION, ACF_MAX_LAG, BOOTSTRAP_REPLICATES, BOOTSTRAP_BLOCK_DURATION, BOOTSTRAP_CONFIDENCE, \
+    WINDOW_DURATION, WINDOW_STRIDE
+from flowstat import get_stats_columns
+from parse_cache import hash_file
+from output_writer import OUTPUT_FORMATS
+
+
+MANIFEST_VERSION = 1
+# experiment setup entries (see profile_analyst.load_input_defs) that the per-file stats depend on
+MANIFEST_PARAMETERS = ["profile", "freq", "despiking method", "lambda a", "despike k"]
+# per-file artefacts (see output_writer.ARTEFACTS) that are written by the per-file pipeline
+FILE_ARTEFACTS = ["raw", "spikes", "despiked", "spectra", "windowed"]
+# per-file plots of --plot-series (NAME-velocity.png and NAME-spike-diagnostics.png)
+SERIES_PLOTS = ["velocity", "spike-diagnostics"]
+
+
+def load_manifest(manifest_file):
+    """Load a run manifest (an empty manifest if the file does not exist or cannot be read).
+
+    Args:
+        manifest_file (str): name of the manifest file
+
+    Returns:
+        dict: the manifest with a files entry that maps measurement file names to their records
+    """
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"version": MANIFEST_VERSION, "files": {}}
+    except ValueError as e:
+        logging.warning("WARNING: ignoring damaged run manifest %s (%s)" % (manifest_file, e))
+        return {"version": MANIFEST_VERSION, "files": {}}
+    if manifest.get("version") != MANIFEST_VERSION:
+        logging.warning("WARNING: ignoring run manifest %s of another version" % manifest_file)
+        return {"version": MANIFEST_VERSION, "files": {}}
+    return manifest
+
+
+def save_manifest(manifest, manifest_file):
+    """Write a run manifest (replaces the previous file only after the new one is complete).
+
+    Args:
+        manifest (dict): the manifest (see load_manifest)
+        manifest_file (str): name of the manifest file
+    """
+    with open(manifest_file + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_file + ".tmp", manifest_file)
+    logging.info("wrote %s" % manifest_file)
+
+
+def get_run_parameters(experiment_setup, spike_fill="nan", dtype=np.float64, min_snr=None, min_corr=None,
+                       spectra=False, time_scales=False, bootstrap=None, windowed=False):
+    """Extract the parameters that per-file stats depend on from the experiment setup and the read options.
+
+    Args:
+        experiment_setup (dict): the result of profile_analyst.load_input_defs
+        spike_fill (str): replacement of spikes (see rmspike.FILL_METHODS; default: nan)
+        dtype (np.dtype): float type of the loaded columns (default: np.float64)
+        min_snr (float): SNR threshold of the quality filter (default: None; see vna_reader.filter_quality)
+        min_corr (float): correlation threshold of the quality filter (default: None)
+        spectra (bool): add the spectrum parameters (see spectra.py) if spectra are calculated (default: False)
+        time_scales (bool): add the autocorrelation parameters (see timescales.py) if integral time scales are
+            calculated (default: False)
+        bootstrap (int): seed of bootstrap confidence intervals, which adds the bootstrap parameters (see
+            bootstrap.py; default: None, i.e., no bootstrap)
+        windowed (bool): add the window parameters (see rolling_stats.py) if sliding-window stats are written (default:
+            False)
+
+    Returns:
+        dict: JSON-compatible parameter values
+    """
+    parameters = {par: experiment_setup[par] for par in MANIFEST_PARAMETERS}
+    parameters.update({"spike fill": spike_fill, "dtype": np.dtype(dtype).name, "min SNR": min_snr,
+                       "min correlation": min_corr})
+    if spectra:
+        parameters["spectrum"] = {"segment samples": SPECTRUM_SEGMENT_SAMPLES, "overlap": SPECTRUM_OVERLAP,
+                                  "max gap": SPECTRUM_MAX_GAP, "inertial range (Hz)": list(SPECTRUM_INERTIAL_RANGE),
+                                  "noise fraction": SPECTRUM_NOISE_FRACTION}
+    if time_scales:
+        parameters["time scales"] = {"max lag (s)": ACF_MAX_LAG}
+    if bootstrap is not None:
+        parameters["bootstrap"] = {"seed": int(bootstrap), "replicates": BOOTSTRAP_REPLICATES,
+                                   "block duration (s)": BOOTSTRAP_BLOCK_DURATION, "confidence": BOOTSTRAP_CONFIDENCE}
+    if windowed:
+        parameters["windowed"] = {"window (s)": WINDOW_DURATION, "stride (s)": WINDOW_STRIDE}
+    # numpy scalars of input.xlsx cells
+    return {par: value.item() if isinstance(value, np.generic) else value for par, value in parameters.items()}
+
+
+def _get_file_info(file_name, record=None):
+    """Get size, modification time, and content hash of a file (the hash of record if size and time did not change)."""
+    stat = os.stat(file_name)
+    if record and record["size"] == stat.st_size and record["mtime_ns"] == stat.st_mtime_ns:
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": record["hash"]}
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": hash_file(file_name)}
+
+
+def get_artefact_files(vna_fn, target_folder, output_formats, plot_series=False):
+    """Get the names of the per-file artefacts that a run writes for a measurement file.
+
+    Args:
+        vna_fn (str): name of a vna (or binary vno) file, such as __8_16.5_6_T3.vna
+        target_folder (str): directory where the vna file lives and the artefacts are written to
+        output_formats (dict): output formats of artefacts (see output_writer.get_output_formats)
+        plot_series (bool): add the velocity series and spike diagnostics plots (see
+            profile_plotter.submit_plot_series; default: False)
+
+    Returns:
+        list: names of the artefact files (FILE_ARTEFACTS whose output format is not none, and plots)
+    """
+    vna_name = os.path.splitext(vna_fn)[0]
+    file_names = [target_folder + "/%s-%s%s" % (vna_name, artefact, OUTPUT_FORMATS[output_formats[artefact]])
+                  for artefact in FILE_ARTEFACTS if output_formats[artefact] != "none"]
+    if plot_series:
+        file_names += [target_folder + "/%s-%s.png" % (vna_name, plot) for plot in SERIES_PLOTS]
+    return file_names
+
+
+def get_outdated_files(manifest, vna_file_names, target_folder, parameters, output_formats, plot_series=False):
+    """Find the measurement files that need processing: new or changed files, files that were processed with other
+    parameters, and files whose per-file artefacts were not written in the requested output formats or do not
+    exist in target_folder (including requested plots).
+
+    Args:
+        manifest (dict): the manifest (see load_manifest)
+        vna_file_names (list): names of vna (or binary vno) files in target_folder
+        target_folder (str): directory where the vna files live and their artefacts are written to
+        parameters (dict): the result of get_run_parameters
+        output_formats (dict): output formats of artefacts (see output_writer.get_output_formats)
+        plot_series (bool): velocity series and spike diagnostics plots are requested (default: False)
+
+    Returns:
+        tuple (list, dict): names of files to process, and file infos (size, modification time, and content hash) of
+        all vna_file_names for record_files
+    """
+    outdated = []
+    file_infos = {}
+    for vna_fn in vna_file_names:
+        record = manifest["files"].get(vna_fn)
+        file_infos[vna_fn] = _get_file_info(target_folder + "/" + vna_fn, record)
+        if record is None or file_infos[vna_fn]["hash"] != record["hash"] or record["parameters"] != parameters:
+            outdated.append(vna_fn)
+        elif any(output_formats[a] not in ("none", record["outputs"].get(a, "none")) for a in FILE_ARTEFACTS):
+            outdated.append(vna_fn)
+        elif not all(os.path.exists(f) for f in get_artefact_files(vna_fn, target_folder, output_formats,
+                                                                   plot_series)):
+            outdated.append(vna_fn)
+    return outdated, file_infos
+
+
+def record_files(manifest, vna_file_names, file_infos, parameters, output_formats, vna_stats, vna_stats_despiked):
+    """Record processed files in the manifest.
+
+    Args:
+        manifest (dict): the manifest (see load_manifest), which is updated in place
+        vna_file_names (list): names of the processed vna files (in the row order of the stats tables)
+        file_infos (dict): file infos of get_outdated_files
+        parameters (dict): the result of get_run_parameters
+        output_formats (dict): output formats of artefacts (see output_writer.get_output_formats)
+        vna_stats (np.array): stats table with spikes (see flowstat.stats_table)
+        vna_stats_despiked (np.array): despiked stats table
+    """
+    for i, vna_fn in enumerate(vna_file_names):
+        manifest["files"][vna_fn] = dict(file_infos[vna_fn])
+        manifest["files"][vna_fn].update({
+            "parameters": parameters,
+            "outputs": {a: output_formats[a] for a in FILE_ARTEFACTS},
+            # repr of floats round-trips exactly (and NaN is written as NaN)
+            "stats": {col: float(vna_stats[col][i]) for col in vna_stats.dtype.names},
+            "stats despiked": {col: float(vna_stats_despiked[col][i]) for col in vna_stats_despiked.dtype.names},
+        })
+
+
+def get_recorded_stats(manifest, vna_file_names, profile_type="lp", sections=()):
+    """Rebuild the stats tables of files from the manifest.
+
+    Args:
+        manifest (dict): the manifest (see load_manifest)
+        vna_file_names (list): names of recorded vna files
+        profile_type (str): orientation of the probe (default: lp, which excludes w2 stats)
+        sections (list): optional stats sections of the records (see flowstat.STATS_SECTIONS; default: none)
+
+    Returns:
+        tuple (np.array, np.array): stats tables with spikes and despiked (see flowstat.stats_table) with one row per
+        file of vna_file_names
+    """
+    dtype = [(col, np.float64) for col in get_stats_columns(profile_type, sections)]
+    tables = []
+    for key in ["stats", "stats despiked"]:
+        table = np.empty(len(vna_file_names), dtype=dtype)
+        for i, vna_fn in enumerate(vna_file_names):
+            table[i] = tuple(manifest["files"][vna_fn][key][col] for col, _ in dtype)
+        tables.append(table)
+    return tables[0], tables[1]
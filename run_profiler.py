@@ -0,0 +1,194 @@
+"""Per-stage instrumentation of the pipeline (wall time, CPU time, rows, bytes read and written, and peak memory)
+
+Note:
+    Profiling is disabled by default, and profile_stage then only yields a record that is discarded, which costs about
+    a microsecond per stage. When enabled (see enable_profiling), every stage appends a record. The CPU time of a stage
+    is the CPU time of its thread, because the reader and writer threads of the prefetch pipeline (see io_pipeline.py)
+    run stages at the same time as the calling thread. The peak resident set size (RSS) of a stage is measured by
+    resetting the peak of the process at the start of the stage (Linux), and otherwise falls back to the peak of the
+    process lifetime. The peak RSS is process-wide, so that it is not reported (None) for stages that overlapped with
+    stages of other threads. Worker processes collect their own records, which the calling process adds with
+    add_records.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+REPORT_COLUMNS = ["stage", "file", "wall time (s)", "CPU time (s)", "rows", "bytes read", "bytes written",
+                  "peak RSS (bytes)"]
+
+# stage records (None if profiling is disabled)
+_records = None
+# thread ids and overlap flags of running stages
+_running_stages = []
+_running_lock = threading.Lock()
+
+
+def enable_profiling():
+    """Start collecting stage records (discards previous records)."""
+    global _records
+    _records = []
+
+
+def disable_profiling():
+    """Stop collecting stage records (discards collected records)."""
+    global _records
+    _records = None
+
+
+def profiling_enabled():
+    return _records is not None
+
+
+def pop_records():
+    """Return and clear the collected stage records (an empty list if profiling is disabled)."""
+    if _records is None:
+        return []
+    records = list(_records)
+    _records.clear()
+    return records
+
+
+def add_records(records):
+    """Add stage records of another process (see pop_records)."""
+    if _records is not None:
+        _records.extend(records)
+
+
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _get_peak_rss():
+    """Get the peak resident set size in bytes (since the last reset on Linux)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def file_size(file_name):
+    """Size of a file in bytes (0 if file_name is None, e.g., for output formats that do not write files)."""
+    return os.path.getsize(file_name) if file_name else 0
+
+
+@contextmanager
+def profile_stage(stage, file=None, rows=None):
+    """Measure a pipeline stage.
+
+    Args:
+        stage (str): name of the stage, such as read or flowstat
+        file (str): name of the measurement file that the stage processes (default: None)
+        rows (int): number of rows that the stage processes (default: None; can be set in the yielded record)
+
+    Yields:
+        dict: record of the stage; callers may set its rows, bytes read, and bytes written entries
+    """
+    record = {"stage": stage, "file": file, "rows": rows, "bytes read": 0, "bytes written": 0}
+    if _records is None:
+        yield record
+        return
+    running = {"thread": threading.get_ident(), "overlapped": False}
+    with _running_lock:
+        for other in _running_stages:
+            if other["thread"] != running["thread"]:
+                other["overlapped"] = running["overlapped"] = True
+        _running_stages.append(running)
+        if not running["overlapped"]:
+            _reset_peak_rss()
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield record
+    finally:
+        record["wall time (s)"] = time.perf_counter() - wall_start
+        record["CPU time (s)"] = time.thread_time() - cpu_start
+        with _running_lock:
+            _running_stages.remove(running)
+        record["peak RSS (bytes)"] = None if running["overlapped"] else _get_peak_rss()
+        _records.append(record)
+
+
+def summarize_records(records, key="stage"):
+    """Sum up stage records by stage (or by file).
+
+    Args:
+        records (list): stage records (see pop_records)
+        key (str): stage (default) or file
+
+    Returns:
+        list: one dict per stage (or file) with the number of calls, summed times, rows, and bytes, and the maximum
+        peak RSS (None if no record has a peak RSS), in the order of first appearance
+    """
+    summary = {}
+    for record in records:
+        entry = summary.setdefault(record[key], {key: record[key], "calls": 0, "wall time (s)": 0.,
+                                                 "CPU time (s)": 0., "rows": 0, "bytes read": 0, "bytes written": 0,
+                                                 "peak RSS (bytes)": None})
+        entry["calls"] += 1
+        for col in ["wall time (s)", "CPU time (s)", "rows", "bytes read", "bytes written"]:
+            entry[col] += record[col] or 0
+        if record["peak RSS (bytes)"] is not None:
+            entry["peak RSS (bytes)"] = max(entry["peak RSS (bytes)"] or 0, record["peak RSS (bytes)"])
+    return list(summary.values())
+
+
+def write_profile_report(file_stem, records):
+    """Write stage records and their summaries by stage and by file to file_stem.json, and the records to
+    file_stem.csv.
+
+    Args:
+        file_stem (str): output file name without file ending
+        records (list): stage records (see pop_records)
+
+    Returns:
+        list: names of the written files
+    """
+    report = {
+        "stages": summarize_records(records),
+        "files": summarize_records([r for r in records if r["file"] is not None], key="file"),
+        "records": records,
+    }
+    with open(file_stem + ".json", "w") as f:
+        json.dump(report, f, indent=1)
+    with open(file_stem + ".csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(records)
+    logging.info("wrote %s.json and %s.csv" % (file_stem, file_stem))
+    return [file_stem + ".json", file_stem + ".csv"]
+
+
+def print_profile_summary(records):
+    """Print the summary of stage records by stage."""
+    print("\n%-16s %6s %12s %12s %12s %12s %12s %14s" % (
+        "stage", "calls", "wall (s)", "CPU (s)", "rows", "read (MB)", "written (MB)", "peak RSS (MB)"))
+    for entry in summarize_records(records):
+        peak_rss = entry["peak RSS (bytes)"]
+        print("%-16s %6i %12.3f %12.3f %12i %12.2f %12.2f %14s" % (
+            entry["stage"], entry["calls"], entry["wall time (s)"], entry["CPU time (s)"], entry["rows"],
+            entry["bytes read"] / 2 ** 20, entry["bytes written"] / 2 ** 20,
+            "-" if peak_rss is None else "%.1f" % (peak_rss / 2 ** 20)))
+
+
+def call_profiled(fun, *args):
+    """Call a function in a worker process with profiling enabled and return its result and stage records."""
+    return fun(*args), pop_records()
@@ -0,0 +1,178 @@
+"""Power spectral densities (PSDs) of velocity series with Welch's method
+
+Note:
+    The series are split into segments of SPECTRUM_SEGMENT_SAMPLES samples with an overlap of SPECTRUM_OVERLAP (see
+    config.py). Every segment is detrended (mean removed), multiplied with a periodic Hann window, and transformed with
+    numpy.fft.rfft; the one-sided PSDs (density scaling, as scipy.signal.welch) of all segments are averaged. Arrays of
+    several components and files are processed in one batch of segments, which is split into blocks of
+    SPECTRUM_BLOCK_SEGMENTS segments to bound the memory use. Despiked series can contain NaN samples: gaps in segments
+    with at most SPECTRUM_MAX_GAP NaN samples are linearly interpolated within the segment, and segments with more gaps
+    (or only NaN samples, e.g., the padding of shorter files in batch mode) are rejected. Because segments are handled
+    independently, chunks of a series can be added one after another (update_welch) with the same result as the
+    complete series.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from config import SPECTRUM_SEGMENT_SAMPLES, SPECTRUM_OVERLAP, SPECTRUM_MAX_GAP, SPECTRUM_INERTIAL_RANGE, \
+    SPECTRUM_NOISE_FRACTION
+from rmspike import fill_spikes
+from flowstat import SPECTRUM_COMPONENTS, SPECTRUM_COLUMNS
+
+
+# maximum number of segments that are transformed at once
+SPECTRUM_BLOCK_SEGMENTS = 4096
+
+
+def _segment_psd(segments, window, freq, max_gap, valid=True):
+    """Compute the one-sided PSDs of segments (rows) and return them (zero for rejected segments) with the flags of
+    accepted segments (segments that are not valid are rejected)."""
+    missing = np.isnan(segments)
+    gap_fraction = missing.mean(axis=-1)
+    accepted = (gap_fraction <= max_gap) & (gap_fraction < 1.) & valid
+    psd = np.zeros((segments.shape[0], window.size // 2 + 1))
+    if not accepted.any():
+        return psd, accepted
+    # boolean indexing copies the accepted segments
+    values = segments[accepted]
+    gaps = missing[accepted]
+    if gaps.any():
+        values = fill_spikes(values, gaps, fill="linear")
+    values -= values.mean(axis=-1, keepdims=True)
+    spectrum = np.fft.rfft(values * window, axis=-1)
+    segment_psd = (spectrum.real ** 2 + spectrum.imag ** 2) / (freq * np.sum(window ** 2))
+    # one-sided spectrum: double all frequencies except zero and the Nyquist frequency (even segment lengths)
+    segment_psd[:, 1:(None if window.size % 2 else -1)] *= 2.
+    psd[accepted] = segment_psd
+    return psd, accepted
+
+
+def update_welch(welch, series, freq, segment_samples=SPECTRUM_SEGMENT_SAMPLES, overlap=SPECTRUM_OVERLAP,
+                 max_gap=SPECTRUM_MAX_GAP, lengths=None):
+    """Add a chunk of velocity series to running Welch PSDs.
+
+    Args:
+        welch (dict): running PSDs of the previous chunks (see finalize_welch) or None for the first chunk
+        series (numpy.array): velocity series with samples along the last axis, such as (components, samples) or
+            (files, components, samples) arrays; NaN samples are gaps
+        freq (float): sampling frequency in Hz
+        segment_samples (int): number of samples per segment (default: config.SPECTRUM_SEGMENT_SAMPLES)
+        overlap (float): overlap fraction of consecutive segments (default: config.SPECTRUM_OVERLAP)
+        max_gap (float): maximum fraction of NaN samples of a segment (default: config.SPECTRUM_MAX_GAP)
+        lengths (numpy.array): numbers of samples of the series with the leading shape of series, such as the lengths
+            of NaN-padded files (see flowstat.pad_series); segments beyond the lengths are rejected (default: None)
+
+    Returns:
+        dict: running PSDs (the arguments after the first chunk are taken from welch)
+    """
+    series = np.asarray(series, dtype=np.float64)
+    if welch is None:
+        welch = {
+            "freq": float(freq),
+            "step": max(1, int(round(segment_samples * (1. - overlap)))),
+            "max gap": max_gap,
+            # periodic Hann window
+            "window": np.hanning(segment_samples + 1)[:-1],
+            "tail": np.empty(series.shape[:-1] + (0,)),
+            "psd sum": np.zeros(series.shape[:-1] + (segment_samples // 2 + 1,)),
+            "segments": np.zeros(series.shape[:-1], dtype=np.int64),
+            "samples": 0,
+        }
+    segment_samples, step = welch["window"].size, welch["step"]
+    # position of the first sample of data in the complete series
+    start_sample = welch["samples"] - welch["tail"].shape[-1]
+    data = np.concatenate((welch["tail"], series), axis=-1)
+    welch["samples"] += series.shape[-1]
+    n_segments = (data.shape[-1] - segment_samples) // step + 1 if data.shape[-1] >= segment_samples else 0
+    if n_segments:
+        # (series, segments, samples) view of the segments of all series
+        rows = data.reshape(-1, data.shape[-1])
+        segments = sliding_window_view(rows, segment_samples, axis=-1)[:, ::step][:, :n_segments]
+        psd_sum = welch["psd sum"].reshape(-1, welch["psd sum"].shape[-1])
+        counts = welch["segments"].reshape(-1)
+        segment_ends = start_sample + np.arange(n_segments) * step + segment_samples
+        if lengths is None:
+            valid = np.ones((rows.shape[0], n_segments), dtype=bool)
+        else:
+            valid = segment_ends <= np.reshape(lengths, (-1, 1))
+        block_series = max(1, SPECTRUM_BLOCK_SEGMENTS // n_segments)
+        for start in range(0, rows.shape[0], block_series):
+            block = segments[start:start + block_series]
+            psd, accepted = _segment_psd(block.reshape(-1, segment_samples), welch["window"], welch["freq"],
+                                         welch["max gap"], valid[start:start + block_series].reshape(-1))
+            psd_sum[start:start + block_series] += psd.reshape(block.shape[0], n_segments, -1).sum(axis=1)
+            counts[start:start + block_series] += accepted.reshape(block.shape[0], n_segments).sum(axis=1)
+    # keep the samples of the next segments
+    welch["tail"] = data[..., n_segments * step:].copy()
+    return welch
+
+
+def finalize_welch(welch):
+    """Average the running PSDs.
+
+    Args:
+        welch (dict): running PSDs (see update_welch)
+
+    Returns:
+        tuple (numpy.array, numpy.array, numpy.array): frequencies in Hz, PSDs in m^2/s with the leading shape of the
+        series and frequencies along the last axis (NaN without accepted segments), and numbers of accepted segments
+    """
+    frequencies = np.fft.rfftfreq(welch["window"].size, 1. / welch["freq"])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        psd = welch["psd sum"] / welch["segments"][..., np.newaxis]
+    return frequencies, psd, welch["segments"]
+
+
+def welch_psd(series, freq, segment_samples=SPECTRUM_SEGMENT_SAMPLES, overlap=SPECTRUM_OVERLAP,
+              max_gap=SPECTRUM_MAX_GAP, lengths=None):
+    """Compute Welch PSDs of velocity series (see update_welch for the arguments and finalize_welch for the results)."""
+    return finalize_welch(update_welch(None, series, freq, segment_samples, overlap, max_gap, lengths))
+
+
+def get_spectrum_stats(frequencies, psd, inertial_range=SPECTRUM_INERTIAL_RANGE,
+                       noise_fraction=SPECTRUM_NOISE_FRACTION):
+    """Derive the inertial subrange slope and the noise floor of u, v, and w PSDs.
+
+    Args:
+        frequencies (numpy.array): frequencies in Hz (see finalize_welch)
+        psd (numpy.array): PSDs of u, v, and w along the second last axis, such as (3, frequencies) or
+            (files, 3, frequencies) arrays
+        inertial_range (tuple): frequency range in Hz of the least squares fit of the log-log slope, which is about
+            -5/3 in the inertial subrange (default: config.SPECTRUM_INERTIAL_RANGE)
+        noise_fraction (float): the noise floor is the median PSD above noise_fraction times the Nyquist frequency
+            (default: config.SPECTRUM_NOISE_FRACTION)
+
+    Returns:
+        dict: SPECTRUM_COLUMNS as keys and floats (or numpy.arrays with the leading shape of psd) as values
+    """
+    band = (frequencies > 0.) & (frequencies >= inertial_range[0]) & (frequencies <= inertial_range[1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = np.log10(frequencies[band])
+        y = np.log10(psd[..., band])
+        x_dev = x - x.mean()
+        slope = np.sum(x_dev * (y - y.mean(axis=-1, keepdims=True)), axis=-1) / np.sum(x_dev ** 2)
+    noise = psd[..., frequencies >= noise_fraction * frequencies[-1]]
+    noise_floor = np.median(noise, axis=-1) if noise.shape[-1] else np.full(psd.shape[:-1], np.nan)
+    spectrum_stats = {}
+    for i, comp in enumerate(SPECTRUM_COMPONENTS):
+        spectrum_stats["%s PSD slope (-)" % comp] = slope[..., i]
+        spectrum_stats["%s noise floor (m^2/s)" % comp] = noise_floor[..., i]
+    return spectrum_stats
+
+
+def spectra_table(frequencies, psd, psd_despiked):
+    """Create the PSD table of a measurement.
+
+    Args:
+        frequencies (numpy.array): frequencies in Hz
+        psd (numpy.array): (3, frequencies) PSDs of u, v, and w with spikes
+        psd_despiked (numpy.array): (3, frequencies) PSDs of despiked u, v, and w
+
+    Returns:
+        pandas.DataFrame: frequency (Hz) index and u, v, and w PSD columns with spikes and despiked
+    """
+    import pandas as pd
+    columns = {}
+    for i, comp in enumerate(SPECTRUM_COMPONENTS):
+        columns["%s PSD (m^2/s)" % comp] = psd[i]
+        columns["%s PSD despiked (m^2/s)" % comp] = psd_despiked[i]
+    return pd.DataFrame(columns, index=pd.Index(frequencies, name="frequency (Hz)"))
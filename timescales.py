@@ -0,0 +1,134 @@
+"""Autocorrelation, integral time scales, and effective sample sizes of velocity and Reynolds stress series
+
+Note:
+    Consecutive ADV samples are correlated, so that std / sqrt(N) underestimates the standard error of averages. The
+    autocorrelation functions (ACFs) are calculated with FFTs in O(n log n): the centered series are zero-padded by
+    the largest lag, which yields the linear (not circular) correlation, and NaN samples are excluded by
+    correlating the series of valid samples, too (the ACF of a lag is the mean product of all valid sample pairs).
+    The integral time scale T is the integral of the ACF up to its first zero crossing (or ACF_MAX_LAG, see
+    config.py), and the effective sample size of N samples at the frequency f is N_eff = N / (2 T f), which is N for
+    uncorrelated samples (T = 1 / (2 f)). The corrected standard error is std / sqrt(N_eff).
+"""
+import numpy as np
+from config import ACF_MAX_LAG
+from flowstat import TIME_SCALE_SERIES, TIME_SCALE_COLUMNS
+
+
+# maximum number of FFT values that are transformed at once
+ACF_BLOCK_VALUES = 2 ** 22
+
+
+def _next_fast_length(n):
+    """Get the smallest 5-smooth number (product of powers of 2, 3, and 5) that is not smaller than n."""
+    best = 2 ** int(np.ceil(np.log2(max(n, 1))))
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            # smallest power of 2 that brings power35 to n or more
+            length = power35 * 2 ** max(0, int(np.ceil(np.log2(n / power35))))
+            best = min(best, length)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+
+def autocorrelation(series, max_lag=None):
+    """Calculate the autocorrelation functions of series with FFTs (NaN samples are ignored).
+
+    Args:
+        series (np.array): series with samples along the last axis, such as (components, samples) or
+            (files, components, samples) arrays
+        max_lag (int): largest lag in samples (default: None, i.e., all lags)
+
+    Returns:
+        np.array: ACFs of lags 0 to max_lag with the leading shape of series (NaN for series with less than two valid
+        samples and lags without valid sample pairs)
+    """
+    series = np.asarray(series, dtype=np.float64)
+    n = series.shape[-1]
+    max_lag = n - 1 if max_lag is None else min(int(max_lag), n - 1)
+    rows = series.reshape(-1, n)
+    fft_length = _next_fast_length(n + max_lag + 1)
+    acf = np.empty((rows.shape[0], max_lag + 1))
+    block_rows = max(1, ACF_BLOCK_VALUES // fft_length)
+    for start in range(0, rows.shape[0], block_rows):
+        block = rows[start:start + block_rows]
+        valid = ~np.isnan(block)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            average = np.where(valid, block, 0.).sum(axis=-1, keepdims=True) / valid.sum(axis=-1, keepdims=True)
+            centered = np.where(valid, block - average, 0.)
+            products = np.fft.irfft(np.abs(np.fft.rfft(centered, fft_length, axis=-1)) ** 2, fft_length,
+                                    axis=-1)[:, :max_lag + 1]
+            pairs = np.rint(np.fft.irfft(np.abs(np.fft.rfft(valid.astype(np.float64), fft_length, axis=-1)) ** 2,
+                                         fft_length, axis=-1)[:, :max_lag + 1])
+            covariance = np.where(pairs > 0, products / pairs, np.nan)
+            acf[start:start + block_rows] = covariance / covariance[:, :1]
+    return acf.reshape(series.shape[:-1] + (max_lag + 1,))
+
+
+def integral_time_scale(acf, freq):
+    """Integrate autocorrelation functions up to their first zero crossing.
+
+    Args:
+        acf (np.array): ACFs with lags along the last axis (see autocorrelation)
+        freq (float): sampling frequency in Hz
+
+    Returns:
+        np.array: integral time scales in s with the leading shape of acf (at least half a sample interval)
+    """
+    # the trapezoidal rule up to the last positive lag equals the sum of the ACF minus half the ACF of lag 0 (1) and
+    # half the ACF of the last positive lag
+    crossed = ~(acf > 0.)
+    first_crossing = np.where(crossed.any(axis=-1), np.argmax(crossed, axis=-1), acf.shape[-1])
+    positive = np.arange(acf.shape[-1]) < first_crossing[..., np.newaxis]
+    last_positive = np.take_along_axis(acf, np.maximum(first_crossing - 1, 0)[..., np.newaxis], axis=-1)[..., 0]
+    time_scale = (np.sum(np.where(positive, acf, 0.), axis=-1) - 0.5 - 0.5 * last_positive) / freq
+    with np.errstate(invalid="ignore"):
+        return np.where(first_crossing > 0, np.maximum(time_scale, 0.5 / freq), np.nan)
+
+
+def get_time_scale_series(u, v, w, stats):
+    """Stack the velocity components and the Reynolds stress series of the time scale stats (see TIME_SCALE_SERIES).
+
+    Args:
+        u (np.array): streamwise velocities with samples along the last axis, such as (samples) or (files, samples)
+        v (np.array): perpendicular velocities
+        w (np.array): vertical velocities (w1 if profile_type is lp and w2 otherwise, like in flowstat)
+        stats (dict(dict)): flowstat or batch_flowstat stats of u, v, and w
+
+    Returns:
+        np.array: (..., 5, samples) array of u, v, w, and the products of the centered u and v, and u and w
+    """
+    u_dev = u - np.asarray(stats["u STAT (m/s)"]["average"])[..., np.newaxis]
+    return np.stack((u, v, w, u_dev * (v - np.asarray(stats["v STAT (m/s)"]["average"])[..., np.newaxis]),
+                     u_dev * (w - np.asarray(stats["w STAT (m/s)"]["average"])[..., np.newaxis])), axis=-2)
+
+
+def get_time_scale_stats(series, stats, freq, max_lag=ACF_MAX_LAG):
+    """Calculate integral time scales, effective sample sizes, and corrected standard errors.
+
+    Args:
+        series (np.array): (..., 5, samples) array of get_time_scale_series
+        stats (dict(dict)): flowstat or batch_flowstat stats of the series (the std of the averages are used)
+        freq (float): sampling frequency in Hz
+        max_lag (float): largest lag in s of the autocorrelation functions (default: config.ACF_MAX_LAG)
+
+    Returns:
+        dict: TIME_SCALE_COLUMNS as keys and floats (or np.arrays of the leading shape of series) as values
+    """
+    time_scale = integral_time_scale(autocorrelation(series, max_lag=int(round(max_lag * freq))), freq)
+    count = np.count_nonzero(~np.isnan(series), axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        effective_count = np.clip(count / (2. * time_scale * freq), np.minimum(count, 1), count)
+    time_scale_stats = {}
+    for i, (name, unit) in enumerate(TIME_SCALE_SERIES.items()):
+        par = "%s STAT (%s)" % (name, unit)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stderr = np.asarray(stats[par]["std"]) / np.sqrt(effective_count[..., i])
+        time_scale_stats.update({
+            "%s T_int (s)" % name: time_scale[..., i],
+            "%s N_eff (-)" % name: effective_count[..., i],
+            "%s stderr_eff (%s)" % (name, unit): stderr,
+        })
+    return time_scale_stats
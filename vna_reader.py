@@ -0,0 +1,311 @@
+"""Fast parser for Vectrino ASCII exports (*.vna)
+
+Note:
+    Vectrino+ writes vna files with right-aligned columns of fixed width. The parser derives the column layout from the
+    first line, verifies it for every row, and decodes the requested columns directly from the raw bytes into NumPy
+    arrays. Files that do not follow a fixed-width layout are read with pandas (C engine) instead.
+    Only the requested columns are decoded. Quality filters (beam SNR and correlation thresholds, see filter_quality)
+    decode the quality columns together with the requested columns and mask the velocities block by block, so that
+    filtering adds no pass over the file.
+"""
+import io
+import numpy as np
+import logging
+
+
+VNA_COLUMNS = ["skip1", "time (s)", "sample no.", "skip2",
+               "u (m/s)", "v (m/s)", "w1 (m/s)", "w2 (m/s)",
+               "ampl. x (dB)", "ampl. y (dB)", "ampl. z1 (dB)", "ampl. z2 (dB)",
+               "SNR x", "SNR y", "SNR z1", "SNR z2",
+               "corr x", "corr y", "corr z1", "corr z2"]
+DATA_COLUMNS = [c for c in VNA_COLUMNS if c not in ["skip1", "skip2"]]
+VELOCITY_COLUMNS = ["time (s)", "u (m/s)", "v (m/s)", "w1 (m/s)", "w2 (m/s)"]
+# beam signal-to-noise ratio (dB) and correlation (%) columns of the velocity components
+QUALITY_COLUMNS = {"u (m/s)": ("SNR x", "corr x"), "v (m/s)": ("SNR y", "corr y"),
+                   "w1 (m/s)": ("SNR z1", "corr z1"), "w2 (m/s)": ("SNR z2", "corr z2")}
+
+# rows decoded at once (bounds the size of temporary arrays)
+BLOCK_ROWS = 2 ** 14
+
+_SPACE, _MINUS, _DOT, _ZERO = (ord(c) for c in " -.0")
+
+
+class _LayoutError(ValueError):
+    """Raised when a file does not follow the fixed-width vna layout."""
+
+
+def _get_column_indices(columns):
+    if columns is None:
+        columns = DATA_COLUMNS
+    unknown = [c for c in columns if c not in DATA_COLUMNS]
+    if unknown:
+        raise ValueError("Unknown vna column(s): {0} (available: {1})".format(unknown, DATA_COLUMNS))
+    return list(columns), [VNA_COLUMNS.index(c) for c in columns]
+
+
+def get_quality_columns(columns, min_snr=None, min_corr=None):
+    """Add the quality columns that filter_quality needs for the velocity columns of a column selection.
+
+    Args:
+        columns (list): names of columns to read (None stands for all data columns, which include the quality columns)
+        min_snr (float): SNR threshold of filter_quality (default: None)
+        min_corr (float): correlation threshold of filter_quality (default: None)
+
+    Returns:
+        list: columns followed by the missing quality columns (columns itself if no threshold is set)
+    """
+    if columns is None or (min_snr is None and min_corr is None):
+        return columns
+    quality_columns = []
+    for col in columns:
+        if col in QUALITY_COLUMNS:
+            snr_col, corr_col = QUALITY_COLUMNS[col]
+            quality_columns += ([snr_col] if min_snr is not None else []) + ([corr_col] if min_corr is not None else [])
+    return list(columns) + [c for c in quality_columns if c not in columns]
+
+
+def filter_quality(data, min_snr=None, min_corr=None, rejected=None):
+    """Replace velocities of samples with a beam signal-to-noise ratio below min_snr or a beam correlation below
+    min_corr with NaN (SonTek and Nortek recommend 15 dB and 70 %, respectively).
+
+    Args:
+        data (dict): keys correspond to column names and values to np.arrays; the velocity columns are replaced with
+            filtered arrays (the quality columns of the velocity columns must be present, see get_quality_columns)
+        min_snr (float): minimum SNR in dB of valid samples (default: None, i.e., no SNR filter)
+        min_corr (float): minimum correlation in % of valid samples (default: None, i.e., no correlation filter)
+        rejected (dict): counts of rejected samples per velocity column that are incremented (default: None)
+
+    Returns:
+        dict: rejected (a new dict if None), which is empty if no threshold is set
+    """
+    if rejected is None:
+        rejected = {}
+    if min_snr is None and min_corr is None:
+        return rejected
+    for col, (snr_col, corr_col) in QUALITY_COLUMNS.items():
+        if col not in data:
+            continue
+        mask = np.zeros(data[col].shape, dtype=bool)
+        if min_snr is not None:
+            mask |= data[snr_col] < min_snr
+        if min_corr is not None:
+            mask |= data[corr_col] < min_corr
+        data[col] = np.where(mask, np.nan, data[col]).astype(data[col].dtype, copy=False)
+        rejected[col] = rejected.get(col, 0) + int(np.count_nonzero(mask))
+    return rejected
+
+
+def _get_layout(first_line):
+    """Derive the column layout from the first line of a vna file.
+
+    Returns:
+        tuple (np.array, np.array): (exclusive) column end positions and decimal point positions (-1 for integers)
+    """
+    chars = np.frombuffer(first_line.rstrip(b"\r\n"), dtype=np.uint8)
+    is_char = chars != _SPACE
+    # a column ends where a non-space character is followed by a space or the end of the line
+    ends = np.flatnonzero(is_char & ~np.append(is_char[1:], False)) + 1
+    if ends.size != len(VNA_COLUMNS):
+        raise _LayoutError("expected {0} columns, found {1}".format(len(VNA_COLUMNS), ends.size))
+    if np.diff(ends).max() > 16:
+        raise _LayoutError("columns too wide for exact decoding")
+    dots = np.full(ends.size, -1)
+    for i, (start, end) in enumerate(zip(np.append(0, ends[:-1]), ends)):
+        point = np.flatnonzero(chars[start:end] == _DOT)
+        if point.size:
+            dots[i] = start + point[0]
+    return ends, dots
+
+
+def _get_weights(ends, dots, col_indices):
+    """Build the matrix of decimal weights that maps line characters to integer mantissas of the columns.
+
+    Returns:
+        tuple (np.array, list, np.array, np.array): character positions of the requested columns, spans of the columns
+        in the position array, (positions, columns) weights matrix, and decimal scales of the columns
+    """
+    positions = np.concatenate([np.arange(ends[i - 1], ends[i]) for i in col_indices])
+    weights = np.zeros((positions.size, len(col_indices)))
+    decimals = np.zeros(len(col_indices))
+    spans = []
+    offset = 0
+    for j, i in enumerate(col_indices):
+        # a column starts with the separator behind the previous column (holds minus signs of wider numbers)
+        col_positions = np.arange(ends[i - 1], ends[i])
+        power = ends[i] - 1 - col_positions
+        if dots[i] >= 0:
+            # digits left of the decimal point skip its position
+            power -= col_positions < dots[i]
+            decimals[j] = ends[i] - dots[i] - 1
+        weights[offset:offset + col_positions.size, j] = np.where(col_positions == dots[i], 0., 10. ** power)
+        spans.append((offset, offset + col_positions.size))
+        offset += col_positions.size
+    return positions, spans, weights, 10. ** decimals
+
+
+def _decode_block(rows, layout, weights):
+    """Decode the requested columns of a (rows, line length) uint8 block.
+
+    Digits are combined into integer mantissas (exact in float64) with a single matrix product and divided by a power
+    of ten, which gives the same correctly rounded result as string-to-float conversion.
+
+    Returns:
+        np.array of shape (rows, requested columns)
+    """
+    ends, dots = layout
+    positions, spans, weights, scales = weights
+    # every column must end at the same position in all rows
+    if not (rows[:, ends[:-1]] == _SPACE).all():
+        raise _LayoutError("column boundaries differ between rows")
+    dot_cols = np.intersect1d(dots, positions)
+    if not (rows[:, dot_cols] == _DOT).all():
+        raise _LayoutError("decimal points differ between rows")
+    chars = rows[:, positions]
+    digits = chars - np.uint8(_ZERO)
+    is_digit = digits < 10
+    # only digits, separators, minus signs, and the known decimal points are allowed
+    n_other = np.count_nonzero(~is_digit & (chars != _SPACE) & (chars != _MINUS)) - dot_cols.size * rows.shape[0]
+    if n_other:
+        raise _LayoutError("non-numeric characters")
+    np.multiply(digits, is_digit, out=digits)
+    values = digits.astype(np.float64) @ weights / scales
+    # flip the sign of columns with a minus in front of the digits
+    is_minus = chars == _MINUS
+    has_minus = is_minus.any(axis=0)
+    for j, (start, end) in enumerate(spans):
+        if has_minus[start:end].any():
+            values[is_minus[:, start:end].any(axis=1), j] *= -1.
+    return values
+
+
+def _iter_row_blocks(vna_file_name, col_indices, block_rows):
+    """Memory-map a vna file and yield its layout, the column weights, and (rows, line length) uint8 blocks."""
+    raw = np.memmap(vna_file_name, dtype=np.uint8, mode="r")
+    newline = np.flatnonzero(raw[:4096] == ord("\n"))
+    if newline.size == 0:
+        raise _LayoutError("no line break found")
+    line_length = newline[0] + 1
+    layout = _get_layout(raw[:line_length].tobytes())
+    weights = _get_weights(*layout, col_indices)
+    n_rows = raw.size // line_length
+    rows = raw[:n_rows * line_length].reshape(n_rows, line_length)
+    tail = raw[n_rows * line_length:]
+    last_row = None
+    if tail.tobytes().strip():
+        # last line without line break
+        last_row = np.full((1, line_length), _SPACE, dtype=np.uint8)
+        last_row[0, :tail.size] = tail
+        last_row[0, -1] = ord("\n")
+    for start in range(0, n_rows, block_rows):
+        block = np.asarray(rows[start:start + block_rows])
+        if not (block[:, -1] == ord("\n")).all():
+            raise _LayoutError("lines differ in length")
+        yield layout, weights, block
+    if last_row is not None:
+        yield layout, weights, last_row
+
+
+def iter_vna_blocks(vna_file_name, columns=None, dtype=np.float64, block_rows=BLOCK_ROWS, min_snr=None, min_corr=None,
+                    rejected=None):
+    """Read a vna file block by block without loading the complete file into memory.
+
+    Args:
+        vna_file_name (str): name of a vna file, such as __8_16.5_6_T3.vna
+        columns (list): names of columns to read (default: all data columns, i.e., VNA_COLUMNS without skip1 and skip2)
+        dtype (np.dtype): float type of the returned arrays (np.float64 or np.float32)
+        block_rows (int): maximum number of rows per block
+        min_snr (float): replace velocities of samples with a lower beam SNR with NaN (default: None; see
+            filter_quality)
+        min_corr (float): replace velocities of samples with a lower beam correlation with NaN (default: None)
+        rejected (dict): counts of rejected samples per velocity column that are incremented (default: None)
+
+    Yields:
+        dict: keys correspond to column names and values to np.arrays of one block
+    """
+    columns = _get_column_indices(columns)[0]
+    # quality columns are decoded with the requested columns
+    read_columns, col_indices = _get_column_indices(get_quality_columns(columns, min_snr, min_corr))
+    rows_done = 0
+    try:
+        for layout, weights, block in _iter_row_blocks(vna_file_name, col_indices, block_rows):
+            decoded = _decode_block(block, layout, weights)
+            rows_done += block.shape[0]
+            data = {col: decoded[:, j] for j, col in enumerate(read_columns)}
+            filter_quality(data, min_snr, min_corr, rejected)
+            yield {col: np.ascontiguousarray(data[col], dtype=dtype) for col in columns}
+        return
+    except _LayoutError as e:
+        logging.info("{0} has no fixed-width layout ({1}) - reading with pandas".format(vna_file_name, e))
+    import pandas as pd
+    for chunk in pd.read_csv(vna_file_name, sep=r"\s+", header=None, usecols=col_indices, skiprows=rows_done,
+                             dtype={i: np.float64 for i in col_indices}, chunksize=block_rows):
+        data = {col: chunk[i].to_numpy() for col, i in zip(read_columns, col_indices)}
+        filter_quality(data, min_snr, min_corr, rejected)
+        yield {col: np.ascontiguousarray(data[col], dtype=dtype) for col in columns}
+
+
+def parse_vna(vna_file_name, columns=None, dtype=np.float64, min_snr=None, min_corr=None, rejected=None):
+    """Read a vna file into contiguous NumPy arrays.
+
+    Args:
+        vna_file_name (str): name of a vna file, such as __8_16.5_6_T3.vna
+        columns (list): names of columns to read (default: all data columns, i.e., VNA_COLUMNS without skip1 and skip2)
+        dtype (np.dtype): float type of the returned arrays (np.float64 or np.float32)
+        min_snr (float): replace velocities of samples with a lower beam SNR with NaN (default: None; see
+            filter_quality)
+        min_corr (float): replace velocities of samples with a lower beam correlation with NaN (default: None)
+        rejected (dict): counts of rejected samples per velocity column that are incremented (default: None)
+
+    Returns:
+        dict: keys correspond to column names and values to np.arrays
+    """
+    columns = _get_column_indices(columns)[0]
+    blocks = list(iter_vna_blocks(vna_file_name, columns=columns, dtype=dtype, min_snr=min_snr, min_corr=min_corr,
+                                  rejected=rejected))
+    if len(blocks) == 1:
+        return blocks[0]
+    return {col: np.concatenate([b[col] for b in blocks]) if blocks else np.empty(0, dtype=dtype)
+            for col in columns}
+
+
+def parse_vna_rows(vna_file_name, offset=0, columns=None, dtype=np.float64, max_bytes=None):
+    """Parse the complete lines of a (growing) vna file behind a byte offset, e.g., to follow an ongoing acquisition.
+    An incomplete last line is left for the next call.
+
+    Args:
+        vna_file_name (str): name of a vna file, such as __8_16.5_6_T3.vna
+        offset (int): byte position of the first line to parse (0 or the offset returned by the previous call)
+        columns (list): names of columns to read (default: all data columns, i.e., VNA_COLUMNS without skip1 and skip2)
+        dtype (np.dtype): float type of the returned arrays (np.float64 or np.float32)
+        max_bytes (int): maximum number of bytes to read (default: None reads up to the end of the file)
+
+    Returns:
+        tuple (dict, int): columns of the parsed rows (empty arrays if no line was completed) and the offset behind
+        the last parsed line
+    """
+    columns, col_indices = _get_column_indices(columns)
+    with open(vna_file_name, "rb") as f:
+        first_line = f.readline()
+        f.seek(offset)
+        chunk = f.read(-1 if max_bytes is None else max_bytes)
+    end = chunk.rfind(b"\n") + 1
+    if end == 0:
+        return {col: np.empty(0, dtype=dtype) for col in columns}, offset
+    try:
+        layout = _get_layout(first_line)
+        line_length = len(first_line)
+        if end % line_length:
+            raise _LayoutError("lines differ in length")
+        rows = np.frombuffer(chunk, dtype=np.uint8, count=end).reshape(-1, line_length)
+        if not (rows[:, -1] == ord("\n")).all():
+            raise _LayoutError("lines differ in length")
+        weights = _get_weights(*layout, col_indices)
+        decoded = np.concatenate([_decode_block(rows[start:start + BLOCK_ROWS], layout, weights)
+                                  for start in range(0, rows.shape[0], BLOCK_ROWS)])
+        data = {col: np.ascontiguousarray(decoded[:, j], dtype=dtype) for j, col in enumerate(columns)}
+    except _LayoutError:
+        import pandas as pd
+        table = pd.read_csv(io.BytesIO(chunk[:end]), sep=r"\s+", header=None, usecols=col_indices,
+                            dtype={i: np.float64 for i in col_indices})
+        data = {col: table[i].to_numpy(dtype=dtype) for col, i in zip(columns, col_indices)}
+    return data, offset + end
@@ -0,0 +1,291 @@
+"""Reader for binary Nortek Vectrino files (*.vno)
+
+Note:
+    A vno file is a sequence of Nortek binary records that start with a sync byte (0xA5) and an identifier byte. The
+    configuration records (hardware, head, user) and the velocity header hold their size (in 2-byte words) in bytes
+    2-3, while Vectrino velocity data records have a fixed size of 22 bytes. All records end with a checksum.
+    Runs of consecutive velocity data records are mapped with numpy.memmap and a structured dtype (no copies); only
+    the scaling to physical units creates new arrays.
+"""
+import numpy as np
+import logging
+from vna_reader import BLOCK_ROWS, get_quality_columns, filter_quality
+
+
+SYNC = 0xA5
+CHECKSUM_SEED = 0xB58C
+HARDWARE_CONFIG_ID = 0x05
+HEAD_CONFIG_ID = 0x04
+USER_CONFIG_ID = 0x00
+VELOCITY_HEADER_ID = 0x50
+VELOCITY_DATA_ID = 0x51
+
+HARDWARE_CONFIG_DTYPE = np.dtype([
+    ("sync", "u1"), ("id", "u1"), ("size", "<u2"), ("serial no.", "S14"), ("config", "<u2"),
+    ("frequency (kHz)", "<u2"), ("PIC version", "<u2"), ("HW revision", "<u2"), ("rec size", "<u2"),
+    ("status", "<u2"), ("spare", "u1", (12,)), ("FW version", "S4"), ("checksum", "<u2"),
+])
+HEAD_CONFIG_DTYPE = np.dtype([
+    ("sync", "u1"), ("id", "u1"), ("size", "<u2"), ("config", "<u2"), ("frequency (kHz)", "<u2"), ("type", "<u2"),
+    ("serial no.", "S12"), ("system", "u1", (176,)), ("spare", "u1", (22,)), ("beams", "<u2"), ("checksum", "<u2"),
+])
+USER_CONFIG_DTYPE = np.dtype([
+    ("sync", "u1"), ("id", "u1"), ("size", "<u2"), ("T1", "<u2"), ("T2", "<u2"), ("T3", "<u2"), ("T4", "<u2"),
+    ("T5", "<u2"), ("pings", "<u2"), ("average interval", "<u2"), ("beams", "<u2"), ("timing control", "<u2"),
+    ("power control", "<u2"), ("A1", "<u2"), ("B0", "<u2"), ("B1", "<u2"), ("compass update rate", "<u2"),
+    ("coordinate system", "<u2"), ("bins", "<u2"), ("bin length", "<u2"), ("measurement interval", "<u2"),
+    ("other", "u1", (374,)), ("sampling rate (Hz)", "<u2"), ("spare", "u1", (94,)), ("checksum", "<u2"),
+])
+VELOCITY_HEADER_DTYPE = np.dtype([
+    ("sync", "u1"), ("id", "u1"), ("size", "<u2"), ("distance", "<u2"), ("distance quality", "<u2"),
+    ("lag1", "<u2"), ("lag2", "<u2"), ("noise", "u1", (4,)), ("correlation", "u1", (4,)),
+    ("temperature", "<i2"), ("sound speed", "<u2"), ("spare", "u1", (16,)), ("checksum", "<u2"),
+])
+VELOCITY_DATA_DTYPE = np.dtype([
+    ("sync", "u1"), ("id", "u1"), ("status", "u1"), ("count", "u1"), ("velocity", "<i2", (4,)),
+    ("amplitude", "u1", (4,)), ("correlation", "u1", (4,)), ("checksum", "<u2"),
+])
+
+COORDINATE_SYSTEMS = {0: "ENU", 1: "XYZ", 2: "BEAM"}
+# bit of the velocity data status byte that switches the velocity scaling from 1 mm/s to 0.1 mm/s
+VELOCITY_SCALING_BIT = 0x20
+
+BEAMS = ["x", "y", "z1", "z2"]
+VELOCITY_COLUMNS = ["u (m/s)", "v (m/s)", "w1 (m/s)", "w2 (m/s)"]
+
+
+def _checksum_ok(words):
+    """Verify Nortek checksums of records given as (records, words) uint16 array (last word is the checksum)."""
+    return ((CHECKSUM_SEED + words[:, :-1].sum(axis=1, dtype=np.uint32)) & 0xFFFF) == words[:, -1]
+
+
+def _get_text(field):
+    return field.item().decode("ascii", "ignore").strip("\x00 ")
+
+
+def _record_size(raw, pos):
+    """Return the size in bytes of the (non-velocity data) record at pos, or 0 if it is invalid."""
+    if pos + 4 > raw.size:
+        return 0
+    size = 2 * int(raw[pos + 2:pos + 4].view("<u2")[0])
+    if size < 6 or pos + size > raw.size:
+        return 0
+    words = np.frombuffer(raw[pos:pos + size].tobytes(), dtype="<u2").reshape(1, -1)
+    return size if _checksum_ok(words)[0] else 0
+
+
+def _is_record(raw, pos):
+    if raw[pos] != SYNC or pos + 1 >= raw.size:
+        return False
+    if raw[pos + 1] == VELOCITY_DATA_ID:
+        if pos + VELOCITY_DATA_DTYPE.itemsize > raw.size:
+            return False
+        words = np.frombuffer(raw[pos:pos + VELOCITY_DATA_DTYPE.itemsize].tobytes(), dtype="<u2").reshape(1, -1)
+        return bool(_checksum_ok(words)[0])
+    return _record_size(raw, pos) > 0
+
+
+def _resync(raw, pos):
+    """Find the next valid record start after a corrupted or truncated record."""
+    while pos < raw.size:
+        candidates = np.flatnonzero(raw[pos:pos + 65536] == SYNC) + pos
+        for candidate in candidates:
+            if _is_record(raw, candidate):
+                return int(candidate)
+        pos += 65536
+    return raw.size
+
+
+def map_vno_records(vno_file_name):
+    """Memory-map a vno file and locate its configuration records and runs of velocity data records.
+
+    Args:
+        vno_file_name (str): name of a vno file, such as __8_16.5_6_T3.vno
+
+    Returns:
+        tuple (dict, list): configuration records (structured np.array views keyed by record identifier) and list of
+        (velocity header, velocity data) tuples, where velocity data are zero-copy structured memmap views
+    """
+    raw = np.memmap(vno_file_name, dtype=np.uint8, mode="r")
+    dtypes = {HARDWARE_CONFIG_ID: HARDWARE_CONFIG_DTYPE, HEAD_CONFIG_ID: HEAD_CONFIG_DTYPE,
+              USER_CONFIG_ID: USER_CONFIG_DTYPE, VELOCITY_HEADER_ID: VELOCITY_HEADER_DTYPE}
+    config = {}
+    data_runs = []
+    velocity_header = None
+    n_skipped = 0
+    pos = 0
+    while pos < raw.size:
+        if raw[pos] == SYNC and pos + 1 < raw.size and raw[pos + 1] == VELOCITY_DATA_ID:
+            # map all following 22-byte records and stop at the first one that is not a velocity data record
+            n_max = (raw.size - pos) // VELOCITY_DATA_DTYPE.itemsize
+            records = np.memmap(vno_file_name, dtype=VELOCITY_DATA_DTYPE, mode="r", offset=pos, shape=(n_max,))
+            is_data = (records["sync"] == SYNC) & (records["id"] == VELOCITY_DATA_ID)
+            n_run = int(np.argmin(is_data)) if not is_data.all() else n_max
+            if n_run:
+                words = np.ndarray(shape=(n_run, VELOCITY_DATA_DTYPE.itemsize // 2), dtype="<u2",
+                                   buffer=raw, offset=pos)
+                valid = _checksum_ok(words)
+                run = records[:n_run] if valid.all() else records[:n_run][valid]
+                n_skipped += n_run - run.size
+                data_runs.append((velocity_header, run))
+                pos += n_run * VELOCITY_DATA_DTYPE.itemsize
+                continue
+        size = _record_size(raw, pos) if raw[pos] == SYNC else 0
+        if size:
+            record_id = int(raw[pos + 1])
+            if record_id in dtypes and size == dtypes[record_id].itemsize:
+                record = np.ndarray(shape=(), dtype=dtypes[record_id], buffer=raw, offset=pos)
+                if record_id == VELOCITY_HEADER_ID:
+                    velocity_header = record
+                else:
+                    config[record_id] = record
+            pos += size
+        else:
+            new_pos = _resync(raw, pos + 1)
+            logging.info("{0}: skipped {1} corrupted bytes at offset {2}".format(vno_file_name, new_pos - pos, pos))
+            n_skipped += 1
+            pos = new_pos
+    if n_skipped:
+        logging.warning("WARNING: {0} corrupted or truncated records in {1}".format(n_skipped, vno_file_name))
+    return config, data_runs
+
+
+def read_vno_header(vno_file_name):
+    """Decode the configuration of a vno file.
+
+    Args:
+        vno_file_name (str): name of a vno file, such as __8_16.5_6_T3.vno
+
+    Returns:
+        dict: probe configuration, sampling rate, and velocity scaling
+    """
+    config, data_runs = map_vno_records(vno_file_name)
+    header = {}
+    if HARDWARE_CONFIG_ID in config:
+        hardware = config[HARDWARE_CONFIG_ID]
+        header.update({
+            "probe serial no.": _get_text(hardware["serial no."]),
+            "firmware version": _get_text(hardware["FW version"]),
+            "acoustic frequency (kHz)": int(hardware["frequency (kHz)"]),
+        })
+    if HEAD_CONFIG_ID in config:
+        head = config[HEAD_CONFIG_ID]
+        header.update({
+            "head serial no.": _get_text(head["serial no."]),
+            "beams": int(head["beams"]),
+        })
+    if USER_CONFIG_ID in config:
+        user = config[USER_CONFIG_ID]
+        header.update({
+            "sampling rate (Hz)": float(user["sampling rate (Hz)"]),
+            "coordinate system": COORDINATE_SYSTEMS.get(int(user["coordinate system"]), "unknown"),
+        })
+    if data_runs:
+        header.update(_get_run_header(*data_runs[0]))
+    header["samples"] = sum(records.size for _, records in data_runs)
+    return header
+
+
+def _get_run_header(velocity_header, records):
+    """Velocity scaling, noise levels, temperature, and sound speed of a run of velocity data records."""
+    run_header = {"velocity resolution (m/s)": 1e-4 if records.size and records["status"][0] & VELOCITY_SCALING_BIT
+                  else 1e-3}
+    if velocity_header is not None:
+        run_header.update({
+            "noise amplitude (counts)": velocity_header["noise"].tolist(),
+            "temperature (deg C)": float(velocity_header["temperature"]) / 100.,
+            "sound speed (m/s)": float(velocity_header["sound speed"]) / 10.,
+        })
+    return run_header
+
+
+def _get_column_names(columns):
+    names = ["time (s)", "sample no."] + VELOCITY_COLUMNS + ["ampl. %s (dB)" % b for b in BEAMS] + [
+        "SNR %s" % b for b in BEAMS] + ["corr %s" % b for b in BEAMS]
+    if columns is None:
+        return names
+    unknown = [c for c in columns if c not in names]
+    if unknown:
+        raise ValueError("Unknown vno column(s): {0} (available: {1})".format(unknown, names))
+    return list(columns)
+
+
+def iter_vno_blocks(vno_file_name, columns=None, dtype=np.float64, block_rows=BLOCK_ROWS, min_snr=None, min_corr=None,
+                    rejected=None):
+    """Read a vno file block by block without converting the complete file at once.
+
+    Note:
+        The velocity data records only hold an 8-bit ensemble counter. The sample numbers (and times) are therefore
+        counted from the counter of the first record and not from the start of the acquisition like in vna exports.
+        Signal-to-noise ratios are derived from beam amplitudes and the noise level of the velocity header.
+
+    Args:
+        vno_file_name (str): name of a vno file, such as __8_16.5_6_T3.vno
+        columns (list): names of columns to read (default: all columns that vna_reader.parse_vna returns)
+        dtype (np.dtype): float type of the returned arrays (np.float64 or np.float32)
+        block_rows (int): maximum number of rows per block
+        min_snr (float): replace velocities of samples with a lower beam SNR with NaN (default: None; see
+            vna_reader.filter_quality)
+        min_corr (float): replace velocities of samples with a lower beam correlation with NaN (default: None)
+        rejected (dict): counts of rejected samples per velocity column that are incremented (default: None)
+
+    Yields:
+        dict: keys correspond to column names and values to np.arrays of one block
+    """
+    columns = _get_column_names(columns)
+    read_columns = get_quality_columns(columns, min_snr, min_corr)
+    config, data_runs = map_vno_records(vno_file_name)
+    freq = float(config[USER_CONFIG_ID]["sampling rate (Hz)"]) if USER_CONFIG_ID in config else 200.
+    last_count = None
+    sample_no = 0
+    for velocity_header, run_records in data_runs:
+        for block_start in range(0, run_records.size, block_rows):
+            records = run_records[block_start:block_start + block_rows]
+            counts = records["count"].astype(np.int64)
+            # unwrap the 8-bit counter (dropped records show up as steps > 1)
+            steps = np.diff(counts, prepend=counts[0] if last_count is None else last_count) % 256
+            if last_count is None:
+                sample_no = counts[0]
+            samples = sample_no + np.cumsum(steps)
+            sample_no, last_count = samples[-1], counts[-1]
+            scale = np.where(records["status"] & VELOCITY_SCALING_BIT, 1e-4, 1e-3)
+            block = {}
+            for i, beam in enumerate(BEAMS):
+                if VELOCITY_COLUMNS[i] in read_columns:
+                    block[VELOCITY_COLUMNS[i]] = records["velocity"][:, i] * scale
+                if "ampl. %s (dB)" % beam in read_columns:
+                    block["ampl. %s (dB)" % beam] = records["amplitude"][:, i]
+                if "corr %s" % beam in read_columns:
+                    block["corr %s" % beam] = records["correlation"][:, i]
+                if "SNR %s" % beam in read_columns:
+                    noise = float(velocity_header["noise"][i]) if velocity_header is not None else 0.
+                    with np.errstate(divide="ignore"):
+                        block["SNR %s" % beam] = 20. * np.log10(
+                            records["amplitude"][:, i] / noise) if noise > 0 else np.full(records.size, np.nan)
+            block["sample no."] = samples
+            block["time (s)"] = samples / freq
+            filter_quality(block, min_snr, min_corr, rejected)
+            yield {col: np.ascontiguousarray(block[col], dtype=dtype) for col in columns}
+
+
+def read_vno(vno_file_name, columns=None, dtype=np.float64, min_snr=None, min_corr=None, rejected=None):
+    """Read a vno file into NumPy arrays with the same column names as vna_reader.parse_vna (see iter_vno_blocks).
+
+    Args:
+        vno_file_name (str): name of a vno file, such as __8_16.5_6_T3.vno
+        columns (list): names of columns to read (default: all columns that vna_reader.parse_vna returns)
+        dtype (np.dtype): float type of the returned arrays (np.float64 or np.float32)
+        min_snr (float): replace velocities of samples with a lower beam SNR with NaN (default: None)
+        min_corr (float): replace velocities of samples with a lower beam correlation with NaN (default: None)
+        rejected (dict): counts of rejected samples per velocity column that are incremented (default: None)
+
+    Returns:
+        dict: keys correspond to column names and values to np.arrays
+    """
+    columns = _get_column_names(columns)
+    blocks = list(iter_vno_blocks(vno_file_name, columns=columns, dtype=dtype, min_snr=min_snr, min_corr=min_corr,
+                                  rejected=rejected))
+    if len(blocks) == 1:
+        return blocks[0]
+    return {col: np.concatenate([b[col] for b in blocks]) if blocks else np.empty(0, dtype=dtype)
+            for col in columns}